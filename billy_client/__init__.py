@@ -2,22 +2,58 @@ from .api import BillyAPI
 from .api import BillyError
 from .api import NotFoundError
 from .api import DuplicateExternalIDError
+from .api import CircuitOpenError
+from .api import BatchResult
+from .api import RequestInfo
+from .api import CustomerGraph
 from .api import Company
 from .api import Customer
 from .api import Plan
 from .api import Subscription
 from .api import Invoice
 from .api import Transaction
+from .api import AdaptivePageSize
+from .api import RetryPolicy
+from .api import CircuitBreaker
+from .api import RateLimiter
+from .api import ConcurrencyController
+from .async_api import AsyncBillyAPI
+from .cache import ResourceCache
+from .store import RecordStore
+from .mirror import Mirror
+from .export import ExportStats
+from .export import export_page
+from .aggregate import Aggregation
+from .aggregate import AggregateResult
+from .metrics import MetricsRegistry
 
 __all__ = [
     BillyAPI,
     BillyError,
     NotFoundError,
     DuplicateExternalIDError,
+    CircuitOpenError,
+    BatchResult,
+    RequestInfo,
+    CustomerGraph,
     Company,
     Customer,
     Plan,
     Subscription,
     Invoice,
     Transaction,
+    AdaptivePageSize,
+    RetryPolicy,
+    CircuitBreaker,
+    RateLimiter,
+    ConcurrencyController,
+    AsyncBillyAPI,
+    ResourceCache,
+    RecordStore,
+    Mirror,
+    ExportStats,
+    export_page,
+    Aggregation,
+    AggregateResult,
+    MetricsRegistry,
 ]
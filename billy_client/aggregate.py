@@ -0,0 +1,245 @@
+from __future__ import unicode_literals
+import datetime
+import decimal
+
+from concurrent import futures
+
+from .api import Page
+from .api import decode_datetime
+from .api import decode_decimal
+
+
+def bucket_datetime(value, unit):
+    """Truncate a datetime (or an ISO 8601 string from the server) to the
+    beginning of its hour, or the date of its day, week (Monday), month or
+    year, None will be returned if it's not a datetime
+
+    """
+    value = decode_datetime(value)
+    if not isinstance(value, datetime.datetime):
+        return None
+    if unit == 'hour':
+        return value.replace(minute=0, second=0, microsecond=0)
+    date = value.date()
+    if unit == 'week':
+        return date - datetime.timedelta(days=date.weekday())
+    if unit == 'month':
+        return date.replace(day=1)
+    if unit == 'year':
+        return date.replace(month=1, day=1)
+    return date
+
+
+def _field_value(record, field):
+    if isinstance(record, dict):
+        return record.get(field)
+    return getattr(record, field, None)
+
+
+def _update_sum(state, value):
+    return state + decode_decimal(value)
+
+
+def _update_count(state, value):
+    return state + 1
+
+
+def _decode_comparable(value):
+    """Decode an amount sent as a string into a Decimal like sum does, so
+    that amounts are compared as numbers, other strings (such as guids and
+    datetimes) are kept as they are
+
+    """
+    try:
+        return decode_decimal(value)
+    except decimal.InvalidOperation:
+        return value
+
+
+def _update_min(state, value):
+    value = _decode_comparable(value)
+    if state is None or value < state:
+        return value
+    return state
+
+
+def _update_max(state, value):
+    value = _decode_comparable(value)
+    if state is None or value > state:
+        return value
+    return state
+
+
+def _merge_sum(state, other):
+    return state + other
+
+
+#: Initial state, update and merge functions of aggregate functions
+FUNCTIONS = dict(
+    sum=(0, _update_sum, _merge_sum),
+    count=(0, _update_count, _merge_sum),
+    min=(None, _update_min, _update_min),
+    max=(None, _update_max, _update_max),
+)
+
+
+class Aggregation(object):
+    """Aggregation of records grouped by keys in group_by, each key is a
+    field name, or a field name with a time bucket unit (`hour`, `day`,
+    `week`, `month` or `year`) like `created_at:day`. The metrics maps names
+    of output columns to tuples of aggregate function (`sum`, `count`, `min`
+    or `max`) and field name, the field of `count` could be None to count
+    records, otherwise records without the field are skipped
+
+    Records are aggregated in one pass with one state per group, so memory
+    usage only depends on the number of groups. Records could be resources,
+    JSON data (such as the ones from :class:`billy_client.mirror.Mirror`) or
+    a :class:`billy_client.api.Page`, which is aggregated from decoded pages
+    without making resources
+
+    """
+
+    #: Units of time buckets
+    BUCKET_UNITS = ('hour', 'day', 'week', 'month', 'year')
+
+    def __init__(self, group_by=(), metrics=None):
+        if metrics is None:
+            metrics = dict(count=('count', None))
+        self.group_by = []
+        for key in group_by:
+            field, _, unit = key.partition(':')
+            if unit and unit not in self.BUCKET_UNITS:
+                raise ValueError('Unknown time bucket unit {!r}'.format(unit))
+            self.group_by.append((key, field, unit or None))
+        self.metrics = []
+        for name, (function, field) in sorted(metrics.iteritems()):
+            if function not in FUNCTIONS:
+                raise ValueError(
+                    'Unknown aggregate function {!r}'.format(function)
+                )
+            if field is None and function != 'count':
+                raise ValueError('Field is required for {}'.format(function))
+            self.metrics.append((name, function, field))
+
+    def result(self):
+        """Create an empty :class:`AggregateResult` of this aggregation
+
+        """
+        return AggregateResult(self)
+
+    def run(self, records):
+        """Aggregate records and return the :class:`AggregateResult`
+
+        """
+        result = self.result()
+        result.add_all(records)
+        return result
+
+    def run_all(self, sources, max_workers=4):
+        """Aggregate multiple sources of records (such as pages of different
+        customers) concurrently, and return the merged
+        :class:`AggregateResult`. If any source fails, sources not started yet
+        are canceled, and the running ones are waited for before raising
+
+        """
+        result = self.result()
+        executor = futures.ThreadPoolExecutor(max_workers=max_workers)
+        pending = []
+        try:
+            pending = [executor.submit(self.run, source) for source in sources]
+            for future in pending:
+                result.merge(future.result())
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+        return result
+
+
+class AggregateResult(object):
+    """Partial or final result of an :class:`Aggregation`, results of the
+    same aggregation over different records can be merged
+
+    """
+
+    def __init__(self, aggregation):
+        self.aggregation = aggregation
+        #: map of tuples of group key values to lists of metric states
+        self.groups = {}
+        self._functions = [
+            (field, FUNCTIONS[function])
+            for _, function, field in aggregation.metrics
+        ]
+
+    def __len__(self):
+        return len(self.groups)
+
+    def _initial_states(self):
+        return [initial for _, (initial, _, _) in self._functions]
+
+    def add(self, record):
+        """Add a record into its group
+
+        """
+        key = tuple(
+            _field_value(record, field) if unit is None else
+            bucket_datetime(_field_value(record, field), unit)
+            for _, field, unit in self.aggregation.group_by
+        )
+        states = self.groups.get(key)
+        if states is None:
+            states = self.groups[key] = self._initial_states()
+        for i, (field, (_, update, _)) in enumerate(self._functions):
+            if field is None:
+                value = True
+            else:
+                value = _field_value(record, field)
+                if value is None:
+                    continue
+            states[i] = update(states[i], value)
+
+    def add_all(self, records):
+        """Add all records, records of a :class:`billy_client.api.Page` are
+        added from decoded pages directly
+
+        """
+        if isinstance(records, Page):
+            for json_data in records.iter_pages():
+                for item in json_data['items']:
+                    self.add(item)
+            return
+        for record in records:
+            self.add(record)
+
+    def merge(self, other):
+        """Merge another result of the same aggregation into this one
+
+        """
+        for key, other_states in other.groups.iteritems():
+            states = self.groups.get(key)
+            if states is None:
+                self.groups[key] = list(other_states)
+                continue
+            for i, (_, (_, _, merge)) in enumerate(self._functions):
+                if other_states[i] is not None:
+                    states[i] = merge(states[i], other_states[i])
+        return self
+
+    def rows(self):
+        """Get a list of dicts of group keys and metrics ordered by group keys
+
+        """
+        aggregation = self.aggregation
+        rows = []
+        # dates can't be compared with None, so missing values go first
+        for key in sorted(
+            self.groups,
+            key=lambda key: [(value is not None, value) for value in key],
+        ):
+            row = dict(zip((name for name, _, _ in aggregation.group_by), key))
+            row.update(zip(
+                (name for name, _, _ in aggregation.metrics),
+                self.groups[key],
+            ))
+            rows.append(row)
+        return rows
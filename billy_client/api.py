@@ -1,9 +1,22 @@
 from __future__ import unicode_literals
+import array
+import calendar
+import collections
+import copy
+import datetime
+import decimal
 import logging
+import random
+import threading
+import time
 import urlparse
 import urllib
+import uuid
 
 import requests
+from concurrent import futures
+
+from .streaming import iter_page_items
 
 
 class BillyError(RuntimeError):
@@ -24,15 +37,667 @@ class DuplicateExternalIDError(BillyError):
     """
 
 
+class CircuitOpenError(BillyError):
+    """Request is rejected without sending because the circuit of its
+    operation is open
+
+    """
+
+
+class BatchResult(
+    collections.namedtuple('BatchResult', ['request', 'value', 'error'])
+):
+    """Result of one operation in a batch, request is the input of the
+    operation, value is the returned value, and error is the BillyError or
+    the transport error (such as a connection error) raised by the operation
+    if it failed (value will be None in that case)
+
+    """
+
+
+class RequestInfo(object):
+    """Information of one attempt of a request passed to request hooks of
+    :class:`BillyAPI`, the same object is passed to the before hooks and then
+    the after or error hooks of the attempt, hooks could keep their state
+    (such as a tracing span) in context
+
+    """
+
+    def __init__(self, operation, method, url, url_template, retries, trace_id):
+        #: name of the operation, such as `invoice` or `list_invoices`
+        self.operation = operation
+        self.method = method
+        self.url = url
+        #: URL path with the guid as a placeholder, such as
+        #: `/v1/invoices/{guid}/refund`
+        self.url_template = url_template
+        #: number of attempts before this one
+        self.retries = retries
+        #: value of the trace header, it's the same for all attempts of a
+        #: request, before hooks could replace it for this attempt only
+        self.trace_id = trace_id
+        self.started_at = None
+        #: seconds from sending the request to receiving the response
+        self.elapsed = None
+        self.status_code = None
+        #: length of the response body, 0 if it's unknown
+        self.response_size = None
+        #: error raised by the attempt
+        self.error = None
+        self.context = {}
+
+
+class RetryPolicy(object):
+    """Policy of retrying failed requests with exponential backoff and full
+    jitter. GET requests are always retried, other requests are only retried
+    if they carry an external_id, so that the server can tell a retry from a
+    new request
+
+    """
+
+    #: Default status codes to retry
+    DEFAULT_STATUS_CODES = (
+        requests.codes.bad_gateway,
+        requests.codes.service_unavailable,
+        requests.codes.gateway_timeout,
+    )
+    #: Default exceptions to retry
+    DEFAULT_EXCEPTIONS = (
+        requests.ConnectionError,
+        requests.Timeout,
+    )
+
+    def __init__(
+        self,
+        max_attempts=3,
+        backoff_factor=0.5,
+        max_backoff=30,
+        status_codes=DEFAULT_STATUS_CODES,
+        exceptions=DEFAULT_EXCEPTIONS,
+        sleep=time.sleep,
+    ):
+        self.max_attempts = max_attempts
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.status_codes = frozenset(status_codes)
+        self.exceptions = tuple(exceptions)
+        self.sleep = sleep
+
+    def is_idempotent(self, method, data=None):
+        """Determine whether a request can be sent again safely
+
+        """
+        if method == 'GET':
+            return True
+        return bool(data and data.get('external_id'))
+
+    def backoff(self, attempt):
+        """Sleep before the next attempt after given number of attempts
+
+        """
+        delay = min(self.max_backoff, self.backoff_factor * 2 ** (attempt - 1))
+        self.sleep(random.uniform(0, delay))
+
+
+class CircuitBreaker(object):
+    """Circuit breaker tracks failure rate of each operation, once it reaches
+    failure_rate (with at least min_requests requests in the current window of
+    window seconds), the circuit opens and requests fail fast with
+    :class:`CircuitOpenError`. After reset_timeout seconds, the circuit becomes
+    half-open, and up to half_open_requests trial requests are allowed, it
+    closes if they succeed, otherwise it opens again
+
+    Connection errors, timeouts and 5xx responses are counted as failures
+
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(
+        self,
+        failure_rate=0.5,
+        min_requests=10,
+        window=60,
+        reset_timeout=30,
+        half_open_requests=1,
+        clock=time.time,
+    ):
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.half_open_requests = half_open_requests
+        self.clock = clock
+        self._circuits = {}
+        self._lock = threading.Lock()
+
+    def _circuit(self, key):
+        circuit = self._circuits.get(key)
+        if circuit is None:
+            circuit = dict(
+                state=self.CLOSED,
+                window_begin=self.clock(),
+                requests=0,
+                failures=0,
+                opened_at=None,
+                trials=0,
+            )
+            self._circuits[key] = circuit
+        return circuit
+
+    def _close(self, circuit):
+        circuit.update(
+            state=self.CLOSED,
+            window_begin=self.clock(),
+            requests=0,
+            failures=0,
+            opened_at=None,
+        )
+
+    def _open(self, circuit):
+        circuit.update(state=self.OPEN, opened_at=self.clock())
+
+    def state(self, key):
+        """Get state of the circuit of given key
+
+        """
+        with self._lock:
+            return self._circuit(key)['state']
+
+    def before_request(self, key):
+        """Check the circuit before sending a request, CircuitOpenError will
+        be raised if the request is not allowed
+
+        """
+        with self._lock:
+            circuit = self._circuit(key)
+            if circuit['state'] == self.OPEN:
+                if self.clock() - circuit['opened_at'] < self.reset_timeout:
+                    raise CircuitOpenError(
+                        'Circuit of {} is open'.format(key),
+                    )
+                circuit.update(state=self.HALF_OPEN, trials=0)
+            if circuit['state'] == self.HALF_OPEN:
+                if circuit['trials'] >= self.half_open_requests:
+                    raise CircuitOpenError(
+                        'Circuit of {} is half-open, waiting for trial '
+                        'requests'.format(key),
+                    )
+                circuit['trials'] += 1
+
+    def after_request(self, key, success):
+        """Record the outcome of a request
+
+        """
+        with self._lock:
+            circuit = self._circuit(key)
+            if circuit['state'] == self.HALF_OPEN:
+                if success:
+                    self._close(circuit)
+                else:
+                    self._open(circuit)
+                return
+            if circuit['state'] == self.OPEN:
+                return
+            if self.clock() - circuit['window_begin'] >= self.window:
+                circuit.update(window_begin=self.clock(), requests=0, failures=0)
+            circuit['requests'] += 1
+            if not success:
+                circuit['failures'] += 1
+            if (
+                circuit['requests'] >= self.min_requests and
+                circuit['failures'] >= self.failure_rate * circuit['requests']
+            ):
+                self._open(circuit)
+
+
+class TokenBucket(object):
+    """Thread-safe token bucket refilled at rate tokens per second up to
+    capacity tokens
+
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.time, sleep=time.sleep):
+        if capacity is None:
+            capacity = max(1, rate)
+        self.rate = float(rate)
+        self.capacity = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = float(capacity)
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token and return the seconds to wait before it's available
+
+        """
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(
+                self.capacity,
+                self._tokens + (now - self._updated_at) * self.rate,
+            )
+            self._updated_at = now
+            # the token is taken anyway, so that concurrent callers queue up
+            # behind each other instead of competing for the same token
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0
+            return -self._tokens / self.rate
+
+    def acquire(self):
+        """Block until a token is available
+
+        """
+        delay = self.reserve()
+        if delay > 0:
+            self.sleep(delay)
+
+
+class RateLimiter(object):
+    """Client-side rate limiter with a global budget of rate requests per
+    second, and optional budgets of operations in operation_rates, which maps
+    an operation name (such as `invoice` or `subscribe`) to requests per
+    second, the special name `list` applies to all page fetches. A request
+    has to acquire tokens from the global budget and from the budget of its
+    operation. One limiter can be shared by multiple API objects (including
+    the ones of :class:`billy_client.async_api.AsyncBillyAPI`) in different
+    threads to keep their aggregate rate under the limit
+
+    """
+
+    def __init__(
+        self,
+        rate=None,
+        burst=None,
+        operation_rates=None,
+        clock=time.time,
+        sleep=time.sleep,
+    ):
+        self.bucket = None
+        if rate is not None:
+            self.bucket = TokenBucket(rate, burst, clock=clock, sleep=sleep)
+        self.operation_buckets = dict(
+            (name, TokenBucket(operation_rate, clock=clock, sleep=sleep))
+            for name, operation_rate in (operation_rates or {}).iteritems()
+        )
+
+    def _operation_bucket(self, method_name):
+        bucket = self.operation_buckets.get(method_name)
+        if bucket is None and method_name.startswith('list_'):
+            bucket = self.operation_buckets.get('list')
+        return bucket
+
+    def acquire(self, method_name):
+        """Block until a request of given operation is allowed to be sent
+
+        """
+        operation_bucket = self._operation_bucket(method_name)
+        if operation_bucket is not None:
+            operation_bucket.acquire()
+        if self.bucket is not None:
+            self.bucket.acquire()
+
+
+class ConcurrencyController(object):
+    """AIMD (additive increase, multiplicative decrease) controller of the
+    number of requests in flight. The limit grows by increase per limit
+    healthy responses, and it's multiplied by decrease_factor when the server
+    responds with one of overload_status_codes, the request fails to be sent,
+    or the latency is more than latency_tolerance times of the smoothed
+    latency. Only one decrease happens for requests sent before the last
+    decrease, so that a burst of failures doesn't collapse the limit
+
+    """
+
+    #: Default status codes telling the server is overloaded
+    DEFAULT_OVERLOAD_STATUS_CODES = (
+        requests.codes.too_many_requests,
+        requests.codes.service_unavailable,
+    )
+
+    def __init__(
+        self,
+        initial_limit=4,
+        min_limit=1,
+        max_limit=64,
+        increase=1,
+        decrease_factor=0.5,
+        latency_tolerance=2.0,
+        overload_status_codes=DEFAULT_OVERLOAD_STATUS_CODES,
+        clock=time.time,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.overload_status_codes = frozenset(overload_status_codes)
+        self.clock = clock
+        self._limit = float(initial_limit)
+        self._in_flight = 0
+        self._smoothed_latency = None
+        self._decreased_at = None
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self):
+        """Current limit of requests in flight
+
+        """
+        return int(self._limit)
+
+    @property
+    def in_flight(self):
+        """Number of requests in flight
+
+        """
+        return self._in_flight
+
+    def acquire(self):
+        """Block until a request is allowed to be sent, return the time it's
+        sent for :meth:`release`
+
+        """
+        with self._condition:
+            while self._in_flight >= int(self._limit):
+                self._condition.wait()
+            self._in_flight += 1
+            return self.clock()
+
+    def release(self, started_at, status_code):
+        """Record the response of a request sent at started_at, status_code
+        is None if the request failed without a response
+
+        """
+        latency = self.clock() - started_at
+        with self._condition:
+            self._in_flight -= 1
+            spike = (
+                self._smoothed_latency is not None and
+                latency > self.latency_tolerance * self._smoothed_latency
+            )
+            if (
+                status_code is None or
+                status_code in self.overload_status_codes or
+                spike
+            ):
+                if self._decreased_at is None or started_at >= self._decreased_at:
+                    self._limit = max(
+                        self.min_limit,
+                        self._limit * self.decrease_factor,
+                    )
+                    self._decreased_at = self.clock()
+            elif status_code < 500:
+                if self._smoothed_latency is None:
+                    self._smoothed_latency = latency
+                else:
+                    self._smoothed_latency += 0.1 * (
+                        latency - self._smoothed_latency
+                    )
+                self._limit = min(
+                    self.max_limit,
+                    self._limit + float(self.increase) / int(self._limit),
+                )
+            self._condition.notify_all()
+
+
+def decode_datetime(value):
+    """Decode an ISO 8601 datetime string from the server, such as
+    `2013-10-02T05:48:26.210843`, into a naive UTC datetime
+
+    """
+    if not isinstance(value, basestring):
+        return value
+    text = value
+    if text.endswith('Z'):
+        text = text[:-1]
+    elif text.endswith('+00:00'):
+        text = text[:-6]
+    for fmt in ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S'):
+        try:
+            return datetime.datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+    return value
+
+
+def decode_decimal(value):
+    """Decode an amount sent as a string into a Decimal, numbers are kept as
+    they are
+
+    """
+    if isinstance(value, basestring):
+        return decimal.Decimal(value)
+    return value
+
+
+def _import_numpy():
+    """Import NumPy when it's needed, None if it's not available, so that
+    importing this module doesn't load it
+
+    """
+    try:
+        import numpy
+    except ImportError:  # pragma: no cover
+        return None
+    return numpy
+
+
+def datetime_to_epoch(value):
+    """Convert a datetime (or an ISO 8601 string from the server) into
+    integer seconds since epoch, 0 for None, ValueError is raised if the
+    string cannot be parsed
+
+    """
+    decoded = decode_datetime(value)
+    if decoded is None:
+        return 0
+    if not isinstance(decoded, datetime.datetime):
+        raise ValueError('Cannot parse datetime {!r}'.format(value))
+    return calendar.timegm(decoded.utctimetuple())
+
+
+def decimal_to_float(value):
+    """Convert an amount into float, NaN for None
+
+    """
+    if value is None:
+        return float('nan')
+    return float(decode_decimal(value))
+
+
+def project_fields(json_data, fields):
+    """Keep only given fields of JSON data of a record
+
+    """
+    return dict((key, json_data[key]) for key in fields if key in json_data)
+
+
+class Field(object):
+    """Declared field of a resource, the raw JSON value is kept in a slot of
+    the resource object, and it's decoded by decode function on first access
+
+    """
+
+    def __init__(self, name, decode=None):
+        self.name = name
+        self.decode = decode
+
+    @property
+    def slot(self):
+        if self.decode is None:
+            return self.name
+        return '_raw_' + self.name
+
+    def __get__(self, resource, owner):
+        if resource is None:
+            return self
+        decoded = resource._decoded
+        if decoded is not None and self.name in decoded:
+            return decoded[self.name]
+        try:
+            raw = getattr(resource, self.slot)
+        except AttributeError:
+            raise AttributeError(
+                '{!r} object has no attribute {!r}'
+                .format(owner.__name__, self.name)
+            )
+        value = self.decode(raw)
+        if decoded is None:
+            decoded = resource._decoded = {}
+        decoded[self.name] = value
+        return value
+
+
+class ResourceReference(object):
+    """Unloaded reference to a resource, the guid is available right away,
+    and the resource is fetched with get method of resource_type (such as
+    `customer` for `get_customer`) on first access of other attributes
+
+    """
+    __slots__ = ('api', 'guid', 'resource_type', '_resource')
+
+    def __init__(self, api, guid, resource_type):
+        self.api = api
+        self.guid = guid
+        self.resource_type = resource_type
+        self._resource = None
+
+    def __repr__(self):
+        if self._resource is not None:
+            return repr(self._resource)
+        return '<Unloaded {} {}>'.format(self.resource_type, self.guid)
+
+    @property
+    def loaded(self):
+        """Whether the referenced resource is loaded
+
+        """
+        return self._resource is not None
+
+    def load(self):
+        """Fetch the referenced resource if it's not loaded yet and return it
+
+        """
+        if self._resource is None:
+            get_method = getattr(self.api, 'get_' + self.resource_type)
+            self._resource = get_method(self.guid)
+        return self._resource
+
+    def __getattr__(self, key):
+        if key.startswith('_'):
+            raise AttributeError(key)
+        return getattr(self.load(), key)
+
+
+class Reference(object):
+    """Relationship to another resource by the guid in field guid_field, the
+    value is a :class:`ResourceReference` which is loaded on demand, or None
+    if there is no guid
+
+    """
+
+    def __init__(self, guid_field, resource_type):
+        self.guid_field = guid_field
+        self.resource_type = resource_type
+
+    def __get__(self, resource, owner):
+        if resource is None:
+            return self
+        references = resource._references
+        if references is not None and self.resource_type in references:
+            return references[self.resource_type]
+        guid = getattr(resource, self.guid_field, None)
+        if guid is None:
+            return None
+        reference = ResourceReference(resource.api, guid, self.resource_type)
+        resource._set_reference(self.resource_type, reference)
+        return reference
+
+
+class ResourceMeta(type):
+    """Metaclass of resources, it makes a slot for each of FIELDS, so that
+    resource objects don't need a dict for their data
+
+    """
+
+    def __new__(mcs, name, bases, attrs):
+        fields = attrs.get('FIELDS', ())
+        slots = list(attrs.get('__slots__', ()))
+        field_slots = {}
+        for base in bases:
+            field_slots.update(getattr(base, '_field_slots', {}))
+        for field in fields:
+            slots.append(field.slot)
+            field_slots[field.name] = field.slot
+            if field.decode is not None:
+                attrs[field.name] = field
+        references = {}
+        for base in bases:
+            references.update(getattr(base, '_reference_fields', {}))
+        for key, value in attrs.iteritems():
+            if isinstance(value, Reference):
+                references[key] = value
+        attrs['__slots__'] = tuple(slots)
+        attrs['_field_slots'] = field_slots
+        #: map of names to :class:`Reference` of the resource class
+        attrs['_reference_fields'] = references
+        return super(ResourceMeta, mcs).__new__(mcs, name, bases, attrs)
+
+
 class Resource(object):
     """Resource object from the billy server
 
+    Values of declared FIELDS are stored in slots, and fields with a decode
+    function are decoded on first access, undeclared fields sent by the server
+    are still accessible as attributes
+
     """
+    __metaclass__ = ResourceMeta
+    __slots__ = ('api', '_extra', '_decoded', '_references')
+
     BASE_URI = None
+    FIELDS = ()
 
     def __init__(self, api, json_data):
         self.api = api
-        self.json_data = json_data
+        self._extra = None
+        self._decoded = None
+        self._references = None
+        field_slots = self._field_slots
+        for key, value in json_data.iteritems():
+            slot = field_slots.get(key)
+            if slot is not None:
+                setattr(self, slot, value)
+                continue
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def _set_reference(self, name, value):
+        """Set the resource (or ResourceReference) referenced by name
+
+        """
+        if self._references is None:
+            self._references = {}
+        self._references[name] = value
+
+    @property
+    def json_data(self):
+        """Raw JSON data of this resource
+
+        """
+        json_data = dict(self._extra or {})
+        for key, slot in self._field_slots.iteritems():
+            try:
+                json_data[key] = getattr(self, slot)
+            except AttributeError:
+                continue
+        return json_data
 
     def __unicode__(self):
         return str(self)
@@ -44,10 +709,16 @@ class Resource(object):
         return '<{} {}>'.format(self.__class__.__name__, self.json_data)
 
     def __getattr__(self, key):
-        try:
-            return self.json_data[key]
-        except KeyError:
-            return super(Resource. self).__getattre__(key)
+        # only called when the attribute is not found normally, and slots not
+        # set yet (such as during unpickling) should not be looked up
+        if not key.startswith('_'):
+            extra = self._extra
+            if extra is not None and key in extra:
+                return extra[key]
+        raise AttributeError(
+            '{!r} object has no attribute {!r}'
+            .format(self.__class__.__name__, key)
+        )
 
     def _list_resources(
         self,
@@ -55,12 +726,14 @@ class Resource(object):
         resource_path,
         external_id=None,
         processor_uri=None,
+        page_size=None,
+        fields=None,
     ):
         """List relative resources under of resource
 
         """
         assert self.BASE_URI is not None
-        kwargs = {}
+        kwargs = dict(page_size=page_size, fields=fields)
         if external_id or processor_uri:
             kwargs['extra_query'] = {}
             if external_id:
@@ -72,44 +745,528 @@ class Resource(object):
             url=self.api._url_for(
                 '{}/{}/{}'.format(self.BASE_URI, self.guid, resource_path)
             ),
+            url_template='{}/{{guid}}/{}'.format(self.BASE_URI, resource_path),
             resource_cls=resource_cls,
             **kwargs
         )
 
 
+class AdaptivePageSize(object):
+    """Page size which adapts to observed responses, it grows when pages come
+    back fast and small, and shrinks when they are slow or too large, so that
+    bulk scans make fewer round trips while each request stays responsive
+
+    """
+
+    def __init__(
+        self,
+        initial=50,
+        min_size=10,
+        max_size=1000,
+        target_latency=1.0,
+        max_content_length=1024 * 1024,
+    ):
+        self.size = initial
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_latency = target_latency
+        self.max_content_length = max_content_length
+        self._lock = threading.Lock()
+
+    def observe(self, size, latency, content_length):
+        """Adjust the page size according to a response of a page with given
+        size, latency in seconds and content length in bytes
+
+        """
+        with self._lock:
+            if (
+                latency > self.target_latency or
+                content_length > self.max_content_length
+            ):
+                self.size = max(self.min_size, size // 2)
+            elif (
+                latency < self.target_latency / 2 and
+                content_length < self.max_content_length / 2
+            ):
+                self.size = min(self.max_size, size * 2)
+
+
 class Page(object):
     """Object for iterating over records via API
 
+    When prefetch_depth is greater than zero, up to that many following pages
+    are fetched in background while records of the current page are being
+    consumed. If it's None, the prefetch_depth of the api will be used
+
+    The page_size is the number of records to request for each page, it could
+    be an integer, an :class:`AdaptivePageSize` or None for server default.
+    The adaptive page size only changes between pages of serial iteration,
+    prefetching and scan keep the limit of the first page
+
+    When stream is True, items of each page are decoded incrementally from
+    the response body and yielded as soon as they are parsed, so that only
+    one item instead of one page is kept in memory. Streaming doesn't work
+    with prefetching. If it's None, the stream_pages of the api will be used
+
+    When fields is given, it's sent to the server as a hint of what fields to
+    return, and only those fields are kept in yielded resources. With
+    as_tuples, lightweight named tuples of the fields are yielded instead of
+    resources (missing fields are None)
+
     """
 
-    def __init__(self, api, url, resource_cls, extra_query=None, logger=None):
+    #: Size of chunks to read from response body when streaming
+    STREAM_CHUNK_SIZE = 8192
+    #: Number of streamed items to prefetch references for at a time when
+    #: the page size is not known
+    STREAM_BATCH_SIZE = 100
+
+    def __init__(
+        self,
+        api,
+        url,
+        resource_cls,
+        extra_query=None,
+        logger=None,
+        prefetch_depth=None,
+        page_size=None,
+        stream=None,
+        fields=None,
+        as_tuples=False,
+        url_template=None,
+    ):
         self.logger = logger or logging.getLogger(__name__)
         self.api = api
         self.url = url
+        #: URL path template of pages for request hooks, the path of url is
+        #: used if it's None
+        self.url_template = url_template
         self.resource_cls = resource_cls
         self.extra_query = extra_query
+        if prefetch_depth is None:
+            prefetch_depth = api.prefetch_depth
+        self.prefetch_depth = prefetch_depth
+        self.page_size = page_size
+        if stream is None:
+            stream = api.stream_pages
+        self.stream = stream
+        if as_tuples and not fields:
+            raise ValueError('fields are required for as_tuples')
+        self.fields = fields
+        self.as_tuples = as_tuples
+        #: names of references to prefetch for each page, see :meth:`prefetch`
+        self.references = ()
+        self._loaded_references = {}
+        #: named tuple class of the fields for as_tuples
+        self.tuple_cls = None
+        if fields:
+            self.tuple_cls = collections.namedtuple(
+                resource_cls.__name__ + 'Fields',
+                fields,
+            )
+        #: path name of the resource type, such as `invoices`
+        self.path_name = resource_cls.BASE_URI.rsplit('/', 1)[-1]
+        #: name of the operation of fetching pages, such as `list_invoices`
+        self.method_name = 'list_' + self.path_name
 
-    def __iter__(self):
+    def tuples(self):
+        """Iterate over named tuples of the fields of records
+
+        """
+        if not self.fields:
+            raise ValueError('fields are required for tuples')
+        page = copy.copy(self)
+        page.as_tuples = True
+        return iter(page)
+
+    def to_columns(self, fields, use_numpy=None):
+        """Iterate over all records and collect given fields into columns,
+        return an ordered dict maps each field name to its column
+
+        Datetime fields become arrays of integer seconds since epoch (0 for
+        missing values), amounts become arrays of floats (NaN for missing
+        values), other fields become arrays of integers if all of their
+        values are integers, or lists otherwise. ValueError naming the field
+        is raised if a datetime cannot be parsed. With use_numpy, columns are
+        NumPy arrays (lists become object arrays), it's used when NumPy is
+        available if use_numpy is None
+
+        """
+        numpy = _import_numpy() if use_numpy or use_numpy is None else None
+        if use_numpy is None:
+            use_numpy = numpy is not None
+        elif use_numpy and numpy is None:
+            raise ValueError('NumPy is not available')
+        declared = dict(
+            (field.name, field) for field in self.resource_cls.FIELDS
+        )
+        columns = collections.OrderedDict()
+        converters = []
+        for name in fields:
+            decode = getattr(declared.get(name), 'decode', None)
+            # array type codes have to be byte strings in Python 2
+            if decode is decode_datetime:
+                columns[name] = array.array(b'l')
+                converters.append(datetime_to_epoch)
+            elif decode is decode_decimal:
+                columns[name] = array.array(b'd')
+                converters.append(decimal_to_float)
+            else:
+                columns[name] = []
+                converters.append(None)
+        appends = [(name, column.append) for name, column in columns.items()]
+        for json_data in self.iter_pages():
+            for item in json_data['items']:
+                for (name, append), convert in zip(appends, converters):
+                    value = item.get(name)
+                    if convert is not None:
+                        try:
+                            value = convert(value)
+                        except ValueError as exc:
+                            raise ValueError(
+                                'Invalid value of field {} in record {}: {}'
+                                .format(name, item.get('guid'), exc)
+                            )
+                    append(value)
+        for name, column in columns.items():
+            if isinstance(column, list):
+                column = self._compact_column(column)
+            if use_numpy:
+                if isinstance(column, list):
+                    column = numpy.array(column, dtype=object)
+                else:
+                    column = numpy.array(column, dtype=column.typecode)
+            columns[name] = column
+        return columns
+
+    @staticmethod
+    def _compact_column(values):
+        """Convert a list of values into an array of integers if all of them
+        are integers
+
+        """
+        if not values:
+            return values
+        for value in values:
+            if isinstance(value, bool) or not isinstance(value, (int, long)):
+                return values
+        try:
+            return array.array(b'l', values)
+        except OverflowError:
+            return values
+
+    def prefetch(self, *names):
+        """Return a copy of this page, which fetches referenced resources of
+        given names (such as `customer` of invoices) for all records of each
+        page concurrently in one batch, and attaches them to records before
+        they are yielded
+
+        """
+        for name in names:
+            if name not in self.resource_cls._reference_fields:
+                raise ValueError(
+                    '{} has no reference {}'
+                    .format(self.resource_cls.__name__, name)
+                )
+        page = copy.copy(self)
+        page.references = self.references + tuple(names)
+        page._loaded_references = {}
+        return page
+
+    def _attach_references(self, resources):
+        """Fetch references of resources which are not loaded yet, and attach
+        them to resources
+
+        """
+        for name in self.references:
+            reference = self.resource_cls._reference_fields[name]
+            loaded = self._loaded_references.setdefault(
+                reference.resource_type,
+                {},
+            )
+            guids = []
+            for resource in resources:
+                guid = getattr(resource, reference.guid_field, None)
+                if guid is not None and guid not in loaded:
+                    guids.append(guid)
+            if guids:
+                results = self.api.get_many(reference.resource_type, guids)
+                for guid, result in results.iteritems():
+                    # records failed to be fetched are left as lazy references
+                    if result.error is None:
+                        loaded[guid] = result.value
+            for resource in resources:
+                guid = getattr(resource, reference.guid_field, None)
+                if guid in loaded:
+                    resource._set_reference(
+                        reference.resource_type,
+                        loaded[guid],
+                    )
+
+    def _make_resources(self, items):
+        """Make resources from items of a page, with prefetched references
+        attached, final records are kept in the record store of api in one
+        batch
+
+        """
+        if self.fields is None:
+            self.api._store_records(self.path_name, items)
+        resources = [self._make_resource(item) for item in items]
+        if self.references and not self.as_tuples:
+            self._attach_references(resources)
+        return resources
+
+    def _make_resource(self, item):
+        """Make a resource object from an item of page
+
+        """
+        if self.fields is None:
+            return self.resource_cls(self.api, item)
+        if self.as_tuples:
+            return self.tuple_cls(*[item.get(key) for key in self.fields])
+        return self.resource_cls(self.api, project_fields(item, self.fields))
+
+    def _page_limit(self):
+        """Get the limit to request for the next page, None for server default
+
+        """
+        if isinstance(self.page_size, AdaptivePageSize):
+            return self.page_size.size
+        return self.page_size
+
+    def _page_url(self, offset=None, limit=None):
+        """Generate URL of the page at given offset, the server default is
+        used when offset or limit is None
+
+        """
         data = self.extra_query.copy() if self.extra_query else {}
-        while True:
-            self.logger.debug(
-                'Page for %s getting %s',
-                self.resource_cls.__name__,
-                data,
+        if offset is not None:
+            data['offset'] = offset
+        if limit is not None:
+            data['limit'] = limit
+        if self.fields is not None:
+            data['fields'] = ','.join(self.fields)
+        self.logger.debug(
+            'Page for %s getting %s',
+            self.resource_cls.__name__,
+            data,
+        )
+        query = urllib.urlencode(data)
+        return self.url + '?' + query
+
+    def _fetch(self, offset=None, limit=None):
+        """Fetch one page of records at given offset and return the decoded
+        JSON data, the server default is used when offset or limit is None
+
+        """
+        url = self._page_url(offset=offset, limit=limit)
+        begin = time.time()
+        resp = self.api._request(
+            self.method_name, 'GET', url,
+            url_template=self.url_template,
+            **self.api._auth_args()
+        )
+        json_data = resp.json()
+        if isinstance(self.page_size, AdaptivePageSize):
+            self.page_size.observe(
+                size=json_data['limit'],
+                latency=time.time() - begin,
+                content_length=len(resp.content),
+            )
+        self.logger.debug('Page result %r', json_data)
+        return json_data
+
+    def __iter__(self):
+        if self.stream:
+            return self._iter_stream()
+        if self.prefetch_depth:
+            return self._iter_prefetch(self.prefetch_depth)
+        return self._iter_serial()
+
+    def _fetch_stream(self, meta, offset=None, limit=None):
+        """Fetch one page of records at given offset, and yield items as soon
+        as they are decoded from the response body, other fields of the page
+        are put into meta
+
+        """
+        url = self._page_url(offset=offset, limit=limit)
+        begin = time.time()
+        resp = self.api._request(
+            self.method_name, 'GET', url,
+            url_template=self.url_template,
+            stream=True,
+            **self.api._auth_args()
+        )
+        content_length = [0]
+
+        def iter_chunks():
+            for chunk in resp.iter_content(self.STREAM_CHUNK_SIZE):
+                content_length[0] += len(chunk)
+                yield chunk
+
+        try:
+            for item in iter_page_items(
+                iter_chunks(),
+                meta,
+                encoding=resp.encoding or 'utf-8',
+            ):
+                yield item
+        finally:
+            resp.close()
+        if isinstance(self.page_size, AdaptivePageSize):
+            self.page_size.observe(
+                size=meta['limit'],
+                latency=time.time() - begin,
+                content_length=content_length[0],
             )
-            query = urllib.urlencode(data)
-            url = self.url + '?' + query
-            resp = requests.get(url, **self.api._auth_args())
-            json_data = resp.json()
-            self.logger.debug('Page result %r', json_data)
+        self.logger.debug('Page result %r', meta)
+
+    def _iter_stream(self):
+        offset = None
+        limit = self._page_limit()
+        # final records are stored in batches instead of one by one
+        storing = self.fields is None and self.api.record_store is not None
+        while True:
+            meta = {}
+            empty = True
+            batch = []
+            if self.references:
+                batch_size = limit or self.STREAM_BATCH_SIZE
+            else:
+                batch_size = self.STREAM_BATCH_SIZE
+            for item in self._fetch_stream(meta, offset=offset, limit=limit):
+                empty = False
+                if not self.references and not storing:
+                    yield self._make_resource(item)
+                    continue
+                # referenced resources are prefetched for a batch of items
+                batch.append(item)
+                if len(batch) >= batch_size:
+                    for resource in self._make_resources(batch):
+                        yield resource
+                    batch = []
+            for resource in self._make_resources(batch):
+                yield resource
+            if empty:
+                break
+            offset = meta['offset'] + meta['limit']
+            limit = self._page_limit() or meta['limit']
+
+    def iter_pages(self, offset=None):
+        """Iterate over decoded JSON data of pages serially from given offset
+        (the server default if it's None) until the first page without any
+        items, records are not made into resources
+
+        """
+        limit = self._page_limit()
+        while True:
+            json_data = self._fetch(offset=offset, limit=limit)
             # TODO: we should improve the API to make iteration more efficient
             #       add a next_url field or something like that
             if not json_data['items']:
                 break
-            for item in json_data['items']:
-                yield self.resource_cls(self.api, item)
-            data['offset'] = json_data['offset'] + json_data['limit']
-            data['limit'] = json_data['limit']
+            yield json_data
+            offset = json_data['offset'] + json_data['limit']
+            limit = self._page_limit() or json_data['limit']
+
+    def _iter_serial(self):
+        for json_data in self.iter_pages():
+            for resource in self._make_resources(json_data['items']):
+                yield resource
+
+    def _iter_prefetch(self, depth):
+        """Iterate over records while fetching following pages in background
+
+        """
+        executor = futures.ThreadPoolExecutor(max_workers=depth)
+        pending = collections.deque()
+        try:
+            json_data = self._fetch(limit=self._page_limit())
+            limit = json_data['limit']
+            next_offset = json_data['offset'] + limit
+            while json_data['items']:
+                while len(pending) < depth:
+                    pending.append(
+                        executor.submit(self._fetch, next_offset, limit)
+                    )
+                    next_offset += limit
+                for resource in self._make_resources(json_data['items']):
+                    yield resource
+                json_data = pending.popleft().result()
+        finally:
+            # we reached the end or the consumer stopped early, pages fetched
+            # ahead of time are not needed anymore
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def scan(self, max_workers=None, ordered=True):
+        """Iterate over records by fetching multiple offset windows
+        concurrently with at most max_workers requests in flight, the scan
+        ends at the first window without any items. When ordered is False,
+        records are yielded window by window as soon as they are fetched
+        instead of in offset order, otherwise at most max_workers windows
+        are in flight or buffered waiting for the ones before them
+
+        """
+        max_workers = self.api._max_workers(max_workers)
+        executor = futures.ThreadPoolExecutor(max_workers=max_workers)
+        pending = {}
+        try:
+            json_data = self._fetch(limit=self._page_limit())
+            if not json_data['items']:
+                return
+            for resource in self._make_resources(json_data['items']):
+                yield resource
+            limit = json_data['limit']
+            next_offset = json_data['offset'] + limit
+            expected_offset = next_offset
+            end_offset = None
+            fetched = {}
+            while True:
+                # windows fetched out of order are buffered until the head
+                # one arrives, they count against max_workers as well so a
+                # slow head window doesn't make the buffer grow unbounded
+                while (
+                    end_offset is None and
+                    len(pending) + len(fetched) < max_workers
+                ):
+                    future = executor.submit(self._fetch, next_offset, limit)
+                    pending[future] = next_offset
+                    next_offset += limit
+                if not pending:
+                    break
+                done, _ = futures.wait(
+                    pending,
+                    return_when=futures.FIRST_COMPLETED,
+                )
+                for future in done:
+                    offset = pending.pop(future)
+                    items = future.result()['items']
+                    if not items:
+                        if end_offset is None or offset < end_offset:
+                            end_offset = offset
+                        continue
+                    if end_offset is not None and offset > end_offset:
+                        continue
+                    if ordered:
+                        fetched[offset] = items
+                        continue
+                    for resource in self._make_resources(items):
+                        yield resource
+                if end_offset is not None:
+                    for future, offset in pending.items():
+                        if offset > end_offset and future.cancel():
+                            del pending[future]
+                while expected_offset in fetched:
+                    items = fetched.pop(expected_offset)
+                    for resource in self._make_resources(items):
+                        yield resource
+                    expected_offset += limit
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
 
 
 class Company(Resource):
@@ -119,6 +1276,15 @@ class Company(Resource):
 
     BASE_URI = '/v1/companies'
 
+    FIELDS = (
+        Field('guid'),
+        Field('api_key'),
+        Field('processor_key'),
+        Field('callback_key'),
+        Field('created_at', decode_datetime),
+        Field('updated_at', decode_datetime),
+    )
+
     def create_customer(self, processor_uri=None):
         """Create a customer for this company
 
@@ -127,7 +1293,9 @@ class Company(Resource):
         data = {}
         if processor_uri is not None:
             data['processor_uri'] = processor_uri
-        resp = requests.post(url, data=data, **self.api._auth_args())
+        resp = self.api._request(
+            'create_customer', 'POST', url, data=data, **self.api._auth_args()
+        )
         self.api._check_response('create_customer', resp)
         return Customer(self.api, resp.json())
 
@@ -142,7 +1310,9 @@ class Company(Resource):
             amount=amount,
             interval=interval,
         )
-        resp = requests.post(url, data=data, **self.api._auth_args())
+        resp = self.api._request(
+            'create_plan', 'POST', url, data=data, **self.api._auth_args()
+        )
         self.api._check_response('create_plan', resp)
         return Plan(self.api, resp.json())
 
@@ -154,6 +1324,18 @@ class Customer(Resource):
 
     BASE_URI = '/v1/customers'
 
+    FIELDS = (
+        Field('guid'),
+        Field('company_guid'),
+        Field('processor_uri'),
+        Field('deleted'),
+        Field('created_at', decode_datetime),
+        Field('updated_at', decode_datetime),
+    )
+
+    #: Referenced company
+    company = Reference('company_guid', 'company')
+
     def _encode_params(self, prefix, items):
         params = {}
         for i, item in enumerate(items):
@@ -194,8 +1376,15 @@ class Customer(Resource):
         if adjustments is not None:
             params = self._encode_params('adjustment_', adjustments)
             data.update(params)
-        resp = requests.post(url, data=data, **self.api._auth_args())
+        resp = self.api._request(
+            'invoice', 'POST', url, data=data, **self.api._auth_args()
+        )
         if resp.status_code == requests.codes.conflict:
+            if resp.retries and external_id is not None:
+                # an earlier attempt created the invoice, but we failed to
+                # receive its response, so find the created one instead
+                for invoice in self.list_invoices(external_id=external_id):
+                    return invoice
             raise DuplicateExternalIDError(
                 'Invoice with the same external ID of this customer already exists',
                 resp.status_code,
@@ -204,7 +1393,7 @@ class Customer(Resource):
         self.api._check_response('invoice', resp)
         return Invoice(self.api, resp.json())
 
-    def list_subscriptions(self, external_id=None):
+    def list_subscriptions(self, external_id=None, page_size=None, fields=None):
         """List subscriptions
 
         """
@@ -212,9 +1401,11 @@ class Customer(Resource):
             resource_cls=Subscription,
             resource_path='subscriptions',
             external_id=external_id,
+            page_size=page_size,
+            fields=fields,
         )
 
-    def list_invoices(self, external_id=None):
+    def list_invoices(self, external_id=None, page_size=None, fields=None):
         """List invoices
 
         """
@@ -222,9 +1413,11 @@ class Customer(Resource):
             resource_cls=Invoice,
             resource_path='invoices',
             external_id=external_id,
+            page_size=page_size,
+            fields=fields,
         )
 
-    def list_transactions(self, external_id=None):
+    def list_transactions(self, external_id=None, page_size=None, fields=None):
         """List transactions
 
         """
@@ -232,6 +1425,8 @@ class Customer(Resource):
             resource_cls=Transaction,
             resource_path='transactions',
             external_id=external_id,
+            page_size=page_size,
+            fields=fields,
         )
 
 
@@ -241,6 +1436,21 @@ class Plan(Resource):
     """
     BASE_URI = '/v1/plans'
 
+    FIELDS = (
+        Field('guid'),
+        Field('company_guid'),
+        Field('plan_type'),
+        Field('frequency'),
+        Field('amount', decode_decimal),
+        Field('interval'),
+        Field('deleted'),
+        Field('created_at', decode_datetime),
+        Field('updated_at', decode_datetime),
+    )
+
+    #: Referenced company
+    company = Reference('company_guid', 'company')
+
     #: Daily frequency
     FREQ_DAILY = 'daily'
     #: Weekly frequency
@@ -291,11 +1501,13 @@ class Plan(Resource):
             data['appears_on_statement_as'] = appears_on_statement_as
         if started_at is not None:
             data['started_at'] = started_at.isoformat()
-        resp = requests.post(url, data=data, **self.api._auth_args())
+        resp = self.api._request(
+            'subscribe', 'POST', url, data=data, **self.api._auth_args()
+        )
         self.api._check_response('subscribe', resp)
         return Subscription(self.api, resp.json())
 
-    def list_customers(self, external_id=None):
+    def list_customers(self, external_id=None, page_size=None, fields=None):
         """List customers
 
         """
@@ -303,9 +1515,11 @@ class Plan(Resource):
             resource_cls=Customer,
             resource_path='customers',
             external_id=external_id,
+            page_size=page_size,
+            fields=fields,
         )
 
-    def list_subscriptions(self, external_id=None):
+    def list_subscriptions(self, external_id=None, page_size=None, fields=None):
         """List subscriptions
 
         """
@@ -313,9 +1527,11 @@ class Plan(Resource):
             resource_cls=Subscription,
             resource_path='subscriptions',
             external_id=external_id,
+            page_size=page_size,
+            fields=fields,
         )
 
-    def list_invoices(self, external_id=None):
+    def list_invoices(self, external_id=None, page_size=None, fields=None):
         """List invoices
 
         """
@@ -323,9 +1539,11 @@ class Plan(Resource):
             resource_cls=Invoice,
             resource_path='invoices',
             external_id=external_id,
+            page_size=page_size,
+            fields=fields,
         )
 
-    def list_transactions(self, external_id=None):
+    def list_transactions(self, external_id=None, page_size=None, fields=None):
         """List transactions
 
         """
@@ -333,6 +1551,8 @@ class Plan(Resource):
             resource_cls=Transaction,
             resource_path='transactions',
             external_id=external_id,
+            page_size=page_size,
+            fields=fields,
         )
 
 
@@ -343,16 +1563,44 @@ class Subscription(Resource):
 
     BASE_URI = '/v1/subscriptions'
 
+    FIELDS = (
+        Field('guid'),
+        Field('plan_guid'),
+        Field('customer_guid'),
+        Field('amount', decode_decimal),
+        Field('effective_amount', decode_decimal),
+        Field('funding_instrument_uri'),
+        Field('appears_on_statement_as'),
+        Field('invoice_count'),
+        Field('canceled'),
+        Field('canceled_at', decode_datetime),
+        Field('started_at', decode_datetime),
+        Field('next_invoice_at', decode_datetime),
+        Field('created_at', decode_datetime),
+        Field('updated_at', decode_datetime),
+    )
+
+    #: Referenced plan
+    plan = Reference('plan_guid', 'plan')
+    #: Referenced customer
+    customer = Reference('customer_guid', 'customer')
+
     def cancel(self):
         """Cancel the subscription
 
         """
         url = self.api._url_for('{}/{}/cancel'.format(self.BASE_URI, self.guid))
-        resp = requests.post(url, **self.api._auth_args())
+        resp = self.api._request(
+            'cancel', 'POST', url,
+            url_template=self.BASE_URI + '/{guid}/cancel',
+            **self.api._auth_args()
+        )
         self.api._check_response('cancel', resp)
-        return Subscription(self.api, resp.json())
+        subscription = Subscription(self.api, resp.json())
+        self.api._cache_record('subscriptions', subscription)
+        return subscription
 
-    def list_invoices(self, external_id=None):
+    def list_invoices(self, external_id=None, page_size=None, fields=None):
         """List invoices
 
         """
@@ -360,9 +1608,11 @@ class Subscription(Resource):
             resource_cls=Invoice,
             resource_path='invoices',
             external_id=external_id,
+            page_size=page_size,
+            fields=fields,
         )
 
-    def list_transactions(self, external_id=None):
+    def list_transactions(self, external_id=None, page_size=None, fields=None):
         """List transactions
 
         """
@@ -370,6 +1620,8 @@ class Subscription(Resource):
             resource_cls=Transaction,
             resource_path='transactions',
             external_id=external_id,
+            page_size=page_size,
+            fields=fields,
         )
 
 
@@ -380,17 +1632,50 @@ class Invoice(Resource):
 
     BASE_URI = '/v1/invoices'
 
+    FIELDS = (
+        Field('guid'),
+        Field('invoice_type'),
+        Field('transaction_type'),
+        Field('status'),
+        Field('customer_guid'),
+        Field('subscription_guid'),
+        Field('amount', decode_decimal),
+        Field('effective_amount', decode_decimal),
+        Field('total_adjustment_amount', decode_decimal),
+        Field('title'),
+        Field('external_id'),
+        Field('funding_instrument_uri'),
+        Field('appears_on_statement_as'),
+        Field('items'),
+        Field('adjustments'),
+        Field('scheduled_at', decode_datetime),
+        Field('created_at', decode_datetime),
+        Field('updated_at', decode_datetime),
+    )
+
+    #: Referenced customer
+    customer = Reference('customer_guid', 'customer')
+    #: Referenced subscription
+    subscription = Reference('subscription_guid', 'subscription')
+
     def refund(self, amount):
         """Issue a refund
 
         """
         url = self.api._url_for('{}/{}/refund'.format(self.BASE_URI, self.guid))
         data = dict(amount=amount)
-        resp = requests.post(url, data=data, **self.api._auth_args())
+        resp = self.api._request(
+            'refund', 'POST', url,
+            url_template=self.BASE_URI + '/{guid}/refund',
+            data=data,
+            **self.api._auth_args()
+        )
         self.api._check_response('refund', resp)
-        return Subscription(self.api, resp.json())
+        invoice = Invoice(self.api, resp.json())
+        self.api._cache_record('invoices', invoice)
+        return invoice
 
-    def list_transactions(self, external_id=None):
+    def list_transactions(self, external_id=None, page_size=None, fields=None):
         """List transactions
 
         """
@@ -398,6 +1683,8 @@ class Invoice(Resource):
             resource_cls=Transaction,
             resource_path='transactions',
             external_id=external_id,
+            page_size=page_size,
+            fields=fields,
         )
 
 
@@ -406,6 +1693,140 @@ class Transaction(Resource):
 
     """
 
+    BASE_URI = '/v1/transactions'
+
+    FIELDS = (
+        Field('guid'),
+        Field('invoice_guid'),
+        Field('transaction_type'),
+        Field('submit_status'),
+        Field('status'),
+        Field('amount', decode_decimal),
+        Field('funding_instrument_uri'),
+        Field('processor_uri'),
+        Field('appears_on_statement_as'),
+        Field('failure_count'),
+        Field('failures'),
+        Field('created_at', decode_datetime),
+        Field('updated_at', decode_datetime),
+    )
+
+    #: Referenced invoice
+    invoice = Reference('invoice_guid', 'invoice')
+
+
+class CustomerGraph(object):
+    """Object graph of a customer loaded by
+    :meth:`BillyAPI.load_customer_graph`, resources are deduplicated by guid,
+    and their references to each other (such as `invoice.subscription`) are
+    linked to the resources in the graph
+
+    """
+
+    #: Collections of related resources crawled for each resource type
+    CHILDREN = dict(
+        customer=('subscriptions', 'invoices', 'transactions'),
+        subscription=('invoices', 'transactions'),
+        invoice=('transactions',),
+    )
+
+    def __init__(self):
+        self.customer = None
+        self.subscriptions = collections.OrderedDict()
+        self.invoices = collections.OrderedDict()
+        self.transactions = collections.OrderedDict()
+
+    def _resources_of(self, resource_type):
+        if resource_type == 'customer':
+            if self.customer is None:
+                return {}
+            return {self.customer.guid: self.customer}
+        return getattr(self, resource_type + 's')
+
+    def _add(self, resource):
+        """Add a resource to the graph, return whether it's new
+
+        """
+        resource_type = type(resource).__name__.lower()
+        if resource_type == 'customer':
+            if self.customer is not None:
+                return False
+            self.customer = resource
+            return True
+        resources = self._resources_of(resource_type)
+        if resource.guid in resources:
+            return False
+        resources[resource.guid] = resource
+        return True
+
+    def _link(self):
+        """Link references of resources in the graph to each other
+
+        """
+        for resources in [
+            self._resources_of('customer'),
+            self.subscriptions,
+            self.invoices,
+            self.transactions,
+        ]:
+            for resource in resources.itervalues():
+                for reference in resource._reference_fields.itervalues():
+                    if reference.resource_type not in self.CHILDREN:
+                        continue
+                    guid = getattr(resource, reference.guid_field, None)
+                    target = self._resources_of(
+                        reference.resource_type
+                    ).get(guid)
+                    if target is not None:
+                        resource._set_reference(
+                            reference.resource_type,
+                            target,
+                        )
+
+    def children(self, resource, resource_type):
+        """Resources of given type in the graph referencing given resource,
+        e.g. `graph.children(subscription, 'invoice')`
+
+        """
+        parent_type = type(resource).__name__.lower()
+        results = []
+        for child in self._resources_of(resource_type).itervalues():
+            reference = child._reference_fields.get(parent_type)
+            if reference is None:
+                continue
+            if getattr(child, reference.guid_field, None) == resource.guid:
+                results.append(child)
+        return results
+
+
+def _body_length(resp):
+    """Get length of the request body of a response, 0 if it's unknown
+
+    """
+    body = getattr(getattr(resp, 'request', None), 'body', None)
+    if isinstance(body, basestring):
+        return len(body)
+    return 0
+
+
+def _content_length(resp, stream):
+    """Get length of the body of a response, the Content-Length header is
+    used for streamed responses so that the body is not consumed, 0 if it's
+    unknown
+
+    """
+    if resp is None:
+        return 0
+    if not stream:
+        content = resp.content
+        if isinstance(content, basestring):
+            return len(content)
+        return 0
+    try:
+        return int(resp.headers.get('Content-Length'))
+    except (TypeError, ValueError):
+        return 0
+
 
 class BillyAPI(object):
     """Billy API is the object provides easy-to-use interface to Billy recurring
@@ -415,15 +1836,246 @@ class BillyAPI(object):
 
     DEFAULT_ENDPOINT = 'https://billing.balancedpayments.com'
 
+    #: Default number of host connection pools to cache
+    DEFAULT_POOL_CONNECTIONS = 10
+    #: Default maximum number of connections kept alive per host
+    DEFAULT_POOL_MAXSIZE = 10
+
     def __init__(
         self,
         api_key,
         endpoint=DEFAULT_ENDPOINT,
         logger=None,
+        prefetch_depth=0,
+        cache=None,
+        record_store=None,
+        retry_policy=None,
+        circuit_breaker=None,
+        rate_limiter=None,
+        concurrency_controller=None,
+        metrics=None,
+        hooks=None,
+        trace_header=None,
+        trace_id_factory=None,
+        stream_pages=False,
+        pool_connections=DEFAULT_POOL_CONNECTIONS,
+        pool_maxsize=DEFAULT_POOL_MAXSIZE,
+        pool_block=False,
+        keep_alive=True,
     ):
         self.logger = logger or logging.getLogger(__name__)
         self.api_key = api_key
         self.endpoint = endpoint
+        #: default number of pages to fetch ahead when iterating over a Page
+        self.prefetch_depth = prefetch_depth
+        #: default of whether to decode items of pages incrementally
+        self.stream_pages = stream_pages
+        #: optional :class:`billy_client.cache.ResourceCache` for get methods
+        self.cache = cache
+        #: optional :class:`billy_client.store.RecordStore` for final records
+        self.record_store = record_store
+        #: optional :class:`RetryPolicy` for transient failures
+        self.retry_policy = retry_policy
+        #: optional :class:`CircuitBreaker` shared by requests of this API
+        self.circuit_breaker = circuit_breaker
+        #: optional :class:`RateLimiter`, could be shared with other APIs
+        self.rate_limiter = rate_limiter
+        #: optional :class:`ConcurrencyController` for requests in flight
+        self.concurrency_controller = concurrency_controller
+        #: optional :class:`billy_client.metrics.MetricsRegistry` of requests
+        self.metrics = metrics
+        #: lists of request hooks by event, see :meth:`add_hook`
+        self.hooks = dict(before=[], after=[], error=[])
+        for event, funcs in (hooks or {}).iteritems():
+            for func in funcs:
+                self.add_hook(event, func)
+        #: optional name of the header to send a trace ID with each request
+        self.trace_header = trace_header
+        #: function generates trace IDs, random UUIDs by default
+        self.trace_id_factory = trace_id_factory or (lambda: uuid.uuid4().hex)
+        #: max number of connections kept in the pool of each host
+        self.pool_maxsize = pool_maxsize
+        self.session = self._create_session(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block,
+            keep_alive=keep_alive,
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _create_session(
+        self,
+        pool_connections,
+        pool_maxsize,
+        pool_block,
+        keep_alive,
+    ):
+        """Create the HTTP session shared by all requests of this API object,
+        connections in the pool are thread-safe to share and reused across
+        requests, so that we don't need to do TCP and TLS handshake every time
+
+        """
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block,
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if not keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
+
+    def close(self):
+        """Close all pooled connections of this API object
+
+        """
+        self.session.close()
+
+    def add_hook(self, event, func):
+        """Add a request hook, func is called with a :class:`RequestInfo`
+        for each attempt of every request, before it's sent (event `before`),
+        after a response is received (event `after`), or after it failed
+        with an error (event `error`). Errors raised by hooks are logged and
+        ignored, so that they don't break requests
+
+        """
+        if event not in self.hooks:
+            raise ValueError('Unknown hook event {!r}'.format(event))
+        self.hooks[event].append(func)
+
+    def _call_hooks(self, event, info):
+        for func in self.hooks[event]:
+            try:
+                func(info)
+            except Exception:
+                self.logger.exception('Request hook %r failed', func)
+
+    def _request(self, method_name, method, url, url_template=None, **kwargs):
+        """Send a HTTP request via the pooled session and return the response,
+        the request is retried according to the retry policy if there is one,
+        and the number of retries is set as `retries` of the response.
+        The url_template is the URL path for request hooks, with the guid as
+        a placeholder, the path of url is used if it's None
+
+        """
+        policy = self.retry_policy
+        retryable = (
+            policy is not None and
+            policy.is_idempotent(method, kwargs.get('data'))
+        )
+        hooked = (
+            self.trace_header is not None or
+            any(self.hooks.itervalues())
+        )
+        if hooked:
+            if url_template is None:
+                url_template = urlparse.urlparse(url).path
+            trace_id = None
+            if self.trace_header is not None:
+                trace_id = self.trace_id_factory()
+        attempt = 0
+        while True:
+            attempt += 1
+            can_retry = retryable and attempt < policy.max_attempts
+            try:
+                if hooked:
+                    info = RequestInfo(
+                        method_name, method, url, url_template,
+                        attempt - 1, trace_id,
+                    )
+                    resp = self._send_hooked(info, method, url, **kwargs)
+                else:
+                    resp = self._send(method_name, method, url, **kwargs)
+            except Exception as error:
+                if not can_retry or not isinstance(error, policy.exceptions):
+                    raise
+                self.logger.warn(
+                    'Retry %s %s after attempt %s failed: %r',
+                    method, url, attempt, error,
+                )
+            else:
+                if not can_retry or resp.status_code not in policy.status_codes:
+                    resp.retries = attempt - 1
+                    return resp
+                self.logger.warn(
+                    'Retry %s %s after attempt %s failed with code %s',
+                    method, url, attempt, resp.status_code,
+                )
+                # release the connection of a streamed response to the pool
+                resp.close()
+            policy.backoff(attempt)
+
+    def _send_hooked(self, info, method, url, **kwargs):
+        """Send one HTTP request with the trace header if it's enabled, and
+        call request hooks around it
+
+        """
+        self._call_hooks('before', info)
+        if self.trace_header is not None and info.trace_id is not None:
+            headers = dict(kwargs.get('headers') or {})
+            headers[self.trace_header] = info.trace_id
+            kwargs['headers'] = headers
+        info.started_at = time.time()
+        try:
+            resp = self._send(info.operation, method, url, **kwargs)
+        except Exception as error:
+            info.elapsed = time.time() - info.started_at
+            info.error = error
+            self._call_hooks('error', info)
+            raise
+        info.elapsed = time.time() - info.started_at
+        info.status_code = resp.status_code
+        info.response_size = _content_length(resp, kwargs.get('stream'))
+        self._call_hooks('after', info)
+        return resp
+
+    def _send(self, method_name, method, url, **kwargs):
+        """Send one HTTP request through the circuit breaker, the rate limiter
+        and the concurrency controller if there are, and record its metrics
+        if there is a metrics registry
+
+        """
+        breaker = self.circuit_breaker
+        controller = self.concurrency_controller
+        metrics = self.metrics
+        key = (self.endpoint, method_name)
+        if breaker is not None:
+            breaker.before_request(key)
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(method_name)
+        if controller is not None:
+            started_at = controller.acquire()
+        if metrics is not None:
+            begin = time.time()
+        resp = None
+        try:
+            resp = self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            if breaker is not None:
+                breaker.after_request(key, False)
+            raise
+        finally:
+            status_code = resp.status_code if resp is not None else None
+            if controller is not None:
+                controller.release(started_at, status_code)
+            if metrics is not None:
+                metrics.observe(
+                    method_name,
+                    status_code,
+                    time.time() - begin,
+                    bytes_out=_body_length(resp),
+                    bytes_in=_content_length(resp, kwargs.get('stream')),
+                )
+        if breaker is not None:
+            breaker.after_request(key, resp.status_code < 500)
+        return resp
 
     def _url_for(self, path):
         """Generate URL for a given path
@@ -453,24 +2105,231 @@ class BillyAPI(object):
                 resp.content,
             )
 
+    def _max_workers(self, max_workers):
+        """Get number of workers for bulk and parallel operations, if it's not
+        given, the max limit of concurrency controller will be used if there
+        is one, so that the controller decides how many requests are in flight.
+        It's capped by the size of connection pool, as requests more than that
+        open extra connections which are discarded afterward
+
+        """
+        if max_workers is not None:
+            return max_workers
+        if self.concurrency_controller is not None:
+            return min(
+                self.concurrency_controller.max_limit,
+                self.pool_maxsize,
+            )
+        return self.pool_maxsize
+
+    def _run_batch(self, func, inputs, max_workers):
+        """Call func with each of inputs concurrently with at most max_workers
+        in flight, and yield :class:`BatchResult` in the order of inputs.
+        When the generator is closed early, calls not started yet are
+        canceled, and the ones in flight are waited for, so that none of them
+        keeps running after the batch is closed
+
+        """
+        max_workers = self._max_workers(max_workers)
+        executor = futures.ThreadPoolExecutor(max_workers=max_workers)
+        pending = collections.deque()
+
+        def call(request):
+            try:
+                return BatchResult(request, func(request), None)
+            except (BillyError, requests.RequestException) as error:
+                return BatchResult(request, None, error)
+
+        try:
+            for request in inputs:
+                # keep a few more requests queued than workers, so that a slow
+                # one at the head doesn't leave other workers idle
+                if len(pending) >= max_workers * 2:
+                    yield pending.popleft().result()
+                pending.append(executor.submit(call, request))
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    def create_invoices(self, specs, max_workers=None):
+        """Create invoices concurrently, specs is an iterable of dict with
+        customer_guid and arguments of :meth:`Customer.invoice`. A
+        :class:`BatchResult` with the created invoice or the error is yielded
+        for each spec in the same order of specs
+
+        """
+        def create_invoice(spec):
+            kwargs = spec.copy()
+            customer = Customer(self, dict(guid=kwargs.pop('customer_guid')))
+            return customer.invoice(**kwargs)
+        return self._run_batch(create_invoice, specs, max_workers)
+
+    def load_customer_graph(self, guid, depth=2, max_workers=None):
+        """Load a customer with its subscriptions, invoices and transactions
+        and return a :class:`CustomerGraph`. Related collections are listed
+        concurrently level by level with at most max_workers requests in
+        flight; depth 1 lists collections of the customer, and depth 2 also
+        lists collections of each found subscription and invoice. The first
+        error of any request will be raised
+
+        """
+        graph = CustomerGraph()
+        customer = Customer(self, dict(guid=guid))
+        tasks = [(customer, None)]
+        if depth > 0:
+            tasks.extend(
+                (customer, name) for name in CustomerGraph.CHILDREN['customer']
+            )
+
+        def load(task):
+            resource, name = task
+            if name is None:
+                return [self.get_customer(resource.guid)]
+            return list(getattr(resource, 'list_' + name)())
+
+        level = 1
+        while tasks:
+            found = []
+            results = self._run_batch(load, tasks, max_workers)
+            try:
+                for result in results:
+                    if result.error is not None:
+                        raise result.error
+                    for resource in result.value:
+                        if graph._add(resource):
+                            found.append(resource)
+            finally:
+                # stop the other tasks of this level before raising
+                results.close()
+            if level >= depth:
+                break
+            level += 1
+            tasks = []
+            for resource in found:
+                resource_type = type(resource).__name__.lower()
+                if resource_type == 'customer':
+                    continue
+                for name in CustomerGraph.CHILDREN.get(resource_type, ()):
+                    tasks.append((resource, name))
+        graph._link()
+        return graph
+
     def create_company(self, processor_key):
         """Create a company entity in billy
 
         """
         url = self._url_for('/v1/companies')
-        resp = requests.post(url, data=dict(processor_key=processor_key))
+        resp = self._request(
+            'create_company', 'POST', url,
+            data=dict(processor_key=processor_key),
+        )
         self._check_response('create_company', resp)
         company = Company(self, resp.json())
         self.api_key = company.api_key
         return company
 
-    def _get_record(self, guid, path_name, method_name):
+    def _cache_record(self, path_name, resource):
+        """Put a fetched or modified record into cache and record store if
+        there are
+
+        """
+        if self.cache is not None:
+            self.cache.set(path_name, resource.guid, resource)
+        self._store_record(path_name, resource.json_data)
+
+    def _store_record(self, path_name, json_data):
+        """Put JSON data of a record into record store if there is one
+
+        """
+        if self.record_store is not None:
+            self.record_store.put(path_name, json_data)
+
+    def _store_records(self, path_name, items):
+        """Put JSON data of records of a page into record store in one batch
+        if there is one
+
+        """
+        if self.record_store is not None:
+            self.record_store.put_many(path_name, items)
+
+    def invalidate(self, path_name=None, guid=None):
+        """Remove a record from cache (or all records of given path name, such
+        as `plans`, if guid is None, or everything if path name is also None),
+        so that it will be fetched from server next time
+
+        """
+        if self.cache is not None:
+            self.cache.invalidate(path_name, guid)
+
+    def _get_record(
+        self,
+        guid,
+        path_name,
+        method_name,
+        resource_cls,
+        fields=None,
+    ):
+        """Find a record, if fields is given, only those fields are requested
+        and kept in the returned resource, and it won't be cached because it's
+        incomplete
+
+        """
+        json_data = None
+        if self.cache is not None:
+            record = self.cache.get(path_name, guid)
+            if record is not None:
+                if fields is None:
+                    return record
+                json_data = record.json_data
+        if (
+            json_data is None and
+            self.record_store is not None and
+            self.record_store.accepts(path_name)
+        ):
+            json_data = self.record_store.get(path_name, guid)
+            if json_data is not None and fields is None:
+                record = resource_cls(self, json_data)
+                if self.cache is not None:
+                    self.cache.set(path_name, guid, record)
+                return record
+        if json_data is not None:
+            return resource_cls(self, project_fields(json_data, fields))
         url = self._url_for('/v1/{}/{}'.format(path_name, guid))
-        resp = requests.get(url, **self._auth_args())
+        if fields is not None:
+            url += '?' + urllib.urlencode(dict(fields=','.join(fields)))
+        resp = self._request(
+            method_name, 'GET', url,
+            url_template='/v1/{}/{{guid}}'.format(path_name),
+            **self._auth_args()
+        )
         self._check_response(method_name, resp)
-        return Company(self, resp.json())
+        if fields is not None:
+            return resource_cls(self, project_fields(resp.json(), fields))
+        record = resource_cls(self, resp.json())
+        self._cache_record(path_name, record)
+        return record
+
+    def get_many(self, resource_type, guids, max_workers=None):
+        """Find records of given resource type (the name of a get method
+        without `get_` prefix, e.g. `customer`) concurrently, return a dict
+        maps each distinct guid to a :class:`BatchResult`, the error of result
+        will be a NotFoundError if there is no such record
 
-    def get_company(self, guid):
+        """
+        get_method = getattr(self, 'get_' + resource_type)
+        distinct_guids = []
+        seen = set()
+        for guid in guids:
+            if guid not in seen:
+                seen.add(guid)
+                distinct_guids.append(guid)
+        results = self._run_batch(get_method, distinct_guids, max_workers)
+        return dict((result.request, result) for result in results)
+
+    def get_company(self, guid, fields=None):
         """Find a company and return, if no such company exist,
         NotFoundError will be raised
 
@@ -479,9 +2338,11 @@ class BillyAPI(object):
             guid=guid,
             path_name='companies',
             method_name='get_company',
+            resource_cls=Company,
+            fields=fields,
         )
 
-    def get_customer(self, guid):
+    def get_customer(self, guid, fields=None):
         """Find a customer and return, if no such customer exist,
         NotFoundError will be raised
 
@@ -490,13 +2351,15 @@ class BillyAPI(object):
             guid=guid,
             path_name='customers',
             method_name='get_customer',
+            resource_cls=Customer,
+            fields=fields,
         )
 
-    def list_customers(self, processor_uri=None):
+    def list_customers(self, processor_uri=None, page_size=None, fields=None):
         """List customers
 
         """
-        kwargs = {}
+        kwargs = dict(page_size=page_size, fields=fields)
         if processor_uri:
             kwargs['extra_query'] = dict(processor_uri=processor_uri)
         return Page(
@@ -506,7 +2369,7 @@ class BillyAPI(object):
             **kwargs
         )
 
-    def get_plan(self, guid):
+    def get_plan(self, guid, fields=None):
         """Find a plan and return, if no such plan exist,
         NotFoundError will be raised
 
@@ -515,9 +2378,11 @@ class BillyAPI(object):
             guid=guid,
             path_name='plans',
             method_name='get_plans',
+            resource_cls=Plan,
+            fields=fields,
         )
 
-    def list_plans(self):
+    def list_plans(self, page_size=None, fields=None):
         """List plans
 
         """
@@ -525,9 +2390,11 @@ class BillyAPI(object):
             api=self,
             url=self._url_for('/v1/plans'),
             resource_cls=Plan,
+            page_size=page_size,
+            fields=fields,
         )
 
-    def get_subscription(self, guid):
+    def get_subscription(self, guid, fields=None):
         """Find a subscription and return, if no such subscription exist,
         NotFoundError will be raised
 
@@ -536,9 +2403,11 @@ class BillyAPI(object):
             guid=guid,
             path_name='subscriptions',
             method_name='get_subscriptions',
+            resource_cls=Subscription,
+            fields=fields,
         )
 
-    def list_subscriptions(self):
+    def list_subscriptions(self, page_size=None, fields=None):
         """List subscriptions
 
         """
@@ -546,9 +2415,11 @@ class BillyAPI(object):
             api=self,
             url=self._url_for('/v1/subscriptions'),
             resource_cls=Subscription,
+            page_size=page_size,
+            fields=fields,
         )
 
-    def get_invoice(self, guid):
+    def get_invoice(self, guid, fields=None):
         """Find an invoice and return, if no such invoice exist,
         NotFoundError will be raised
 
@@ -557,13 +2428,15 @@ class BillyAPI(object):
             guid=guid,
             path_name='invoices',
             method_name='get_invoice',
+            resource_cls=Invoice,
+            fields=fields,
         )
 
-    def list_invoices(self, external_id=None):
+    def list_invoices(self, external_id=None, page_size=None, fields=None):
         """List invoices
 
         """
-        kwargs = {}
+        kwargs = dict(page_size=page_size, fields=fields)
         if external_id:
             kwargs['extra_query'] = dict(external_id=external_id)
         return Page(
@@ -573,7 +2446,7 @@ class BillyAPI(object):
             **kwargs
         )
 
-    def get_transaction(self, guid):
+    def get_transaction(self, guid, fields=None):
         """Find a transaction and return, if no such transaction exist,
         NotFoundError will be raised
 
@@ -582,9 +2455,11 @@ class BillyAPI(object):
             guid=guid,
             path_name='transactions',
             method_name='get_transactions',
+            resource_cls=Transaction,
+            fields=fields,
         )
 
-    def list_transactions(self):
+    def list_transactions(self, page_size=None, fields=None):
         """List transactions
 
         """
@@ -592,4 +2467,6 @@ class BillyAPI(object):
             api=self,
             url=self._url_for('/v1/transactions'),
             resource_cls=Transaction,
+            page_size=page_size,
+            fields=fields,
         )
@@ -0,0 +1,219 @@
+from __future__ import unicode_literals
+import collections
+import functools
+import logging
+import types
+
+from concurrent import futures
+
+from .api import BillyAPI
+from .api import Page
+from .api import Resource
+
+
+class AsyncResource(object):
+    """Asynchronous proxy of a resource, attributes are read from the wrapped
+    resource directly, and methods are executed by the executor of the
+    :class:`AsyncBillyAPI`, they return a :class:`concurrent.futures.Future`
+    instead of blocking
+
+    Lazy references (such as `invoice.customer`) are read from the wrapped
+    resource as well, so accessing attributes of an unloaded reference still
+    fetches it in the calling thread, prefetch them with
+    :meth:`billy_client.api.Page.prefetch` to avoid that
+
+    """
+
+    def __init__(self, async_api, resource):
+        self.async_api = async_api
+        self.resource = resource
+
+    def __unicode__(self):
+        return str(self)
+
+    def __str__(self):
+        return repr(self)
+
+    def __repr__(self):
+        return '<Async{!r}>'.format(self.resource)
+
+    def __getattr__(self, key):
+        value = getattr(self.resource, key)
+        if key.startswith('_') or not callable(value):
+            return value
+        return self.async_api._async_method(key, value)
+
+
+class AsyncWindow(
+    collections.namedtuple('AsyncWindow', ['items', 'next_offset'])
+):
+    """Records of one page fetched by :meth:`AsyncPage.fetch_window`, items
+    is the list of :class:`AsyncResource`, and next_offset is the offset of
+    the following page, it's None when this page is empty, which means the
+    end of records
+
+    """
+
+
+class AsyncPage(object):
+    """Asynchronous version of :class:`billy_client.api.Page`, records could
+    be fetched all at once by :meth:`all`, or page by page by
+    :meth:`windows`, which only keeps the pages not consumed yet in memory
+
+    """
+
+    def __init__(self, async_api, page):
+        self.async_api = async_api
+        self.page = page
+
+    def _wrap_items(self, json_data):
+        return [
+            self.async_api._wrap(resource)
+            for resource in self.page._make_resources(json_data['items'])
+        ]
+
+    def fetch(self, offset=None, limit=None):
+        """Fetch records in the window of given offset and limit, return a
+        future of the list of :class:`AsyncResource`
+
+        """
+        def fetch():
+            json_data = self.page._fetch(offset=offset, limit=limit)
+            return self._wrap_items(json_data)
+        return self.async_api.executor.submit(fetch)
+
+    def fetch_window(self, offset=None, limit=None):
+        """Fetch the page at given offset, return a future of
+        :class:`AsyncWindow` with the offset of the next page. The page size
+        of the page is used if limit is None
+
+        """
+        if limit is None:
+            limit = self.page._page_limit()
+
+        def fetch():
+            json_data = self.page._fetch(offset=offset, limit=limit)
+            items = self._wrap_items(json_data)
+            next_offset = None
+            if items:
+                next_offset = json_data['offset'] + json_data['limit']
+            return AsyncWindow(items, next_offset)
+        return self.async_api.executor.submit(fetch)
+
+    def windows(self):
+        """Iterate over futures of :class:`AsyncWindow` page by page, the
+        next page is requested with the next_offset of the previous one once
+        the consumer asks for it, the last window is empty
+
+        """
+        future = self.fetch_window()
+        while True:
+            yield future
+            window = future.result()
+            if window.next_offset is None:
+                break
+            future = self.fetch_window(
+                window.next_offset,
+                self.page._page_limit(),
+            )
+
+    def all(self):
+        """Fetch all records of this page, return a future of the list of
+        :class:`AsyncResource`
+
+        """
+        def fetch_all():
+            return [self.async_api._wrap(record) for record in self.page]
+        return self.async_api.executor.submit(fetch_all)
+
+
+class AsyncBillyAPI(object):
+    """Asynchronous version of :class:`billy_client.api.BillyAPI`, it mirrors
+    all the public methods of BillyAPI, but each of them returns a
+    :class:`concurrent.futures.Future` immediately (except `list_*` methods,
+    which return :class:`AsyncPage`). Requests are executed by a
+    bounded executor and share the connection pool of the underlying BillyAPI.
+    To use it with asyncio, wrap returned futures with `asyncio.wrap_future`
+
+    """
+
+    #: Default maximum number of requests in flight
+    DEFAULT_MAX_WORKERS = 10
+
+    def __init__(
+        self,
+        api_key,
+        endpoint=BillyAPI.DEFAULT_ENDPOINT,
+        logger=None,
+        max_workers=DEFAULT_MAX_WORKERS,
+        executor=None,
+        **kwargs
+    ):
+        self.logger = logger or logging.getLogger(__name__)
+        kwargs.setdefault('pool_maxsize', max_workers)
+        self.api = BillyAPI(
+            api_key,
+            endpoint=endpoint,
+            logger=self.logger,
+            **kwargs
+        )
+        self._own_executor = executor is None
+        if executor is None:
+            executor = futures.ThreadPoolExecutor(max_workers=max_workers)
+        self.executor = executor
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __getattr__(self, key):
+        value = getattr(self.api, key)
+        if key.startswith('_') or not callable(value):
+            return value
+        return self._async_method(key, value)
+
+    def close(self):
+        """Wait for pending requests, then release the executor and the
+        connection pool
+
+        """
+        if self._own_executor:
+            self.executor.shutdown(wait=True)
+        self.api.close()
+
+    def _wrap(self, value):
+        """Wrap a result returned by the blocking API, generators (such as the
+        one of `create_invoices`) are consumed into lists, so that their
+        requests are done in the executor instead of the thread iterating them
+
+        """
+        if isinstance(value, types.GeneratorType):
+            return list(value)
+        if isinstance(value, Resource):
+            return AsyncResource(self, value)
+        if isinstance(value, Page):
+            return AsyncPage(self, value)
+        return value
+
+    def _async_method(self, name, func):
+        """Make an asynchronous version of given blocking method, `list_*`
+        methods don't do any request by themselves, so they are called
+        directly and return an :class:`AsyncPage`
+
+        """
+        if name.startswith('list_'):
+            def list_method(*args, **kwargs):
+                return self._wrap(func(*args, **kwargs))
+            return list_method
+        return functools.partial(self._submit, func)
+
+    def _submit(self, func, *args, **kwargs):
+        """Execute given blocking function in the executor and return a future
+        of its wrapped result
+
+        """
+        def call():
+            return self._wrap(func(*args, **kwargs))
+        return self.executor.submit(call)
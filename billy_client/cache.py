@@ -0,0 +1,87 @@
+from __future__ import unicode_literals
+import collections
+import threading
+import time
+
+
+class ResourceCache(object):
+    """In-process cache of resources keyed by resource type and guid, entries
+    expire after the TTL of their resource type, and the least recently used
+    entries are evicted when there are more than max_size of them
+
+    The resource type is the path name of the resource in the API, such as
+    `plans` or `companies`. A TTL of zero or None disables caching of that
+    resource type
+
+    """
+
+    #: Default maximum number of cached resources
+    DEFAULT_MAX_SIZE = 1000
+    #: Default time to live in seconds
+    DEFAULT_TTL = 60
+
+    def __init__(
+        self,
+        max_size=DEFAULT_MAX_SIZE,
+        default_ttl=DEFAULT_TTL,
+        ttls=None,
+        clock=time.time,
+    ):
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self.ttls = ttls or {}
+        self.clock = clock
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _ttl_for(self, resource_type):
+        return self.ttls.get(resource_type, self.default_ttl)
+
+    def get(self, resource_type, guid):
+        """Get a cached resource, None will be returned if there is no such
+        resource in cache or it is expired
+
+        """
+        key = (resource_type, guid)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            expires_at, resource = entry
+            if expires_at <= self.clock():
+                return None
+            # re-insert it to mark it as the most recently used
+            self._entries[key] = entry
+            return resource
+
+    def set(self, resource_type, guid, resource):
+        """Put a resource into cache
+
+        """
+        ttl = self._ttl_for(resource_type)
+        if not ttl:
+            return
+        key = (resource_type, guid)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (self.clock() + ttl, resource)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, resource_type=None, guid=None):
+        """Remove a cached resource, or all resources of given type if guid
+        is None, or everything if resource_type is also None
+
+        """
+        with self._lock:
+            if resource_type is None:
+                self._entries.clear()
+            elif guid is not None:
+                self._entries.pop((resource_type, guid), None)
+            else:
+                for key in list(self._entries):
+                    if key[0] == resource_type:
+                        del self._entries[key]
@@ -0,0 +1,135 @@
+from __future__ import unicode_literals
+import collections
+import csv
+import gzip
+import io
+import json
+import time
+
+from .api import project_fields
+
+
+class ExportStats(
+    collections.namedtuple(
+        'ExportStats',
+        ['rows', 'bytes', 'elapsed', 'next_offset'],
+    )
+):
+    """Progress of an export, rows and bytes are the numbers of rows and
+    (uncompressed) bytes written so far, elapsed is in seconds, and
+    next_offset is the offset of the next page to export, which can be
+    passed to :func:`export_page` to resume an interrupted export
+
+    """
+
+    @property
+    def rows_per_second(self):
+        if not self.elapsed:
+            return 0
+        return self.rows / self.elapsed
+
+
+def _csv_value(value):
+    """Encode a JSON value as a CSV cell, nested values are encoded as JSON
+
+    """
+    if value is None:
+        return b''
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value, sort_keys=True)
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return bytes(value)
+
+
+def _encode_ndjson(items, fields):
+    for item in items:
+        if fields is not None:
+            item = project_fields(item, fields)
+        yield (json.dumps(item, sort_keys=True) + '\n').encode('utf-8')
+
+
+def _encode_csv(items, fields):
+    buf = io.BytesIO()
+    writer = csv.writer(buf)
+    for item in items:
+        writer.writerow([_csv_value(item.get(key)) for key in fields])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+
+
+def export_page(
+    page,
+    path,
+    format='ndjson',
+    fields=None,
+    compress=None,
+    offset=None,
+    buffer_size=64 * 1024,
+    progress=None,
+):
+    """Export records of a :class:`billy_client.api.Page` to a file at path
+    as NDJSON (format `ndjson`) or CSV (format `csv`), and return the final
+    :class:`ExportStats`
+
+    Records are written page by page straight from decoded pages, encoded
+    rows are buffered up to buffer_size bytes before writing, so memory
+    usage doesn't grow with the number of records. The file is flushed at the
+    end of each page, and then progress is called with the
+    :class:`ExportStats` if it's given
+
+    fields are the fields to export, all fields of the records by default for
+    NDJSON, and the declared fields of the resource for CSV. When compress is
+    True, the file is written with gzip, if it's None, it's compressed when
+    path ends with `.gz`. When offset is given, records are exported from that
+    offset and appended to the file (without the CSV header), so that an
+    interrupted export can be resumed with the next_offset of its last
+    reported stats
+
+    """
+    if fields is None:
+        fields = page.fields
+    if format == 'ndjson':
+        encode = _encode_ndjson
+    elif format == 'csv':
+        encode = _encode_csv
+        if fields is None:
+            fields = [field.name for field in page.resource_cls.FIELDS]
+    else:
+        raise ValueError('Unknown export format {!r}'.format(format))
+    if compress is None:
+        compress = path.endswith('.gz')
+    mode = 'wb' if offset is None else 'ab'
+    open_file = gzip.open if compress else io.open
+
+    begin = time.time()
+    rows = 0
+    written = 0
+    next_offset = offset or 0
+    with open_file(path, mode) as file_obj:
+        if format == 'csv' and offset is None:
+            header = list(encode([dict(zip(fields, fields))], fields))[0]
+            file_obj.write(header)
+            written += len(header)
+        for json_data in page.iter_pages(offset):
+            chunks = []
+            size = 0
+            for chunk in encode(json_data['items'], fields):
+                chunks.append(chunk)
+                size += len(chunk)
+                rows += 1
+                if size >= buffer_size:
+                    file_obj.write(b''.join(chunks))
+                    written += size
+                    chunks = []
+                    size = 0
+            file_obj.write(b''.join(chunks))
+            written += size
+            file_obj.flush()
+            next_offset = json_data['offset'] + json_data['limit']
+            if progress is not None:
+                progress(ExportStats(
+                    rows, written, time.time() - begin, next_offset,
+                ))
+    return ExportStats(rows, written, time.time() - begin, next_offset)
@@ -0,0 +1,207 @@
+from __future__ import unicode_literals
+import bisect
+import collections
+import copy
+import threading
+
+
+class Histogram(object):
+    """Histogram of observed values with upper bounds of buckets in buckets,
+    values greater than the last bound are counted in an extra bucket
+
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        """Estimate the value at given percent (0 to 100) of observed values
+        by linear interpolation within the bucket, None if there is no value
+
+        """
+        if not self.count:
+            return None
+        rank = percent / 100.0 * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if not count or cumulative + count < rank:
+                cumulative += count
+                continue
+            lower = self.buckets[i - 1] if i > 0 else 0.0
+            if i == len(self.buckets):
+                upper = self.max
+            else:
+                upper = min(self.buckets[i], self.max)
+            return lower + (upper - lower) * (rank - cumulative) / count
+        return self.max
+
+
+class OperationMetrics(object):
+    """Metrics of requests of one operation
+
+    """
+
+    def __init__(self, buckets):
+        self.requests = 0
+        #: number of responses by status code
+        self.status_codes = collections.Counter()
+        #: number of requests failed without a response
+        self.errors = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        #: :class:`Histogram` of latency in seconds
+        self.latency = Histogram(buckets)
+
+
+class MetricsRegistry(object):
+    """In-process registry of request metrics by operation name (such as
+    `invoice`, `subscribe` or `list_invoices`), it's thread-safe and could
+    be shared by multiple API objects
+
+    """
+
+    #: Default upper bounds of latency buckets in seconds
+    DEFAULT_BUCKETS = (
+        0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+    )
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._operations = {}
+        self._lock = threading.Lock()
+
+    def observe(self, operation, status_code, latency, bytes_out=0, bytes_in=0):
+        """Record a request of operation, status_code is None if the request
+        failed without a response
+
+        """
+        with self._lock:
+            metrics = self._operations.get(operation)
+            if metrics is None:
+                metrics = OperationMetrics(self.buckets)
+                self._operations[operation] = metrics
+            metrics.requests += 1
+            if status_code is None:
+                metrics.errors += 1
+            else:
+                metrics.status_codes[status_code] += 1
+            metrics.bytes_out += bytes_out
+            metrics.bytes_in += bytes_in
+            metrics.latency.observe(latency)
+
+    def snapshot(self):
+        """Get a copy of current metrics as a dict maps operation names to
+        :class:`OperationMetrics`
+
+        """
+        with self._lock:
+            return copy.deepcopy(self._operations)
+
+    def percentile(self, operation, percent):
+        """Estimate the latency of operation at given percent, None if there
+        is no request of the operation
+
+        """
+        with self._lock:
+            metrics = self._operations.get(operation)
+            if metrics is None:
+                return None
+            return metrics.latency.percentile(percent)
+
+    def reset(self):
+        """Remove all recorded metrics
+
+        """
+        with self._lock:
+            self._operations.clear()
+
+    def to_prometheus(self, prefix='billy_client'):
+        """Export metrics in Prometheus text exposition format
+
+        """
+        operations = sorted(self.snapshot().iteritems())
+        lines = []
+
+        def header(name, metric_type, help_text):
+            lines.append('# HELP {}_{} {}'.format(prefix, name, help_text))
+            lines.append('# TYPE {}_{} {}'.format(prefix, name, metric_type))
+
+        def sample(name, labels, value):
+            lines.append('{}_{}{{{}}} {}'.format(
+                prefix,
+                name,
+                ','.join('{}="{}"'.format(*label) for label in labels),
+                value,
+            ))
+
+        header('requests_total', 'counter', 'Number of responses')
+        for operation, metrics in operations:
+            for code, count in sorted(metrics.status_codes.iteritems()):
+                sample(
+                    'requests_total',
+                    [('operation', operation), ('code', code)],
+                    count,
+                )
+        header(
+            'request_errors_total',
+            'counter',
+            'Number of requests failed without a response',
+        )
+        for operation, metrics in operations:
+            sample(
+                'request_errors_total',
+                [('operation', operation)],
+                metrics.errors,
+            )
+        header('request_bytes_total', 'counter', 'Bytes of request bodies')
+        for operation, metrics in operations:
+            sample(
+                'request_bytes_total',
+                [('operation', operation)],
+                metrics.bytes_out,
+            )
+        header('response_bytes_total', 'counter', 'Bytes of response bodies')
+        for operation, metrics in operations:
+            sample(
+                'response_bytes_total',
+                [('operation', operation)],
+                metrics.bytes_in,
+            )
+        header(
+            'request_duration_seconds',
+            'histogram',
+            'Latency of requests in seconds',
+        )
+        for operation, metrics in operations:
+            histogram = metrics.latency
+            cumulative = 0
+            bounds = [repr(float(bound)) for bound in histogram.buckets] + ['+Inf']
+            for bound, count in zip(bounds, histogram.counts):
+                cumulative += count
+                sample(
+                    'request_duration_seconds_bucket',
+                    [('operation', operation), ('le', bound)],
+                    cumulative,
+                )
+            sample(
+                'request_duration_seconds_sum',
+                [('operation', operation)],
+                repr(histogram.sum),
+            )
+            sample(
+                'request_duration_seconds_count',
+                [('operation', operation)],
+                histogram.count,
+            )
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,248 @@
+from __future__ import unicode_literals
+import json
+import time
+
+from .api import Company
+from .api import Customer
+from .api import Plan
+from .api import Subscription
+from .api import Invoice
+from .api import Transaction
+from .store import SQLiteStore
+
+
+class Mirror(SQLiteStore):
+    """Local SQLite mirror of records of a company, records are keyed by the
+    path name of their resource type in the API (such as `invoices`) and
+    guid, so that reads can be served from local disk instead of scanning
+    the API
+
+    Collections are synced by :meth:`sync`. The first sync of a collection
+    scans it page by page, and the offset of the next page is checkpointed
+    after each page, so an interrupted scan resumes where it stopped. The
+    server lists records from the newest, so later syncs only fetch pages
+    from the head of the collection until a page without any changed record,
+    and then refresh older mirrored records which are not in a final status
+    yet, since they are the only old records could still change. They are
+    re-fetched in batches of :attr:`REFRESH_BATCH_SIZE`, or the rest of the
+    collection is scanned again if it takes fewer requests
+
+    Only invoices, transactions (or other collections with final statuses)
+    and subscriptions are refreshed. Customers and plans have no status, so
+    catching up only picks up new ones, changes of older ones (such as being
+    deleted) are picked up by a full sync
+
+    A mirror is for the company of one API key, as collections are listed
+    with the key
+
+    """
+
+    #: Collections to sync by default, in the order of syncing
+    COLLECTIONS = (
+        'customers',
+        'plans',
+        'subscriptions',
+        'invoices',
+        'transactions',
+    )
+    #: Resource classes by path name
+    RESOURCE_CLASSES = dict(
+        companies=Company,
+        customers=Customer,
+        plans=Plan,
+        subscriptions=Subscription,
+        invoices=Invoice,
+        transactions=Transaction,
+    )
+    #: Statements creating tables of the mirror
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS records ('
+        'path_name TEXT NOT NULL, '
+        'guid TEXT NOT NULL, '
+        'final INTEGER NOT NULL, '
+        'data TEXT NOT NULL, '
+        'PRIMARY KEY (path_name, guid))',
+        'CREATE TABLE IF NOT EXISTS checkpoints ('
+        'path_name TEXT NOT NULL PRIMARY KEY, '
+        'next_offset INTEGER NOT NULL, '
+        'complete INTEGER NOT NULL, '
+        'synced_at REAL)',
+    )
+    #: Number of records re-fetched at a time when catching up
+    REFRESH_BATCH_SIZE = 100
+
+    def is_final(self, path_name, json_data):
+        """Determine whether given record is in a final status, a canceled
+        subscription is final as well
+
+        """
+        if path_name == 'subscriptions':
+            return bool(json_data.get('canceled'))
+        return super(Mirror, self).is_final(path_name, json_data)
+
+    def has_statuses(self, path_name):
+        """Determine whether records of given path name have a status which
+        could still change, only those are refreshed when catching up
+
+        """
+        return path_name == 'subscriptions' or path_name in self.final_statuses
+
+    def resources(self, path_name, api=None, batch_size=500):
+        """Iterate over mirrored records of given path name as resource
+        objects, api is used for loading their references on demand
+
+        """
+        resource_cls = self.RESOURCE_CLASSES[path_name]
+        for json_data in self.iter_records(path_name, batch_size=batch_size):
+            yield resource_cls(api, json_data)
+
+    def checkpoint(self, path_name):
+        """Get checkpoint of given collection as a tuple of the offset of the
+        next page and whether the last scan is complete, None if the
+        collection was never synced
+
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT next_offset, complete FROM checkpoints '
+                'WHERE path_name = ?',
+                (path_name, ),
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], bool(row[1])
+
+    def _save_checkpoint(self, path_name, next_offset, complete):
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO checkpoints '
+                '(path_name, next_offset, complete, synced_at) '
+                'VALUES (?, ?, ?, ?)',
+                (path_name, next_offset, int(complete), time.time()),
+            )
+
+    def put_many(self, path_name, items, batch_size=500):
+        """Insert or update JSON data of records, return number of records
+        which are new or different from the mirrored ones
+
+        """
+        rows = {}
+        for json_data in items:
+            rows[json_data['guid']] = (
+                int(self.is_final(path_name, json_data)),
+                json.dumps(json_data, sort_keys=True),
+            )
+        guids = list(rows)
+        changed = 0
+        for begin in range(0, len(guids), batch_size):
+            batch = guids[begin:begin + batch_size]
+            with self._lock, self._conn:
+                existing = dict(self._conn.execute(
+                    'SELECT guid, data FROM records '
+                    'WHERE path_name = ? AND guid IN ({})'
+                    .format(', '.join('?' * len(batch))),
+                    [path_name] + batch,
+                ).fetchall())
+                changed_rows = [
+                    (path_name, guid) + rows[guid]
+                    for guid in batch
+                    if existing.get(guid) != rows[guid][1]
+                ]
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO records '
+                    '(path_name, guid, final, data) VALUES (?, ?, ?, ?)',
+                    changed_rows,
+                )
+            changed += len(changed_rows)
+        return changed
+
+    def _mutable_guids(self, path_name):
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT guid FROM records WHERE path_name = ? AND final = 0 '
+                'ORDER BY guid',
+                (path_name, ),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def sync(self, api, path_names=None, page_size=None, full=False):
+        """Sync given collections (all of :attr:`COLLECTIONS` by default)
+        from the company of api, return a dict maps each path name to the
+        number of records changed. When full is True, collections are scanned
+        all over again instead of catching up incrementally
+
+        """
+        if path_names is None:
+            path_names = self.COLLECTIONS
+        changes = {}
+        for path_name in path_names:
+            changes[path_name] = self._sync_collection(
+                api, path_name, page_size, full,
+            )
+        return changes
+
+    def _sync_collection(self, api, path_name, page_size, full):
+        page = getattr(api, 'list_' + path_name)(page_size=page_size)
+        checkpoint = self.checkpoint(path_name)
+        catch_up = False
+        offset = 0
+        if checkpoint is not None and not full:
+            offset, complete = checkpoint
+            catch_up = complete
+            if complete:
+                offset = 0
+        changed = 0
+        limit = None
+        fetched_guids = set()
+        for json_data in page.iter_pages(offset):
+            page_changed = self.put_many(path_name, json_data['items'])
+            changed += page_changed
+            offset = json_data['offset'] + json_data['limit']
+            limit = json_data['limit']
+            if catch_up:
+                fetched_guids.update(
+                    item['guid'] for item in json_data['items']
+                )
+                # the rest of collection are older records we already have
+                if not page_changed:
+                    break
+            else:
+                self._save_checkpoint(path_name, offset, complete=False)
+        if catch_up and limit and self.has_statuses(path_name):
+            changed += self._refresh(
+                api, page, path_name, offset, limit, fetched_guids,
+            )
+        self._save_checkpoint(path_name, 0, complete=True)
+        return changed
+
+    def _refresh(self, api, page, path_name, offset, limit, fetched_guids):
+        """Refresh mirrored records which are not final and not fetched from
+        the head of collection yet, return number of changed records
+
+        """
+        guids = [
+            guid for guid in self._mutable_guids(path_name)
+            if guid not in fetched_guids
+        ]
+        if not guids:
+            return 0
+        # pages from offset to the end, plus the empty one ends the scan
+        remaining = max(self.count(path_name) - offset, 0)
+        pages = (remaining + limit - 1) // limit + 1
+        changed = 0
+        if pages < len(guids):
+            for json_data in page.iter_pages(offset):
+                changed += self.put_many(path_name, json_data['items'])
+            return changed
+        resource_type = self.RESOURCE_CLASSES[path_name].__name__.lower()
+        for begin in range(0, len(guids), self.REFRESH_BATCH_SIZE):
+            batch = guids[begin:begin + self.REFRESH_BATCH_SIZE]
+            for guid in batch:
+                api.invalidate(path_name, guid)
+            results = api.get_many(resource_type, batch)
+            changed += self.put_many(path_name, [
+                result.value.json_data
+                for result in results.itervalues()
+                if result.error is None
+            ])
+        return changed
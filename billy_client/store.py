@@ -0,0 +1,162 @@
+from __future__ import unicode_literals
+import json
+import sqlite3
+import threading
+
+
+class SQLiteStore(object):
+    """Base of SQLite-backed stores of JSON data of records, records are keyed
+    by the path name of their resource type in the API and guid
+
+    """
+
+    #: Statuses of records which will not change anymore by resource type
+    DEFAULT_FINAL_STATUSES = dict(
+        invoices=['settled', 'canceled', 'failed', 'refunded'],
+        transactions=['done', 'succeeded', 'canceled', 'failed'],
+    )
+    #: Statements creating tables of the store
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS records ('
+        'path_name TEXT NOT NULL, '
+        'guid TEXT NOT NULL, '
+        'data TEXT NOT NULL, '
+        'PRIMARY KEY (path_name, guid))',
+    )
+
+    def __init__(self, path, final_statuses=None):
+        if final_statuses is None:
+            final_statuses = self.DEFAULT_FINAL_STATUSES
+        self.path = path
+        self.final_statuses = dict(
+            (path_name, set(statuses))
+            for path_name, statuses in final_statuses.iteritems()
+        )
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            for statement in self.SCHEMA:
+                self._conn.execute(statement)
+
+    def close(self):
+        """Close the database
+
+        """
+        with self._lock:
+            self._conn.close()
+
+    def is_final(self, path_name, json_data):
+        """Determine whether given record is in a final status
+
+        """
+        statuses = self.final_statuses.get(path_name)
+        if not statuses:
+            return False
+        return json_data.get('status') in statuses
+
+    def get(self, path_name, guid):
+        """Get JSON data of a stored record, None if there is no such record
+
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT data FROM records WHERE path_name = ? AND guid = ?',
+                (path_name, guid),
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def count(self, path_name):
+        """Get number of stored records of given path name
+
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT COUNT(*) FROM records WHERE path_name = ?',
+                (path_name, ),
+            ).fetchone()
+        return row[0]
+
+    def iter_records(self, path_name, batch_size=500):
+        """Iterate over JSON data of all stored records of given path name in
+        guid order, records are loaded batch_size at a time
+
+        """
+        last_guid = ''
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    'SELECT guid, data FROM records '
+                    'WHERE path_name = ? AND guid > ? '
+                    'ORDER BY guid LIMIT ?',
+                    (path_name, last_guid, batch_size),
+                ).fetchall()
+            if not rows:
+                break
+            for _, data in rows:
+                yield json.loads(data)
+            last_guid = rows[-1][0]
+
+
+class RecordStore(SQLiteStore):
+    """Durable SQLite-backed store of finalized records, records in a final
+    status never change on the server, so once stored they can be served
+    from local disk across process restarts
+
+    Records are keyed by the path name of their resource type in the API
+    (`invoices` or `transactions`) and guid. A record is only stored when its
+    status is one of the final statuses of its resource type, and a stored
+    record is removed again if it is put with a non-final status
+
+    """
+
+    def accepts(self, path_name):
+        """Determine whether records of given path name could be stored
+
+        """
+        return path_name in self.final_statuses
+
+    def put(self, path_name, json_data):
+        """Store the JSON data of a record if it is final, otherwise remove
+        the stale one if there is, return whether it is stored
+
+        """
+        return bool(self.put_many(path_name, [json_data]))
+
+    def put_many(self, path_name, items, batch_size=500):
+        """Store JSON data of records which are final, and remove stale ones
+        of records which are not final anymore in one transaction, return
+        number of stored records
+
+        """
+        if not self.accepts(path_name):
+            return 0
+        rows = []
+        stale_guids = []
+        for json_data in items:
+            if self.is_final(path_name, json_data):
+                rows.append(
+                    (path_name, json_data['guid'], json.dumps(json_data))
+                )
+            else:
+                stale_guids.append(json_data['guid'])
+        if not rows and not stale_guids:
+            return 0
+        with self._lock, self._conn:
+            if rows:
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO records (path_name, guid, data) '
+                    'VALUES (?, ?, ?)',
+                    rows,
+                )
+            # records not stored are not touched by the delete, it only
+            # removes stored copies which became stale
+            for begin in range(0, len(stale_guids), batch_size):
+                batch = stale_guids[begin:begin + batch_size]
+                self._conn.execute(
+                    'DELETE FROM records WHERE path_name = ? AND guid IN ({})'
+                    .format(', '.join('?' * len(batch))),
+                    [path_name] + batch,
+                )
+        return len(rows)
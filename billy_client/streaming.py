@@ -0,0 +1,108 @@
+from __future__ import unicode_literals
+import codecs
+import json
+
+WHITESPACE = ' \t\n\r'
+
+
+class _Reader(object):
+    """Buffer of decoded text from chunks of bytes, consumed text is dropped
+    so that only the value being parsed is kept in memory
+
+    """
+
+    def __init__(self, chunks, encoding):
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder(encoding)()
+        self.decode_json = json.JSONDecoder().raw_decode
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _read_more(self):
+        if self.eof:
+            return False
+        self.buffer = self.buffer[self.pos:]
+        self.pos = 0
+        for chunk in self.chunks:
+            text = self.decoder.decode(chunk)
+            if text:
+                self.buffer += text
+                return True
+        self.buffer += self.decoder.decode(b'', final=True)
+        self.eof = True
+        return True
+
+    def peek(self):
+        """Skip whitespaces and return the next character, empty string will
+        be returned at the end of input
+
+        """
+        while True:
+            while self.pos < len(self.buffer):
+                if self.buffer[self.pos] not in WHITESPACE:
+                    return self.buffer[self.pos]
+                self.pos += 1
+            if not self._read_more():
+                return ''
+
+    def expect(self, chars):
+        """Consume the next character, which has to be one of chars
+
+        """
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(
+                'Expected one of {!r} at {!r}'.format(chars, char or 'EOF')
+            )
+        self.pos += 1
+        return char
+
+    def value(self):
+        """Decode the next JSON value
+
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decode_json(self.buffer, self.pos)
+            except ValueError:
+                if not self._read_more():
+                    raise
+                continue
+            # a number could be cut at the end of buffer, a value is only
+            # complete when it's followed by another character
+            if end == len(self.buffer) and not self.eof:
+                self._read_more()
+                continue
+            self.pos = end
+            return value
+
+
+def iter_page_items(chunks, meta, encoding='utf-8', items_key='items'):
+    """Parse a JSON object of a page from chunks of bytes incrementally, and
+    yield elements of its items array as soon as each of them is parsed.
+    Other fields of the object (such as offset and limit) are put into meta
+
+    """
+    reader = _Reader(chunks, encoding)
+    reader.expect('{')
+    if reader.peek() == '}':
+        reader.expect('}')
+        return
+    while True:
+        key = reader.value()
+        reader.expect(':')
+        if key == items_key:
+            reader.expect('[')
+            if reader.peek() == ']':
+                reader.expect(']')
+            else:
+                while True:
+                    yield reader.value()
+                    if reader.expect(',]') == ']':
+                        break
+        else:
+            meta[key] = reader.value()
+        if reader.expect(',}') == '}':
+            break
@@ -0,0 +1,195 @@
+from __future__ import unicode_literals
+import datetime
+import decimal
+import time
+import unittest
+
+import mock
+
+from billy_client import BillyAPI
+from billy_client import Aggregation
+from billy_client.api import Invoice
+
+
+class TestAggregation(unittest.TestCase):
+
+    def setUp(self):
+        self.invoices = [
+            dict(
+                guid='IV1',
+                status='settled',
+                amount=1000,
+                created_at='2013-10-02T05:48:26.210843',
+            ),
+            dict(
+                guid='IV2',
+                status='settled',
+                amount='12.5',
+                created_at='2013-10-02T23:00:00',
+            ),
+            dict(
+                guid='IV3',
+                status='staged',
+                amount=500,
+                created_at='2013-10-03T01:00:00',
+            ),
+            dict(guid='IV4', status='staged', created_at=None),
+        ]
+
+    def make_one(self, *args, **kwargs):
+        return Aggregation(*args, **kwargs)
+
+    def test_group_by(self):
+        aggregation = self.make_one(
+            group_by=['status', 'created_at:day'],
+            metrics=dict(
+                total=('sum', 'amount'),
+                invoices=('count', None),
+                amounts=('count', 'amount'),
+                first=('min', 'guid'),
+                last=('max', 'guid'),
+            ),
+        )
+        result = aggregation.run(self.invoices)
+        self.assertEqual(len(result), 3)
+        self.assertEqual(result.rows(), [
+            {
+                'status': 'settled',
+                'created_at:day': datetime.date(2013, 10, 2),
+                'total': decimal.Decimal('1012.5'),
+                'invoices': 2,
+                'amounts': 2,
+                'first': 'IV1',
+                'last': 'IV2',
+            },
+            {
+                'status': 'staged',
+                'created_at:day': None,
+                'total': 0,
+                'invoices': 1,
+                'amounts': 0,
+                'first': 'IV4',
+                'last': 'IV4',
+            },
+            {
+                'status': 'staged',
+                'created_at:day': datetime.date(2013, 10, 3),
+                'total': 500,
+                'invoices': 1,
+                'amounts': 1,
+                'first': 'IV3',
+                'last': 'IV3',
+            },
+        ])
+
+    def test_min_max_amounts(self):
+        aggregation = self.make_one(
+            metrics=dict(
+                smallest=('min', 'amount'),
+                largest=('max', 'amount'),
+            ),
+        )
+        result = aggregation.run([
+            dict(guid='IV1', amount='100'),
+            dict(guid='IV2', amount='99'),
+            dict(guid='IV3', amount=150),
+        ])
+        self.assertEqual(result.rows(), [
+            dict(
+                smallest=decimal.Decimal('99'),
+                largest=150,
+            ),
+        ])
+
+    def test_resources(self):
+        aggregation = self.make_one(
+            group_by=['created_at:month'],
+            metrics=dict(total=('sum', 'amount'), latest=('max', 'created_at')),
+        )
+        result = aggregation.run(
+            Invoice(None, invoice) for invoice in self.invoices[:3]
+        )
+        self.assertEqual(result.rows(), [
+            {
+                'created_at:month': datetime.date(2013, 10, 1),
+                'total': decimal.Decimal('1512.5'),
+                'latest': datetime.datetime(2013, 10, 3, 1),
+            },
+        ])
+
+    def test_merge(self):
+        aggregation = self.make_one(
+            group_by=['status'],
+            metrics=dict(
+                total=('sum', 'amount'),
+                first=('min', 'created_at'),
+            ),
+        )
+        result = aggregation.run(self.invoices[:1])
+        result.merge(aggregation.run(self.invoices[1:]))
+        result.merge(aggregation.result())
+        self.assertEqual(
+            result.rows(),
+            aggregation.run(self.invoices).rows(),
+        )
+
+    @mock.patch('requests.Session.request')
+    def test_run_all_pages(self, request_method):
+        def request(method, url, **kwargs):
+            if 'offset' in url:
+                json_data = dict(offset=2, limit=2, items=[])
+            else:
+                json_data = dict(offset=0, limit=2, items=self.invoices[:2])
+            return mock.Mock(json=lambda: json_data, status_code=200)
+        request_method.side_effect = request
+        api = BillyAPI('MOCK_API_KEY', endpoint='http://localhost')
+        aggregation = self.make_one(metrics=dict(total=('sum', 'amount')))
+        result = aggregation.run_all([
+            api.list_invoices(),
+            api.list_transactions(),
+        ])
+        self.assertEqual(
+            result.rows(),
+            [dict(total=decimal.Decimal('2025'))],
+        )
+
+    def test_run_all_error(self):
+        finished = []
+
+        def failing():
+            raise RuntimeError('Boom')
+            yield
+
+        def slow(name):
+            time.sleep(0.05)
+            yield dict(guid=name)
+            finished.append(name)
+
+        aggregation = self.make_one()
+        with self.assertRaises(RuntimeError):
+            aggregation.run_all([failing(), slow('running')], max_workers=2)
+        # the running source is not left running in background
+        self.assertEqual(finished, ['running'])
+
+    def test_time_buckets(self):
+        value = '2013-10-02T05:48:26.210843'
+        buckets = {}
+        for unit in Aggregation.BUCKET_UNITS:
+            key = 'created_at:' + unit
+            aggregation = self.make_one(group_by=[key])
+            buckets[unit] = aggregation.run([dict(created_at=value)]).rows()[0][key]
+        self.assertEqual(buckets, dict(
+            hour=datetime.datetime(2013, 10, 2, 5),
+            day=datetime.date(2013, 10, 2),
+            week=datetime.date(2013, 9, 30),
+            month=datetime.date(2013, 10, 1),
+            year=datetime.date(2013, 1, 1),
+        ))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            self.make_one(group_by=['created_at:minute'])
+        with self.assertRaises(ValueError):
+            self.make_one(metrics=dict(total=('avg', 'amount')))
+        with self.assertRaises(ValueError):
+            self.make_one(metrics=dict(total=('sum', None)))
@@ -1,6 +1,7 @@
 from __future__ import unicode_literals
 import unittest
 import datetime
+import threading
 import urlparse
 
 import mock
@@ -37,13 +38,74 @@ class TestResource(unittest.TestCase):
         with self.assertRaises(AttributeError):
             print(res.no_such_thing)
 
+    def test_resource_no_such_declared_attr(self):
+        invoice = Invoice(None, dict(guid='MOCK_GUID'))
+        with self.assertRaises(AttributeError):
+            print(invoice.customer_guid)
+        with self.assertRaises(AttributeError):
+            print(invoice.created_at)
+
+    def test_typed_resource(self):
+        import decimal
+        json_data = dict(
+            guid='MOCK_GUID',
+            amount='12.34',
+            effective_amount=1000,
+            created_at='2013-10-02T05:48:26.210843',
+            updated_at='2013-10-02T05:48:26Z',
+            scheduled_at=None,
+            new_field='value',
+        )
+        invoice = Invoice(None, json_data)
+        self.assertFalse(hasattr(invoice, '__dict__'))
+        self.assertEqual(invoice.guid, 'MOCK_GUID')
+        self.assertEqual(invoice.amount, decimal.Decimal('12.34'))
+        self.assertEqual(invoice.effective_amount, 1000)
+        self.assertEqual(
+            invoice.created_at,
+            datetime.datetime(2013, 10, 2, 5, 48, 26, 210843),
+        )
+        self.assertEqual(
+            invoice.updated_at,
+            datetime.datetime(2013, 10, 2, 5, 48, 26),
+        )
+        self.assertIs(invoice.created_at, invoice.created_at)
+        self.assertEqual(invoice.scheduled_at, None)
+        self.assertEqual(invoice.new_field, 'value')
+        self.assertEqual(invoice.json_data, json_data)
+
 
 class TestAPI(unittest.TestCase):
 
     def make_one(self, *args, **kwargs):
         return BillyAPI(*args, **kwargs)
 
-    @mock.patch('requests.post')
+    def test_connection_pool(self):
+        api = self.make_one(
+            None,
+            endpoint='http://localhost',
+            pool_connections=3,
+            pool_maxsize=7,
+            pool_block=True,
+        )
+        for prefix in ['http://', 'https://']:
+            adapter = api.session.get_adapter(prefix + 'localhost')
+            self.assertEqual(adapter._pool_connections, 3)
+            self.assertEqual(adapter._pool_maxsize, 7)
+            self.assertEqual(adapter._pool_block, True)
+        self.assertNotEqual(api.session.headers.get('Connection'), 'close')
+
+    def test_no_keep_alive(self):
+        api = self.make_one(None, keep_alive=False)
+        self.assertEqual(api.session.headers['Connection'], 'close')
+
+    @mock.patch('requests.Session.close')
+    def test_close_with_context_manager(self, close_method):
+        with self.make_one(None) as api:
+            self.assertIsInstance(api, BillyAPI)
+        close_method.assert_called_once_with()
+
+    @mock.patch('requests.Session.request')
     def test_billy_error(self, post_method):
         mock_company_data = dict(guid='MOCK_COMPANY_GUID')
         post_method.return_value = mock.Mock(
@@ -56,7 +118,7 @@ class TestAPI(unittest.TestCase):
         with self.assertRaises(BillyError):
             api.create_company('MOCK_PROCESSOR_KEY')
 
-    @mock.patch('requests.post')
+    @mock.patch('requests.Session.request')
     def test_create_company(self, post_method):
         mock_company_data = dict(
             guid='MOCK_COMPANY_GUID',
@@ -74,11 +136,12 @@ class TestAPI(unittest.TestCase):
         self.assertEqual(company.api, api)
         self.assertEqual(company.api.api_key, 'MOCK_API_KEY')
         post_method.assert_called_once_with(
+            'POST',
             'http://localhost/v1/companies',
             data=dict(processor_key='MOCK_PROCESSOR_KEY'),
         )
 
-    @mock.patch('requests.get')
+    @mock.patch('requests.Session.request')
     def _test_get_record(self, get_method, method_name, path_name):
         mock_record_data = dict(guid='MOCK_GUID')
         mock_response = mock.Mock(
@@ -94,11 +157,12 @@ class TestAPI(unittest.TestCase):
         self.assertEqual(record.guid, 'MOCK_GUID')
         self.assertEqual(record.api, api)
         get_method.assert_called_once_with(
+            'GET',
             'http://localhost/v1/{}/MOCK_GUID'.format(path_name),
             auth=('MOCK_API_KEY', '')
         )
 
-    @mock.patch('requests.get')
+    @mock.patch('requests.Session.request')
     def _test_get_record_not_found(self, get_method, method_name, path_name):
         mock_record_data = dict(
             guid='MOCK_GUID',
@@ -116,6 +180,7 @@ class TestAPI(unittest.TestCase):
             method('MOCK_GUID')
 
         get_method.assert_called_once_with(
+            'GET',
             'http://localhost/v1/{}/MOCK_GUID'.format(path_name),
             auth=('MOCK_API_KEY', '')
         )
@@ -138,6 +203,19 @@ class TestAPI(unittest.TestCase):
             path_name='customers',
         )
 
+    @mock.patch('requests.Session.request')
+    def test_get_record_type(self, get_method):
+        get_method.return_value = mock.Mock(
+            json=lambda: dict(guid='MOCK_GUID'),
+            status_code=200,
+        )
+        api = self.make_one('MOCK_API_KEY', endpoint='http://localhost')
+        self.assertIsInstance(api.get_company('MOCK_GUID'), Company)
+        self.assertIsInstance(api.get_customer('MOCK_GUID'), Customer)
+        self.assertIsInstance(api.get_plan('MOCK_GUID'), Plan)
+        self.assertIsInstance(api.get_subscription('MOCK_GUID'), Subscription)
+        self.assertIsInstance(api.get_invoice('MOCK_GUID'), Invoice)
+
     def test_get_customer_not_found(self):
         self._test_get_record_not_found(
             method_name='get_customer',
@@ -192,7 +270,38 @@ class TestAPI(unittest.TestCase):
             path_name='transactions',
         )
 
-    @mock.patch('requests.post')
+    @mock.patch('requests.Session.request')
+    def test_get_many(self, get_method):
+        # call_count of mock is not thread-safe, count calls under a lock
+        lock = threading.Lock()
+        calls = []
+
+        def request(method, url, **kwargs):
+            with lock:
+                calls.append(url)
+            guid = url.rsplit('/', 1)[1]
+            if guid == 'MOCK_MISSING_GUID':
+                return mock.Mock(status_code=404, content='Not found')
+            return mock.Mock(json=lambda: dict(guid=guid), status_code=200)
+        get_method.side_effect = request
+
+        api = self.make_one('MOCK_API_KEY', endpoint='http://localhost')
+        guids = ['MOCK_GUID1', 'MOCK_MISSING_GUID', 'MOCK_GUID2', 'MOCK_GUID1']
+        results = api.get_many('customer', guids, max_workers=2)
+
+        self.assertEqual(
+            set(results),
+            set(['MOCK_GUID1', 'MOCK_GUID2', 'MOCK_MISSING_GUID']),
+        )
+        for guid in ['MOCK_GUID1', 'MOCK_GUID2']:
+            self.assertIsInstance(results[guid].value, Customer)
+            self.assertEqual(results[guid].value.guid, guid)
+            self.assertEqual(results[guid].error, None)
+        self.assertEqual(results['MOCK_MISSING_GUID'].value, None)
+        self.assertIsInstance(results['MOCK_MISSING_GUID'].error, NotFoundError)
+        self.assertEqual(len(calls), 3)
+
+    @mock.patch('requests.Session.request')
     def test_create_customer(self, post_method):
         api = self.make_one('MOCK_API_KEY', endpoint='http://localhost')
         company = Company(api, dict(guid='MOCK_COMPANY_GUID'))
@@ -209,12 +318,13 @@ class TestAPI(unittest.TestCase):
 
         self.assertEqual(customer.guid, 'CUMOCK_CUSTOMER')
         post_method.assert_called_once_with(
+            'POST',
             'http://localhost/v1/customers',
             data=dict(processor_uri='MOCK_BALANCED_CUSTOMER_URI'),
             auth=('MOCK_API_KEY', '')
         )
 
-    @mock.patch('requests.post')
+    @mock.patch('requests.Session.request')
     def test_create_plan(self, post_method):
         api = self.make_one('MOCK_API_KEY', endpoint='http://localhost')
         company = Company(api, dict(guid='MOCK_COMPANY_GUID'))
@@ -234,6 +344,7 @@ class TestAPI(unittest.TestCase):
 
         self.assertEqual(plan.guid, 'MOCK_PLAN_GUID')
         post_method.assert_called_once_with(
+            'POST',
             'http://localhost/v1/plans',
             data=dict(
                 plan_type=Plan.TYPE_DEBIT,
@@ -244,7 +355,7 @@ class TestAPI(unittest.TestCase):
             auth=('MOCK_API_KEY', ''),
         )
 
-    @mock.patch('requests.post')
+    @mock.patch('requests.Session.request')
     def test_subscribe(self, post_method):
         api = self.make_one('MOCK_API_KEY', endpoint='http://localhost')
         customer = Customer(api, dict(guid='MOCK_CUSTOMER_GUID'))
@@ -267,6 +378,7 @@ class TestAPI(unittest.TestCase):
         self.assertEqual(subscription.guid, 'MOCK_SUBSCRIPTION_GUID')
        
         post_method.assert_called_once_with(
+            'POST',
             'http://localhost/v1/subscriptions',
             data=dict(
                 plan_guid='MOCK_PLAN_GUID',
@@ -279,7 +391,7 @@ class TestAPI(unittest.TestCase):
             auth=('MOCK_API_KEY', ''),
         )
 
-    @mock.patch('requests.post')
+    @mock.patch('requests.Session.request')
     def test_cancel_subscription(self, post_method):
         api = self.make_one('MOCK_API_KEY', endpoint='http://localhost')
         subscription = Subscription(api, dict(guid='MOCK_SUBSCRIPTION_GUID'))
@@ -298,12 +410,13 @@ class TestAPI(unittest.TestCase):
         self.assertEqual(subscription.guid, 'MOCK_SUBSCRIPTION_GUID')
         self.assertEqual(subscription.canceled, True)
         post_method.assert_called_once_with(
+            'POST',
             'http://localhost/v1/subscriptions/{}/cancel'
             .format('MOCK_SUBSCRIPTION_GUID'),
             auth=('MOCK_API_KEY', ''),
         )
 
-    @mock.patch('requests.post')
+    @mock.patch('requests.Session.request')
     def test_invoice(self, post_method):
         api = self.make_one('MOCK_API_KEY', endpoint='http://localhost')
         customer = Customer(api, dict(guid='MOCK_CUSTOMER_GUID'))
@@ -334,6 +447,7 @@ class TestAPI(unittest.TestCase):
 
         self.assertEqual(invoice.guid, 'MOCK_INVOICE_GUID')
         post_method.assert_called_once_with(
+            'POST',
             'http://localhost/v1/invoices',
             data=dict(
                 customer_guid='MOCK_CUSTOMER_GUID',
@@ -361,7 +475,7 @@ class TestAPI(unittest.TestCase):
             auth=('MOCK_API_KEY', ''),
         )
 
-    @mock.patch('requests.post')
+    @mock.patch('requests.Session.request')
     def test_refund_invoice(self, post_method):
         api = self.make_one('MOCK_API_KEY', endpoint='http://localhost')
         invoice = Invoice(api, dict(guid='MOCK_INVOICE_GUID'))
@@ -376,13 +490,14 @@ class TestAPI(unittest.TestCase):
 
         self.assertEqual(invoice.guid, 'MOCK_INVOICE_GUID')
         post_method.assert_called_once_with(
+            'POST',
             'http://localhost/v1/invoices/{}/refund'
             .format('MOCK_INVOICE_GUID'),
             data=dict(amount=999),
             auth=('MOCK_API_KEY', ''),
         )
 
-    @mock.patch('requests.post')
+    @mock.patch('requests.Session.request')
     def test_invoice_with_duplicate_external_id(self, post_method):
         api = self.make_one('MOCK_API_KEY', endpoint='http://localhost')
         customer = Customer(api, dict(guid='MOCK_CUSTOMER_GUID'))
@@ -403,7 +518,58 @@ class TestAPI(unittest.TestCase):
                 external_id='duplaite one',
             )
 
-    @mock.patch('requests.get')
+    @mock.patch('requests.Session.request')
+    def test_create_invoices(self, request_method):
+        import requests
+        # call_count of mock is not thread-safe, count calls under a lock
+        lock = threading.Lock()
+        calls = []
+
+        def request(method, url, data, **kwargs):
+            with lock:
+                calls.append(data)
+            if data['customer_guid'] == 'MOCK_OFFLINE_GUID':
+                raise requests.ConnectionError('Boom')
+            if data['customer_guid'] == 'MOCK_DUPLICATE_GUID':
+                return mock.Mock(status_code=409, content='Duplicate')
+            if data['customer_guid'] == 'MOCK_BROKEN_GUID':
+                return mock.Mock(status_code=500, content='Error')
+            invoice = dict(
+                guid='MOCK_INVOICE_' + data['customer_guid'],
+                amount=data['amount'],
+            )
+            return mock.Mock(json=lambda: invoice, status_code=200)
+        request_method.side_effect = request
+
+        api = self.make_one('MOCK_API_KEY', endpoint='http://localhost')
+        specs = [
+            dict(customer_guid='MOCK_GUID{}'.format(i), amount=i)
+            for i in range(20)
+        ]
+        specs[3] = dict(
+            customer_guid='MOCK_DUPLICATE_GUID',
+            amount=3,
+            external_id='MOCK_EXTERNAL_ID',
+        )
+        specs[7] = dict(customer_guid='MOCK_BROKEN_GUID', amount=7)
+        specs[11] = dict(customer_guid='MOCK_OFFLINE_GUID', amount=11)
+        results = list(api.create_invoices(iter(specs), max_workers=4))
+
+        self.assertEqual([r.request for r in results], specs)
+        self.assertIsInstance(results[3].error, DuplicateExternalIDError)
+        self.assertEqual(results[3].value, None)
+        self.assertIsInstance(results[7].error, BillyError)
+        self.assertIsInstance(results[11].error, requests.ConnectionError)
+        self.assertEqual(results[11].value, None)
+        for i, result in enumerate(results):
+            if i in (3, 7, 11):
+                continue
+            self.assertEqual(result.error, None)
+            self.assertEqual(result.value.guid, 'MOCK_INVOICE_MOCK_GUID{}'.format(i))
+            self.assertEqual(result.value.amount, i)
+        self.assertEqual(len(calls), 20)
+
+    @mock.patch('requests.Session.request')
     def _test_list_records(
         self,
         get_method,
@@ -460,14 +626,14 @@ class TestAPI(unittest.TestCase):
         ])
         # ensure url
         call_urls = [
-            args[0].split('?')[0]
+            args[1].split('?')[0]
             for args, _ in get_method.call_args_list
         ]
         self.assertEqual(call_urls, [resource_url] * 4)
         # ensure query
         qs_list = []
         for args, _ in get_method.call_args_list:
-            o = urlparse.urlparse(args[0])
+            o = urlparse.urlparse(args[1])
             query = urlparse.parse_qs(o.query)
             # flatten all values
             for k, v in query.iteritems():
@@ -487,7 +653,7 @@ class TestAPI(unittest.TestCase):
         call_auths = [kwargs['auth'] for _, kwargs in get_method.call_args_list]
         self.assertEqual([('MOCK_API_KEY', '')] * 4, call_auths)
 
-    @mock.patch('requests.get')
+    @mock.patch('requests.Session.request')
     def _test_list_records_under_resource(
         self,
         get_method,
@@ -546,7 +712,7 @@ class TestAPI(unittest.TestCase):
         ])
         # ensure url
         call_urls = [
-            args[0].split('?')[0]
+            args[1].split('?')[0]
             for args, _ in get_method.call_args_list
         ]
         expected_url = resource_url.format('MOCK_RESOURCE_GUID')
@@ -554,7 +720,7 @@ class TestAPI(unittest.TestCase):
         # ensure query
         qs_list = []
         for args, _ in get_method.call_args_list:
-            o = urlparse.urlparse(args[0])
+            o = urlparse.urlparse(args[1])
             query = urlparse.parse_qs(o.query)
             # flatten all values
             for k, v in query.iteritems():
@@ -675,3 +841,1244 @@ class TestAPI(unittest.TestCase):
             method_name='list_transactions',
             resource_url='http://localhost/v1/invoices/{}/transactions',
         )
+
+
+class TestPage(unittest.TestCase):
+
+    def make_one(self, *args, **kwargs):
+        from billy_client.api import Page
+        return Page(*args, **kwargs)
+
+    def _mock_records(self, request_method, total, server_limit=2):
+        """Make the mocked server return records MOCK_RECORD_GUID0 to
+        MOCK_RECORD_GUID<total - 1> according to the requested window
+
+        """
+        def request(method, url, **kwargs):
+            o = urlparse.urlparse(url)
+            query = urlparse.parse_qs(o.query)
+            offset = int(query.get('offset', ['0'])[0])
+            limit = int(query.get('limit', [server_limit])[0])
+            items = [
+                dict(guid='MOCK_RECORD_GUID{}'.format(i))
+                for i in range(offset, min(offset + limit, total))
+            ]
+            return mock.Mock(
+                json=lambda: dict(offset=offset, limit=limit, items=items),
+                status_code=200,
+                content='x' * 10 * len(items),
+            )
+        request_method.side_effect = request
+
+    def _called_offsets(self, request_method):
+        offsets = []
+        for args, _ in request_method.call_args_list:
+            query = urlparse.parse_qs(urlparse.urlparse(args[1]).query)
+            offsets.append(int(query.get('offset', ['0'])[0]))
+        return sorted(offsets)
+
+    @mock.patch('requests.Session.request')
+    def test_prefetch(self, request_method):
+        self._mock_records(request_method, total=7)
+        api = BillyAPI('MOCK_API_KEY', endpoint='http://localhost')
+        page = self.make_one(
+            api=api,
+            url='http://localhost/v1/invoices',
+            resource_cls=Invoice,
+            prefetch_depth=3,
+        )
+        self.assertEqual(
+            [record.guid for record in page],
+            ['MOCK_RECORD_GUID{}'.format(i) for i in range(7)],
+        )
+        self.assertEqual(
+            self._called_offsets(request_method)[:5],
+            [0, 2, 4, 6, 8],
+        )
+
+    @mock.patch('requests.Session.request')
+    def test_prefetch_depth_from_api(self, request_method):
+        self._mock_records(request_method, total=0)
+        api = BillyAPI(
+            'MOCK_API_KEY',
+            endpoint='http://localhost',
+            prefetch_depth=2,
+        )
+        page = api.list_invoices()
+        self.assertEqual(page.prefetch_depth, 2)
+        self.assertEqual(list(page), [])
+        self.assertEqual(request_method.call_count, 1)
+
+    @mock.patch('requests.Session.request')
+    def test_prefetch_stop_early(self, request_method):
+        self._mock_records(request_method, total=100)
+        api = BillyAPI('MOCK_API_KEY', endpoint='http://localhost')
+        page = self.make_one(
+            api=api,
+            url='http://localhost/v1/invoices',
+            resource_cls=Invoice,
+            prefetch_depth=1,
+        )
+        records = iter(page)
+        self.assertEqual(next(records).guid, 'MOCK_RECORD_GUID0')
+        records.close()
+        self.assertLessEqual(request_method.call_count, 2)
+
+    @mock.patch('requests.Session.request')
+    def test_scan_ordered(self, request_method):
+        self._mock_records(request_method, total=11)
+        api = BillyAPI('MOCK_API_KEY', endpoint='http://localhost')
+        page = self.make_one(
+            api=api,
+            url='http://localhost/v1/transactions',
+            resource_cls=Invoice,
+        )
+        records = page.scan(max_workers=3)
+        self.assertEqual(
+            [record.guid for record in records],
+            ['MOCK_RECORD_GUID{}'.format(i) for i in range(11)],
+        )
+
+    @mock.patch('requests.Session.request')
+    def test_scan_slow_head_window(self, request_method):
+        self._mock_records(request_method, total=100)
+        serve = request_method.side_effect
+        lock = threading.Lock()
+        offsets = []
+        overflow = threading.Event()
+        requested_while_slow = []
+
+        def request(method, url, **kwargs):
+            query = urlparse.parse_qs(urlparse.urlparse(url).query)
+            offset = int(query.get('offset', ['0'])[0])
+            with lock:
+                offsets.append(offset)
+                if len(offsets) > 5:
+                    overflow.set()
+            if offset == 2:
+                # the head window is slow, others complete meanwhile
+                overflow.wait(0.2)
+                with lock:
+                    requested_while_slow.append(len(offsets))
+            return serve(method, url, **kwargs)
+        request_method.side_effect = request
+        api = BillyAPI('MOCK_API_KEY', endpoint='http://localhost')
+        page = self.make_one(
+            api=api,
+            url='http://localhost/v1/transactions',
+            resource_cls=Invoice,
+        )
+        records = page.scan(max_workers=4)
+        self.assertEqual(
+            [record.guid for record in records],
+            ['MOCK_RECORD_GUID{}'.format(i) for i in range(100)],
+        )
+        # the first window, the slow one and 3 buffered behind it
+        self.assertEqual(requested_while_slow, [5])
+
+    @mock.patch('requests.Session.request')
+    def test_scan_as_completed(self, request_method):
+        self._mock_records(request_method, total=11)
+        api = BillyAPI('MOCK_API_KEY', endpoint='http://localhost')
+        page = self.make_one(
+            api=api,
+            url='http://localhost/v1/transactions',
+            resource_cls=Invoice,
+        )
+        records = page.scan(max_workers=4, ordered=False)
+        self.assertEqual(
+            sorted(record.guid for record in records),
+            sorted('MOCK_RECORD_GUID{}'.format(i) for i in range(11)),
+        )
+
+    @mock.patch('requests.Session.request')
+    def test_scan_empty(self, request_method):
+        self._mock_records(request_method, total=0)
+        api = BillyAPI('MOCK_API_KEY', endpoint='http://localhost')
+        page = self.make_one(
+            api=api,
+            url='http://localhost/v1/transactions',
+            resource_cls=Invoice,
+        )
+        self.assertEqual(list(page.scan()), [])
+        self.assertEqual(request_method.call_count, 1)
+
+    @mock.patch('requests.Session.request')
+    def test_page_size(self, request_method):
+        self._mock_records(request_method, total=7)
+        api = BillyAPI('MOCK_API_KEY', endpoint='http://localhost')
+        records = api.list_invoices(page_size=3)
+        self.assertEqual(
+            [record.guid for record in records],
+            ['MOCK_RECORD_GUID{}'.format(i) for i in range(7)],
+        )
+        qs_list = []
+        for args, _ in request_method.call_args_list:
+            query = urlparse.parse_qs(urlparse.urlparse(args[1]).query)
+            qs_list.append(dict((k, v[0]) for k, v in query.iteritems()))
+        self.assertEqual(qs_list, [
+            dict(limit='3'),
+            dict(offset='3', limit='3'),
+            dict(offset='6', limit='3'),
+            dict(offset='9', limit='3'),
+        ])
+
+    @mock.patch('requests.Session.request')
+    def test_adaptive_page_size(self, request_method):
+        from billy_client import AdaptivePageSize
+        self._mock_records(request_method, total=30)
+        api = BillyAPI('MOCK_API_KEY', endpoint='http://localhost')
+        page_size = AdaptivePageSize(initial=2, max_size=8)
+        customer = Customer(api, dict(guid='MOCK_CUSTOMER_GUID'))
+        records = customer.list_invoices(page_size=page_size)
+        self.assertEqual(
+            [record.guid for record in records],
+            ['MOCK_RECORD_GUID{}'.format(i) for i in range(30)],
+        )
+        limits = []
+        for args, _ in request_method.call_args_list:
+            query = urlparse.parse_qs(urlparse.urlparse(args[1]).query)
+            limits.append(int(query['limit'][0]))
+        self.assertEqual(limits, [2, 4, 8, 8, 8, 8])
+
+    def test_adaptive_page_size_shrink(self):
+        from billy_client import AdaptivePageSize
+        page_size = AdaptivePageSize(initial=100, min_size=30)
+        page_size.observe(size=100, latency=2, content_length=10)
+        self.assertEqual(page_size.size, 50)
+        page_size.observe(size=50, latency=0.1, content_length=10 * 1024 * 1024)
+        self.assertEqual(page_size.size, 30)
+        page_size.observe(size=30, latency=0.7, content_length=10)
+        self.assertEqual(page_size.size, 30)
+
+    @mock.patch('requests.Session.request')
+    def test_stream(self, request_method):
+        import json
+
+        def request(method, url, **kwargs):
+            self.assertEqual(kwargs['stream'], True)
+            query = urlparse.parse_qs(urlparse.urlparse(url).query)
+            offset = int(query.get('offset', ['0'])[0])
+            items = [
+                dict(guid='MOCK_RECORD_GUID{}'.format(i))
+                for i in range(offset, min(offset + 2, 5))
+            ]
+            content = json.dumps(dict(items=items, offset=offset, limit=2))
+            return mock.Mock(
+                iter_content=lambda size: iter([content[:7], content[7:]]),
+                encoding='utf-8',
+                status_code=200,
+            )
+        request_method.side_effect = request
+
+        api = BillyAPI('MOCK_API_KEY', endpoint='http://localhost')
+        page = self.make_one(
+            api=api,
+            url='http://localhost/v1/invoices',
+            resource_cls=Invoice,
+            stream=True,
+        )
+        self.assertEqual(
+            [record.guid for record in page],
+            ['MOCK_RECORD_GUID{}'.format(i) for i in range(5)],
+        )
+        self.assertEqual(self._called_offsets(request_method), [0, 2, 4, 6])
+
+    def test_stream_from_api(self):
+        api = BillyAPI('MOCK_API_KEY', stream_pages=True)
+        self.assertEqual(api.list_invoices().stream, True)
+        self.assertEqual(BillyAPI('MOCK_API_KEY').list_invoices().stream, False)
+
+
+class TestRetry(unittest.TestCase):
+
+    def _mock_responses(self, request_method, responses):
+        """Make the mocked request return or raise given responses in order
+
+        """
+        def request(*args, **kwargs):
+            resp = responses.pop(0)
+            if isinstance(resp, Exception):
+                raise resp
+            return resp
+        request_method.side_effect = request
+
+    def make_one(self, *args, **kwargs):
+        from billy_client import RetryPolicy
+        self.sleeps = []
+        kwargs.setdefault('sleep', self.sleeps.append)
+        return BillyAPI(
+            'MOCK_API_KEY',
+            endpoint='http://localhost',
+            retry_policy=RetryPolicy(*args, **kwargs),
+        )
+
+    @mock.patch('requests.Session.request')
+    def test_retry_get(self, request_method):
+        import requests
+        unavailable = mock.Mock(status_code=503, content='Unavailable')
+        self._mock_responses(request_method, [
+            requests.ConnectionError('Connection reset'),
+            unavailable,
+            mock.Mock(json=lambda: dict(guid='MOCK_GUID'), status_code=200),
+        ])
+        api = self.make_one(max_attempts=3, backoff_factor=1)
+        customer = api.get_customer('MOCK_GUID')
+        self.assertEqual(customer.guid, 'MOCK_GUID')
+        self.assertEqual(request_method.call_count, 3)
+        unavailable.close.assert_called_once_with()
+        self.assertEqual(len(self.sleeps), 2)
+        self.assertTrue(0 <= self.sleeps[0] <= 1)
+        self.assertTrue(0 <= self.sleeps[1] <= 2)
+
+    @mock.patch('requests.Session.request')
+    def test_retry_exhausted(self, request_method):
+        request_method.return_value = mock.Mock(
+            status_code=502,
+            content='Bad gateway',
+        )
+        api = self.make_one(max_attempts=4)
+        with self.assertRaises(BillyError):
+            api.get_plan('MOCK_GUID')
+        self.assertEqual(request_method.call_count, 4)
+
+    @mock.patch('requests.Session.request')
+    def test_no_retry_for_non_retryable_status(self, request_method):
+        request_method.return_value = mock.Mock(
+            status_code=404,
+            content='Not found',
+        )
+        api = self.make_one()
+        with self.assertRaises(NotFoundError):
+            api.get_plan('MOCK_GUID')
+        self.assertEqual(request_method.call_count, 1)
+
+    @mock.patch('requests.Session.request')
+    def test_no_retry_post_without_external_id(self, request_method):
+        request_method.return_value = mock.Mock(
+            status_code=503,
+            content='Unavailable',
+        )
+        api = self.make_one()
+        customer = Customer(api, dict(guid='MOCK_CUSTOMER_GUID'))
+        with self.assertRaises(BillyError):
+            customer.invoice(amount=100)
+        self.assertEqual(request_method.call_count, 1)
+
+    @mock.patch('requests.Session.request')
+    def test_retry_invoice_created_by_earlier_attempt(self, request_method):
+        import requests
+        self._mock_responses(request_method, [
+            requests.Timeout('Read timed out'),
+            mock.Mock(status_code=409, content='Duplicate'),
+            mock.Mock(
+                json=lambda: dict(offset=0, limit=10, items=[
+                    dict(guid='MOCK_INVOICE_GUID', external_id='MOCK_ID'),
+                ]),
+                status_code=200,
+            ),
+        ])
+        api = self.make_one()
+        customer = Customer(api, dict(guid='MOCK_CUSTOMER_GUID'))
+        invoice = customer.invoice(amount=100, external_id='MOCK_ID')
+        self.assertIsInstance(invoice, Invoice)
+        self.assertEqual(invoice.guid, 'MOCK_INVOICE_GUID')
+        args, _ = request_method.call_args
+        self.assertEqual(args[0], 'GET')
+        self.assertEqual(
+            args[1].split('?')[0],
+            'http://localhost/v1/customers/MOCK_CUSTOMER_GUID/invoices',
+        )
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def make_one(self, *args, **kwargs):
+        from billy_client import CircuitBreaker
+        self.now = 0
+        kwargs.setdefault('clock', lambda: self.now)
+        self.breaker = CircuitBreaker(*args, **kwargs)
+        return BillyAPI(
+            'MOCK_API_KEY',
+            endpoint='http://localhost',
+            circuit_breaker=self.breaker,
+        )
+
+    @mock.patch('requests.Session.request')
+    def test_open_and_recover(self, request_method):
+        from billy_client import CircuitBreaker
+        from billy_client import CircuitOpenError
+        api = self.make_one(
+            failure_rate=0.5,
+            min_requests=4,
+            reset_timeout=30,
+        )
+        key = ('http://localhost', 'subscribe')
+        plan = Plan(api, dict(guid='MOCK_PLAN_GUID'))
+        request_method.return_value = mock.Mock(
+            status_code=503,
+            content='Unavailable',
+        )
+        for _ in range(4):
+            with self.assertRaises(BillyError):
+                plan.subscribe('MOCK_CUSTOMER_GUID')
+        self.assertEqual(self.breaker.state(key), CircuitBreaker.OPEN)
+
+        # fail fast without sending any request
+        with self.assertRaises(CircuitOpenError):
+            plan.subscribe('MOCK_CUSTOMER_GUID')
+        self.assertEqual(request_method.call_count, 4)
+        # other operations are not affected
+        self.assertEqual(
+            self.breaker.state(('http://localhost', 'cancel')),
+            CircuitBreaker.CLOSED,
+        )
+
+        # half-open trial request fails, open again
+        self.now = 30
+        with self.assertRaises(BillyError):
+            plan.subscribe('MOCK_CUSTOMER_GUID')
+        self.assertEqual(self.breaker.state(key), CircuitBreaker.OPEN)
+        self.assertEqual(request_method.call_count, 5)
+
+        # half-open trial request succeeds, closed
+        self.now = 60
+        request_method.return_value = mock.Mock(
+            json=lambda: dict(guid='MOCK_SUBSCRIPTION_GUID'),
+            status_code=200,
+        )
+        plan.subscribe('MOCK_CUSTOMER_GUID')
+        self.assertEqual(self.breaker.state(key), CircuitBreaker.CLOSED)
+
+    def test_half_open_limits_trials(self):
+        from billy_client import CircuitBreaker
+        from billy_client import CircuitOpenError
+        self.make_one(min_requests=1, half_open_requests=1)
+        self.breaker.before_request('key')
+        self.breaker.after_request('key', False)
+        self.now = 30
+        self.breaker.before_request('key')
+        self.assertEqual(self.breaker.state('key'), CircuitBreaker.HALF_OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_request('key')
+
+    def test_failure_rate_window(self):
+        from billy_client import CircuitBreaker
+        self.make_one(failure_rate=0.5, min_requests=4, window=10)
+        for success in [True, False, True]:
+            self.breaker.after_request('key', success)
+        self.now = 10
+        # previous window is dropped, so 1 failure in 2 requests doesn't
+        # reach min_requests
+        self.breaker.after_request('key', False)
+        self.breaker.after_request('key', True)
+        self.assertEqual(self.breaker.state('key'), CircuitBreaker.CLOSED)
+        self.breaker.after_request('key', False)
+        self.breaker.after_request('key', False)
+        self.assertEqual(self.breaker.state('key'), CircuitBreaker.OPEN)
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def make_one(self, *args, **kwargs):
+        from billy_client import RateLimiter
+        self.now = 0
+        self.sleeps = []
+
+        def sleep(seconds):
+            self.sleeps.append(seconds)
+            self.now += seconds
+
+        kwargs.setdefault('clock', lambda: self.now)
+        kwargs.setdefault('sleep', sleep)
+        return RateLimiter(*args, **kwargs)
+
+    def test_global_rate(self):
+        limiter = self.make_one(rate=2, burst=2)
+        for _ in range(4):
+            limiter.acquire('get_customer')
+        self.assertEqual(self.sleeps, [0.5, 0.5])
+
+    def test_refill(self):
+        limiter = self.make_one(rate=1, burst=1)
+        limiter.acquire('get_customer')
+        self.now += 5
+        limiter.acquire('get_customer')
+        self.assertEqual(self.sleeps, [])
+
+    def test_operation_rates(self):
+        limiter = self.make_one(operation_rates=dict(invoice=1, list=2))
+        limiter.acquire('invoice')
+        limiter.acquire('subscribe')
+        limiter.acquire('subscribe')
+        self.assertEqual(self.sleeps, [])
+        limiter.acquire('invoice')
+        self.assertEqual(self.sleeps, [1])
+        limiter.acquire('list_invoices')
+        limiter.acquire('list_transactions')
+        limiter.acquire('list_transactions')
+        self.assertEqual(self.sleeps, [1, 0.5])
+
+    @mock.patch('requests.Session.request')
+    def test_api_acquires(self, request_method):
+        request_method.return_value = mock.Mock(
+            json=lambda: dict(guid='MOCK_GUID'),
+            status_code=200,
+        )
+        limiter = mock.Mock()
+        api = BillyAPI(
+            'MOCK_API_KEY',
+            endpoint='http://localhost',
+            rate_limiter=limiter,
+        )
+        api.get_customer('MOCK_GUID')
+        limiter.acquire.assert_called_once_with('get_customer')
+
+
+class TestConcurrencyController(unittest.TestCase):
+
+    def make_one(self, *args, **kwargs):
+        from billy_client import ConcurrencyController
+        self.now = 0
+        kwargs.setdefault('clock', lambda: self.now)
+        return ConcurrencyController(*args, **kwargs)
+
+    def test_additive_increase(self):
+        controller = self.make_one(initial_limit=2, max_limit=4)
+        for _ in range(2):
+            controller.release(controller.acquire(), 200)
+        self.assertEqual(controller.limit, 3)
+        for _ in range(3):
+            controller.release(controller.acquire(), 200)
+        self.assertEqual(controller.limit, 4)
+        for _ in range(10):
+            controller.release(controller.acquire(), 200)
+        self.assertEqual(controller.limit, 4)
+        self.assertEqual(controller.in_flight, 0)
+
+    def test_multiplicative_decrease(self):
+        controller = self.make_one(initial_limit=16, min_limit=2)
+        started = [controller.acquire() for _ in range(3)]
+        self.now = 1
+        # requests sent before the decrease only cause one decrease
+        for started_at in started:
+            controller.release(started_at, 503)
+        self.assertGreater(controller.limit, 2)
+        controller.release(controller.acquire(), 429)
+        self.assertEqual(controller.limit, 4)
+        controller.release(controller.acquire(), None)
+        self.assertEqual(controller.limit, 2)
+        controller.release(controller.acquire(), 503)
+        self.assertEqual(controller.limit, 2)
+
+    def test_latency_spike(self):
+        controller = self.make_one(initial_limit=8, latency_tolerance=2)
+        started_at = controller.acquire()
+        self.now += 1
+        controller.release(started_at, 200)
+        self.assertGreater(controller.limit, 2)
+        started_at = controller.acquire()
+        self.now += 3
+        controller.release(started_at, 200)
+        self.assertEqual(controller.limit, 4)
+
+    def test_limit_in_flight(self):
+        import threading
+        controller = self.make_one(initial_limit=1)
+        controller.acquire()
+        acquired = threading.Event()
+
+        def acquire():
+            controller.acquire()
+            acquired.set()
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        self.assertFalse(acquired.wait(0.05))
+        controller.release(0, 200)
+        self.assertTrue(acquired.wait(1))
+        thread.join()
+
+    @mock.patch('requests.Session.request')
+    def test_api_bulk_operation(self, request_method):
+        request_method.return_value = mock.Mock(
+            json=lambda: dict(guid='MOCK_GUID'),
+            status_code=200,
+        )
+        controller = self.make_one(initial_limit=2, max_limit=8)
+        api = BillyAPI(
+            'MOCK_API_KEY',
+            endpoint='http://localhost',
+            concurrency_controller=controller,
+        )
+        self.assertEqual(api._max_workers(None), 8)
+        self.assertEqual(api._max_workers(3), 3)
+        guids = ['MOCK_GUID{}'.format(i) for i in range(20)]
+        results = api.get_many('invoice', guids)
+        self.assertEqual(len(results), 20)
+        self.assertEqual(controller.in_flight, 0)
+        self.assertGreater(controller.limit, 2)
+
+    def test_api_workers_capped_by_pool(self):
+        api = BillyAPI(
+            'MOCK_API_KEY',
+            endpoint='http://localhost',
+            concurrency_controller=self.make_one(max_limit=64),
+            pool_maxsize=16,
+        )
+        self.assertEqual(api._max_workers(None), 16)
+        api = BillyAPI(
+            'MOCK_API_KEY',
+            endpoint='http://localhost',
+            pool_maxsize=7,
+        )
+        self.assertEqual(api._max_workers(None), 7)
+
+
+class TestFieldProjection(unittest.TestCase):
+
+    FULL_RECORD = dict(
+        guid='MOCK_GUID',
+        amount=1000,
+        status='settled',
+        created_at='2013-10-02T05:48:26.210843',
+        title='MOCK_TITLE',
+        items=[dict(name='foo', amount=1000)],
+    )
+
+    def make_one(self, *args, **kwargs):
+        return BillyAPI('MOCK_API_KEY', endpoint='http://localhost', **kwargs)
+
+    @mock.patch('requests.Session.request')
+    def test_get_record(self, request_method):
+        request_method.return_value = mock.Mock(
+            json=lambda: self.FULL_RECORD,
+            status_code=200,
+        )
+        api = self.make_one()
+        invoice = api.get_invoice('MOCK_GUID', fields=['guid', 'amount'])
+        self.assertEqual(invoice.json_data, dict(guid='MOCK_GUID', amount=1000))
+        with self.assertRaises(AttributeError):
+            print(invoice.title)
+        request_method.assert_called_once_with(
+            'GET',
+            'http://localhost/v1/invoices/MOCK_GUID?fields=guid%2Camount',
+            auth=('MOCK_API_KEY', ''),
+        )
+
+    @mock.patch('requests.Session.request')
+    def test_get_record_from_cache(self, request_method):
+        from billy_client import ResourceCache
+        request_method.return_value = mock.Mock(
+            json=lambda: self.FULL_RECORD,
+            status_code=200,
+        )
+        api = self.make_one(cache=ResourceCache())
+        api.get_invoice('MOCK_GUID', fields=['guid'])
+        self.assertEqual(len(api.cache), 0)
+        api.get_invoice('MOCK_GUID')
+        invoice = api.get_invoice('MOCK_GUID', fields=['guid', 'status'])
+        self.assertEqual(
+            invoice.json_data,
+            dict(guid='MOCK_GUID', status='settled'),
+        )
+        self.assertEqual(request_method.call_count, 2)
+
+    @mock.patch('requests.Session.request')
+    def test_list_records(self, request_method):
+        result = [
+            dict(offset=0, limit=10, items=[self.FULL_RECORD]),
+            dict(offset=10, limit=10, items=[]),
+        ]
+        request_method.return_value = mock.Mock(
+            json=lambda: result.pop(0),
+            status_code=200,
+        )
+        api = self.make_one()
+        fields = ['guid', 'amount', 'created_at']
+        invoices = list(api.list_invoices(fields=fields))
+        self.assertEqual(len(invoices), 1)
+        self.assertEqual(
+            invoices[0].created_at,
+            datetime.datetime(2013, 10, 2, 5, 48, 26, 210843),
+        )
+        self.assertEqual(
+            set(invoices[0].json_data),
+            set(['guid', 'amount', 'created_at']),
+        )
+        args, _ = request_method.call_args_list[0]
+        query = urlparse.parse_qs(urlparse.urlparse(args[1]).query)
+        self.assertEqual(query['fields'], ['guid,amount,created_at'])
+
+    @mock.patch('requests.Session.request')
+    def test_list_tuples(self, request_method):
+        result = [
+            dict(offset=0, limit=10, items=[self.FULL_RECORD]),
+            dict(offset=10, limit=10, items=[]),
+        ]
+        request_method.return_value = mock.Mock(
+            json=lambda: result.pop(0),
+            status_code=200,
+        )
+        api = self.make_one()
+        customer = Customer(api, dict(guid='MOCK_CUSTOMER_GUID'))
+        page = customer.list_invoices(fields=['guid', 'status', 'missing'])
+        rows = list(page.tuples())
+        self.assertEqual(rows, [('MOCK_GUID', 'settled', None)])
+        self.assertEqual(rows[0].status, 'settled')
+        with self.assertRaises(ValueError):
+            api.list_invoices().tuples()
+
+
+class TestReference(unittest.TestCase):
+
+    def make_one(self, *args, **kwargs):
+        return BillyAPI('MOCK_API_KEY', endpoint='http://localhost', **kwargs)
+
+    @mock.patch('requests.Session.request')
+    def test_lazy_load(self, request_method):
+        request_method.return_value = mock.Mock(
+            json=lambda: dict(guid='MOCK_CUSTOMER_GUID', processor_uri='URI'),
+            status_code=200,
+        )
+        api = self.make_one()
+        invoice = Invoice(api, dict(
+            guid='MOCK_INVOICE_GUID',
+            customer_guid='MOCK_CUSTOMER_GUID',
+        ))
+        customer = invoice.customer
+        self.assertIs(invoice.customer, customer)
+        self.assertEqual(customer.guid, 'MOCK_CUSTOMER_GUID')
+        self.assertFalse(customer.loaded)
+        self.assertEqual(request_method.call_count, 0)
+
+        self.assertEqual(customer.processor_uri, 'URI')
+        self.assertTrue(customer.loaded)
+        self.assertIsInstance(customer.load(), Customer)
+        self.assertEqual(customer.processor_uri, 'URI')
+        request_method.assert_called_once_with(
+            'GET',
+            'http://localhost/v1/customers/MOCK_CUSTOMER_GUID',
+            auth=('MOCK_API_KEY', ''),
+        )
+
+    def test_no_guid(self):
+        api = self.make_one()
+        invoice = Invoice(api, dict(guid='MOCK_INVOICE_GUID'))
+        self.assertEqual(invoice.subscription, None)
+        invoice = Invoice(api, dict(
+            guid='MOCK_INVOICE_GUID',
+            subscription_guid=None,
+        ))
+        self.assertEqual(invoice.subscription, None)
+
+    def test_references(self):
+        from billy_client.api import Transaction
+        api = self.make_one()
+        subscription = Subscription(api, dict(
+            plan_guid='MOCK_PLAN_GUID',
+            customer_guid='MOCK_CUSTOMER_GUID',
+        ))
+        self.assertEqual(subscription.plan.resource_type, 'plan')
+        self.assertEqual(subscription.plan.guid, 'MOCK_PLAN_GUID')
+        self.assertEqual(subscription.customer.resource_type, 'customer')
+        transaction = Transaction(api, dict(invoice_guid='MOCK_INVOICE_GUID'))
+        self.assertEqual(transaction.invoice.resource_type, 'invoice')
+        self.assertEqual(transaction.invoice.guid, 'MOCK_INVOICE_GUID')
+        customer = Customer(api, dict(company_guid='MOCK_COMPANY_GUID'))
+        self.assertEqual(customer.company.resource_type, 'company')
+
+
+class TestPrefetchReferences(unittest.TestCase):
+
+    def make_one(self, *args, **kwargs):
+        return BillyAPI('MOCK_API_KEY', endpoint='http://localhost', **kwargs)
+
+    def _mock_request(self, request_method, invoices):
+        def request(method, url, **kwargs):
+            if '/v1/invoices' in url:
+                query = urlparse.parse_qs(urlparse.urlparse(url).query)
+                offset = int(query.get('offset', ['0'])[0])
+                return mock.Mock(
+                    json=lambda: dict(
+                        items=invoices[offset:],
+                        offset=offset,
+                        limit=len(invoices),
+                    ),
+                    status_code=200,
+                )
+            guid = url.rsplit('/', 1)[-1]
+            if guid == 'MISSING':
+                return mock.Mock(
+                    json=lambda: dict(),
+                    status_code=404,
+                    content='not found',
+                )
+            return mock.Mock(
+                json=lambda: dict(guid=guid, processor_uri='URI'),
+                status_code=200,
+            )
+        request_method.side_effect = request
+
+    @mock.patch('requests.Session.request')
+    def test_prefetch(self, request_method):
+        invoices = [
+            dict(guid='IV1', customer_guid='CU1'),
+            dict(guid='IV2', customer_guid='CU2'),
+            dict(guid='IV3', customer_guid='CU1'),
+            dict(guid='IV4', customer_guid=None),
+        ]
+        self._mock_request(request_method, invoices)
+        api = self.make_one()
+        page = api.list_invoices().prefetch('customer')
+        records = list(page)
+        self.assertEqual(
+            [record.guid for record in records],
+            ['IV1', 'IV2', 'IV3', 'IV4'],
+        )
+        urls = sorted(
+            call[0][1] for call in request_method.call_args_list
+            if '/v1/customers' in call[0][1]
+        )
+        self.assertEqual(urls, [
+            'http://localhost/v1/customers/CU1',
+            'http://localhost/v1/customers/CU2',
+        ])
+        count = request_method.call_count
+        self.assertIsInstance(records[0].customer, Customer)
+        self.assertEqual(records[0].customer.processor_uri, 'URI')
+        self.assertIs(records[0].customer, records[2].customer)
+        self.assertEqual(records[1].customer.guid, 'CU2')
+        self.assertEqual(records[3].customer, None)
+        self.assertEqual(request_method.call_count, count)
+
+    @mock.patch('requests.Session.request')
+    def test_prefetch_missing(self, request_method):
+        invoices = [dict(guid='IV1', customer_guid='MISSING')]
+        self._mock_request(request_method, invoices)
+        api = self.make_one()
+        records = list(api.list_invoices().prefetch('customer'))
+        self.assertFalse(records[0].customer.loaded)
+        self.assertEqual(records[0].customer.guid, 'MISSING')
+
+    def test_prefetch_unknown_reference(self):
+        api = self.make_one()
+        with self.assertRaises(ValueError):
+            api.list_invoices().prefetch('plan')
+
+
+class TestCustomerGraph(unittest.TestCase):
+
+    def make_one(self, *args, **kwargs):
+        return BillyAPI('MOCK_API_KEY', endpoint='http://localhost', **kwargs)
+
+    def _mock_server(self, request_method):
+        subscriptions = [
+            dict(guid='SU1', customer_guid='CU1', plan_guid='PL1'),
+        ]
+        invoices = [
+            dict(guid='IV1', customer_guid='CU1', subscription_guid='SU1'),
+            dict(guid='IV2', customer_guid='CU1', subscription_guid=None),
+        ]
+        transactions = [
+            dict(guid='TX1', invoice_guid='IV1'),
+            dict(guid='TX2', invoice_guid='IV2'),
+        ]
+        collections = {
+            '/v1/customers/CU1/subscriptions': subscriptions,
+            '/v1/customers/CU1/invoices': invoices,
+            '/v1/customers/CU1/transactions': transactions,
+            '/v1/subscriptions/SU1/invoices': invoices[:1],
+            '/v1/subscriptions/SU1/transactions': transactions[:1],
+            '/v1/invoices/IV1/transactions': transactions[:1],
+            '/v1/invoices/IV2/transactions': transactions[1:],
+        }
+
+        def request(method, url, **kwargs):
+            o = urlparse.urlparse(url)
+            if o.path == '/v1/customers/CU1':
+                json_data = dict(guid='CU1', company_guid='CO1')
+            else:
+                query = urlparse.parse_qs(o.query)
+                offset = int(query.get('offset', ['0'])[0])
+                json_data = dict(
+                    items=collections[o.path][offset:],
+                    offset=offset,
+                    limit=10,
+                )
+            return mock.Mock(json=lambda: json_data, status_code=200)
+        request_method.side_effect = request
+
+    def _called_paths(self, request_method):
+        return set(
+            urlparse.urlparse(args[1]).path
+            for args, _ in request_method.call_args_list
+        )
+
+    @mock.patch('requests.Session.request')
+    def test_load_customer_graph(self, request_method):
+        self._mock_server(request_method)
+        api = self.make_one()
+        graph = api.load_customer_graph('CU1', max_workers=4)
+        self.assertEqual(graph.customer.guid, 'CU1')
+        self.assertEqual(list(graph.subscriptions), ['SU1'])
+        self.assertEqual(list(graph.invoices), ['IV1', 'IV2'])
+        self.assertEqual(list(graph.transactions), ['TX1', 'TX2'])
+        self.assertIn('/v1/invoices/IV2/transactions',
+                      self._called_paths(request_method))
+
+        count = request_method.call_count
+        subscription = graph.subscriptions['SU1']
+        invoice = graph.invoices['IV1']
+        transaction = graph.transactions['TX1']
+        self.assertIs(subscription.customer, graph.customer)
+        self.assertIs(invoice.customer, graph.customer)
+        self.assertIs(invoice.subscription, subscription)
+        self.assertIs(transaction.invoice, invoice)
+        self.assertEqual(graph.invoices['IV2'].subscription, None)
+        self.assertEqual(graph.children(subscription, 'invoice'), [invoice])
+        self.assertEqual(
+            graph.children(graph.customer, 'invoice'),
+            [invoice, graph.invoices['IV2']],
+        )
+        self.assertEqual(request_method.call_count, count)
+        # resources out of the graph are left as lazy references
+        self.assertFalse(subscription.plan.loaded)
+
+    @mock.patch('requests.Session.request')
+    def test_depth(self, request_method):
+        self._mock_server(request_method)
+        api = self.make_one()
+        graph = api.load_customer_graph('CU1', depth=1)
+        self.assertEqual(list(graph.transactions), ['TX1', 'TX2'])
+        self.assertEqual(self._called_paths(request_method), set([
+            '/v1/customers/CU1',
+            '/v1/customers/CU1/subscriptions',
+            '/v1/customers/CU1/invoices',
+            '/v1/customers/CU1/transactions',
+        ]))
+
+        request_method.reset_mock()
+        graph = api.load_customer_graph('CU1', depth=0)
+        self.assertEqual(graph.customer.guid, 'CU1')
+        self.assertEqual(len(graph.invoices), 0)
+        self.assertEqual(request_method.call_count, 1)
+
+    @mock.patch('requests.Session.request')
+    def test_not_found(self, request_method):
+        request_method.return_value = mock.Mock(
+            json=lambda: dict(),
+            status_code=404,
+            content='not found',
+        )
+        api = self.make_one()
+        with self.assertRaises(NotFoundError):
+            api.load_customer_graph('CU1')
+
+    @mock.patch('requests.Session.request')
+    def test_error_stops_other_tasks(self, request_method):
+        import time
+        lock = threading.Lock()
+        calls = []
+
+        def request(method, url, **kwargs):
+            with lock:
+                calls.append(url)
+            o = urlparse.urlparse(url)
+            if o.path == '/v1/customers/CU1':
+                return mock.Mock(
+                    json=lambda: dict(),
+                    status_code=404,
+                    content='not found',
+                )
+            time.sleep(0.01)
+            query = urlparse.parse_qs(o.query)
+            offset = int(query.get('offset', ['0'])[0])
+            items = [dict(guid='{}{}'.format(o.path, offset))]
+            if offset >= 5:
+                items = []
+            json_data = dict(items=items, offset=offset, limit=1)
+            return mock.Mock(json=lambda: json_data, status_code=200)
+        request_method.side_effect = request
+
+        api = self.make_one()
+        with self.assertRaises(NotFoundError):
+            api.load_customer_graph('CU1', max_workers=4)
+        with lock:
+            count = len(calls)
+        time.sleep(0.05)
+        self.assertEqual(len(calls), count)
+
+
+class TestColumns(unittest.TestCase):
+
+    def make_page(self):
+        result = [
+            dict(offset=0, limit=2, items=[
+                dict(
+                    guid='MOCK_GUID1',
+                    status='settled',
+                    amount=1000,
+                    created_at='2013-10-02T00:00:00',
+                ),
+                dict(
+                    guid='MOCK_GUID2',
+                    status='staged',
+                    amount='12.5',
+                    created_at='2013-10-03T00:00:00.500000',
+                ),
+            ]),
+            dict(offset=2, limit=2, items=[
+                dict(guid='MOCK_GUID3', status='staged', created_at=None),
+            ]),
+            dict(offset=4, limit=2, items=[]),
+        ]
+        patcher = mock.patch('requests.Session.request')
+        request_method = patcher.start()
+        self.addCleanup(patcher.stop)
+        request_method.return_value = mock.Mock(
+            json=lambda: result.pop(0),
+            status_code=200,
+        )
+        api = BillyAPI('MOCK_API_KEY', endpoint='http://localhost')
+        return api.list_invoices()
+
+    def test_to_columns(self):
+        import array
+        import math
+        columns = self.make_page().to_columns(
+            ['guid', 'amount', 'created_at', 'status'],
+            use_numpy=False,
+        )
+        self.assertEqual(
+            list(columns),
+            ['guid', 'amount', 'created_at', 'status'],
+        )
+        self.assertEqual(
+            columns['guid'],
+            ['MOCK_GUID1', 'MOCK_GUID2', 'MOCK_GUID3'],
+        )
+        self.assertIsInstance(columns['amount'], array.array)
+        self.assertEqual(list(columns['amount'])[:2], [1000.0, 12.5])
+        self.assertTrue(math.isnan(columns['amount'][2]))
+        self.assertIsInstance(columns['created_at'], array.array)
+        self.assertEqual(
+            list(columns['created_at']),
+            [1380672000, 1380758400, 0],
+        )
+
+    def test_unparsable_datetime(self):
+        result = [
+            dict(offset=0, limit=2, items=[
+                dict(guid='MOCK_GUID1', created_at='2013-10-02T00:00:00'),
+                dict(guid='MOCK_GUID2', created_at='2013-10-02T02:00:00+02:00'),
+            ]),
+            dict(offset=2, limit=2, items=[]),
+        ]
+        with mock.patch('requests.Session.request') as request_method:
+            request_method.return_value = mock.Mock(
+                json=lambda: result.pop(0),
+                status_code=200,
+            )
+            api = BillyAPI('MOCK_API_KEY', endpoint='http://localhost')
+            with self.assertRaises(ValueError) as context:
+                api.list_invoices().to_columns(['created_at'], use_numpy=False)
+        message = str(context.exception)
+        self.assertIn('created_at', message)
+        self.assertIn('MOCK_GUID2', message)
+
+    def test_integer_column(self):
+        import array
+        result = [
+            dict(offset=0, limit=2, items=[
+                dict(guid='MOCK_GUID1', interval=1, deleted=False),
+                dict(guid='MOCK_GUID2', interval=3, deleted=True),
+            ]),
+            dict(offset=2, limit=2, items=[]),
+        ]
+        with mock.patch('requests.Session.request') as request_method:
+            request_method.return_value = mock.Mock(
+                json=lambda: result.pop(0),
+                status_code=200,
+            )
+            api = BillyAPI('MOCK_API_KEY', endpoint='http://localhost')
+            columns = api.list_plans().to_columns(
+                ['interval', 'deleted'],
+                use_numpy=False,
+            )
+        self.assertEqual(columns['interval'], array.array(b'l', [1, 3]))
+        self.assertEqual(columns['deleted'], [False, True])
+
+    def test_to_columns_numpy(self):
+        try:
+            import numpy
+        except ImportError:
+            self.skipTest('NumPy is not available')
+        columns = self.make_page().to_columns(
+            ['amount', 'created_at', 'status'],
+            use_numpy=True,
+        )
+        self.assertIsInstance(columns['amount'], numpy.ndarray)
+        self.assertEqual(numpy.nansum(columns['amount']), 1012.5)
+        self.assertEqual(
+            columns['created_at'].tolist(),
+            [1380672000, 1380758400, 0],
+        )
+        self.assertEqual(
+            (columns['status'] == 'staged').sum(),
+            2,
+        )
+
+    def test_numpy_not_available(self):
+        with mock.patch('billy_client.api._import_numpy', lambda: None):
+            with self.assertRaises(ValueError):
+                self.make_page().to_columns(['amount'], use_numpy=True)
+
+
+class TestRequestHooks(unittest.TestCase):
+
+    def make_one(self, *args, **kwargs):
+        return BillyAPI('MOCK_API_KEY', endpoint='http://localhost', **kwargs)
+
+    def _record(self, api):
+        events = []
+        for event in ['before', 'after', 'error']:
+            api.add_hook(
+                event,
+                lambda info, event=event: events.append((event, info)),
+            )
+        return events
+
+    @mock.patch('requests.Session.request')
+    def test_hooks(self, request_method):
+        api = self.make_one()
+        events = self._record(api)
+        result = [
+            dict(guid='MOCK_GUID', status='settled'),
+            dict(offset=0, limit=2, items=[dict(guid='MOCK_GUID')]),
+            dict(offset=2, limit=2, items=[]),
+        ]
+        request_method.return_value = mock.Mock(
+            json=lambda: result.pop(0),
+            status_code=200,
+            content='0123456789',
+        )
+        invoice = api.get_invoice('MOCK_GUID')
+        list(invoice.list_transactions())
+        self.assertEqual(
+            [(event, info.operation) for event, info in events],
+            [
+                ('before', 'get_invoice'),
+                ('after', 'get_invoice'),
+                ('before', 'list_transactions'),
+                ('after', 'list_transactions'),
+                ('before', 'list_transactions'),
+                ('after', 'list_transactions'),
+            ],
+        )
+        info = events[1][1]
+        self.assertIs(events[0][1], info)
+        self.assertEqual(info.method, 'GET')
+        self.assertEqual(info.url, 'http://localhost/v1/invoices/MOCK_GUID')
+        self.assertEqual(info.url_template, '/v1/invoices/{guid}')
+        self.assertEqual(info.status_code, 200)
+        self.assertEqual(info.response_size, 10)
+        self.assertEqual(info.retries, 0)
+        self.assertGreaterEqual(info.elapsed, 0)
+        self.assertEqual(
+            events[2][1].url_template,
+            '/v1/invoices/{guid}/transactions',
+        )
+        # no trace header by default
+        _, kwargs = request_method.call_args
+        self.assertNotIn('headers', kwargs)
+
+    @mock.patch('requests.Session.request')
+    def test_error_hooks_and_retries(self, request_method):
+        from billy_client import RetryPolicy
+        import requests
+        api = self.make_one(
+            retry_policy=RetryPolicy(max_attempts=2, sleep=lambda _: None),
+        )
+        events = self._record(api)
+        request_method.side_effect = requests.ConnectionError('Boom')
+        with self.assertRaises(requests.ConnectionError):
+            api.get_plan('MOCK_GUID')
+        self.assertEqual(
+            [(event, info.retries) for event, info in events],
+            [('before', 0), ('error', 0), ('before', 1), ('error', 1)],
+        )
+        self.assertIsInstance(events[-1][1].error, requests.ConnectionError)
+        self.assertEqual(events[-1][1].status_code, None)
+
+    @mock.patch('requests.Session.request')
+    def test_trace_header(self, request_method):
+        trace_ids = iter(['TRACE1', 'TRACE2'])
+        api = self.make_one(
+            trace_header='X-Trace-ID',
+            trace_id_factory=lambda: next(trace_ids),
+        )
+        request_method.return_value = mock.Mock(
+            json=lambda: dict(guid='MOCK_GUID'),
+            status_code=200,
+        )
+        api.get_customer('MOCK_GUID')
+        _, kwargs = request_method.call_args
+        self.assertEqual(kwargs['headers'], {'X-Trace-ID': 'TRACE1'})
+
+        def set_trace_id(info):
+            info.trace_id = 'SPAN_ID'
+        api.add_hook('before', set_trace_id)
+        api.get_customer('MOCK_GUID')
+        _, kwargs = request_method.call_args
+        self.assertEqual(kwargs['headers'], {'X-Trace-ID': 'SPAN_ID'})
+
+    @mock.patch('requests.Session.request')
+    def test_trace_header_retries(self, request_method):
+        from billy_client import RetryPolicy
+        import requests
+        api = self.make_one(
+            retry_policy=RetryPolicy(max_attempts=4, sleep=lambda _: None),
+            trace_header='X-Trace-ID',
+            trace_id_factory=lambda: 'TRACE',
+        )
+
+        def add_span(info):
+            info.trace_id = '{}/span{}'.format(info.trace_id, info.retries)
+        api.add_hook('before', add_span)
+        responses = [
+            mock.Mock(status_code=503, content='Unavailable'),
+            requests.ConnectionError('Boom'),
+            requests.ConnectionError('Boom'),
+            mock.Mock(json=lambda: dict(guid='MOCK_GUID'), status_code=200),
+        ]
+
+        def request(*args, **kwargs):
+            resp = responses.pop(0)
+            if isinstance(resp, Exception):
+                raise resp
+            return resp
+        request_method.side_effect = request
+        api.get_customer('MOCK_GUID')
+        self.assertEqual(
+            [
+                kwargs['headers']['X-Trace-ID']
+                for _, kwargs in request_method.call_args_list
+            ],
+            ['TRACE/span0', 'TRACE/span1', 'TRACE/span2', 'TRACE/span3'],
+        )
+
+    @mock.patch('requests.Session.request')
+    def test_broken_hook(self, request_method):
+        def broken(info):
+            raise RuntimeError('Boom')
+        api = self.make_one(hooks=dict(before=[broken], after=[broken]))
+        request_method.return_value = mock.Mock(
+            json=lambda: dict(guid='MOCK_GUID'),
+            status_code=200,
+        )
+        self.assertEqual(api.get_customer('MOCK_GUID').guid, 'MOCK_GUID')
+
+    def test_unknown_event(self):
+        api = self.make_one()
+        with self.assertRaises(ValueError):
+            api.add_hook('finally', lambda info: None)
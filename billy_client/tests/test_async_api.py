@@ -0,0 +1,142 @@
+from __future__ import unicode_literals
+import unittest
+
+import mock
+
+from billy_client import AsyncBillyAPI
+from billy_client import NotFoundError
+from billy_client.api import Customer
+from billy_client.async_api import AsyncPage
+from billy_client.async_api import AsyncResource
+
+
+class TestAsyncAPI(unittest.TestCase):
+
+    def make_one(self, *args, **kwargs):
+        return AsyncBillyAPI(*args, **kwargs)
+
+    @mock.patch('requests.Session.request')
+    def test_get_record(self, request_method):
+        request_method.return_value = mock.Mock(
+            json=lambda: dict(guid='MOCK_GUID'),
+            status_code=200,
+        )
+        with self.make_one('MOCK_API_KEY', endpoint='http://localhost') as api:
+            future = api.get_customer('MOCK_GUID')
+            customer = future.result()
+        self.assertIsInstance(customer, AsyncResource)
+        self.assertEqual(customer.guid, 'MOCK_GUID')
+        request_method.assert_called_once_with(
+            'GET',
+            'http://localhost/v1/customers/MOCK_GUID',
+            auth=('MOCK_API_KEY', ''),
+        )
+
+    @mock.patch('requests.Session.request')
+    def test_get_record_not_found(self, request_method):
+        request_method.return_value = mock.Mock(
+            json=lambda: dict(),
+            status_code=404,
+            content='Not found',
+        )
+        with self.make_one('MOCK_API_KEY', endpoint='http://localhost') as api:
+            future = api.get_invoice('MOCK_GUID')
+            with self.assertRaises(NotFoundError):
+                future.result()
+
+    @mock.patch('requests.Session.request')
+    def test_resource_method(self, request_method):
+        request_method.return_value = mock.Mock(
+            json=lambda: dict(guid='MOCK_INVOICE_GUID'),
+            status_code=200,
+        )
+        with self.make_one('MOCK_API_KEY', endpoint='http://localhost') as api:
+            customer = AsyncResource(
+                api,
+                Customer(api.api, dict(guid='MOCK_CUSTOMER_GUID')),
+            )
+            invoice = customer.invoice(amount=100).result()
+        self.assertEqual(invoice.guid, 'MOCK_INVOICE_GUID')
+        request_method.assert_called_once_with(
+            'POST',
+            'http://localhost/v1/invoices',
+            data=dict(customer_guid='MOCK_CUSTOMER_GUID', amount=100),
+            auth=('MOCK_API_KEY', ''),
+        )
+
+    @mock.patch('requests.Session.request')
+    def test_list_records(self, request_method):
+        result = [
+            dict(offset=0, limit=2, items=[dict(guid='1'), dict(guid='2')]),
+            dict(offset=2, limit=2, items=[dict(guid='3')]),
+            dict(offset=4, limit=2, items=[]),
+        ]
+        request_method.return_value = mock.Mock(
+            json=lambda: result.pop(0),
+            status_code=200,
+        )
+        with self.make_one('MOCK_API_KEY', endpoint='http://localhost') as api:
+            page = api.list_invoices()
+            self.assertIsInstance(page, AsyncPage)
+            records = page.all().result()
+        self.assertEqual([r.guid for r in records], ['1', '2', '3'])
+
+    @mock.patch('requests.Session.request')
+    def test_fetch_page_window(self, request_method):
+        request_method.return_value = mock.Mock(
+            json=lambda: dict(offset=20, limit=10, items=[dict(guid='1')]),
+            status_code=200,
+        )
+        with self.make_one('MOCK_API_KEY', endpoint='http://localhost') as api:
+            records = api.list_transactions().fetch(offset=20, limit=10).result()
+        self.assertEqual([r.guid for r in records], ['1'])
+        args, _ = request_method.call_args
+        self.assertIn('offset=20', args[1])
+        self.assertIn('limit=10', args[1])
+
+    @mock.patch('requests.Session.request')
+    def test_windows(self, request_method):
+        result = [
+            dict(offset=0, limit=2, items=[dict(guid='1'), dict(guid='2')]),
+            dict(offset=2, limit=2, items=[dict(guid='3')]),
+            dict(offset=4, limit=2, items=[]),
+        ]
+        request_method.return_value = mock.Mock(
+            json=lambda: result.pop(0),
+            status_code=200,
+        )
+        with self.make_one('MOCK_API_KEY', endpoint='http://localhost') as api:
+            windows = [
+                future.result()
+                for future in api.list_invoices().windows()
+            ]
+        self.assertEqual(
+            [[r.guid for r in window.items] for window in windows],
+            [['1', '2'], ['3'], []],
+        )
+        self.assertEqual(
+            [window.next_offset for window in windows],
+            [2, 4, None],
+        )
+        args, _ = request_method.call_args
+        self.assertIn('offset=4', args[1])
+
+    @mock.patch('requests.Session.request')
+    def test_create_invoices(self, request_method):
+        request_method.return_value = mock.Mock(
+            json=lambda: dict(guid='MOCK_INVOICE_GUID'),
+            status_code=200,
+        )
+        with self.make_one('MOCK_API_KEY', endpoint='http://localhost') as api:
+            future = api.create_invoices([
+                dict(customer_guid='MOCK_CUSTOMER_GUID', amount=100),
+                dict(customer_guid='MOCK_CUSTOMER_GUID', amount=200),
+            ])
+            results = future.result()
+            # all invoices are created by the time the future is done
+            self.assertEqual(request_method.call_count, 2)
+        self.assertIsInstance(results, list)
+        self.assertEqual(
+            [result.value.guid for result in results],
+            ['MOCK_INVOICE_GUID', 'MOCK_INVOICE_GUID'],
+        )
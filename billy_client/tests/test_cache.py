@@ -0,0 +1,103 @@
+from __future__ import unicode_literals
+import unittest
+
+import mock
+
+from billy_client import BillyAPI
+from billy_client import ResourceCache
+from billy_client.api import Subscription
+
+
+class TestResourceCache(unittest.TestCase):
+
+    def make_one(self, *args, **kwargs):
+        self.now = 0
+        kwargs.setdefault('clock', lambda: self.now)
+        return ResourceCache(*args, **kwargs)
+
+    def test_get_set(self):
+        cache = self.make_one()
+        self.assertEqual(cache.get('plans', 'MOCK_GUID'), None)
+        cache.set('plans', 'MOCK_GUID', 'MOCK_PLAN')
+        self.assertEqual(cache.get('plans', 'MOCK_GUID'), 'MOCK_PLAN')
+        self.assertEqual(cache.get('customers', 'MOCK_GUID'), None)
+
+    def test_ttl(self):
+        cache = self.make_one(default_ttl=10, ttls=dict(plans=100, invoices=0))
+        cache.set('plans', 'MOCK_GUID', 'MOCK_PLAN')
+        cache.set('customers', 'MOCK_GUID', 'MOCK_CUSTOMER')
+        cache.set('invoices', 'MOCK_GUID', 'MOCK_INVOICE')
+        self.assertEqual(cache.get('invoices', 'MOCK_GUID'), None)
+        self.now = 10
+        self.assertEqual(cache.get('customers', 'MOCK_GUID'), None)
+        self.assertEqual(cache.get('plans', 'MOCK_GUID'), 'MOCK_PLAN')
+        self.now = 100
+        self.assertEqual(cache.get('plans', 'MOCK_GUID'), None)
+        self.assertEqual(len(cache), 0)
+
+    def test_lru_eviction(self):
+        cache = self.make_one(max_size=2)
+        cache.set('plans', '1', 'PLAN1')
+        cache.set('plans', '2', 'PLAN2')
+        # touch 1 so that 2 is the least recently used one
+        cache.get('plans', '1')
+        cache.set('plans', '3', 'PLAN3')
+        self.assertEqual(cache.get('plans', '1'), 'PLAN1')
+        self.assertEqual(cache.get('plans', '2'), None)
+        self.assertEqual(cache.get('plans', '3'), 'PLAN3')
+
+    def test_invalidate(self):
+        cache = self.make_one()
+        cache.set('plans', '1', 'PLAN1')
+        cache.set('plans', '2', 'PLAN2')
+        cache.set('companies', '1', 'COMPANY1')
+        cache.invalidate('plans', '1')
+        self.assertEqual(cache.get('plans', '1'), None)
+        self.assertEqual(cache.get('plans', '2'), 'PLAN2')
+        cache.invalidate('plans')
+        self.assertEqual(cache.get('plans', '2'), None)
+        self.assertEqual(cache.get('companies', '1'), 'COMPANY1')
+        cache.invalidate()
+        self.assertEqual(len(cache), 0)
+
+
+class TestAPIWithCache(unittest.TestCase):
+
+    def make_one(self, *args, **kwargs):
+        kwargs.setdefault('cache', ResourceCache())
+        return BillyAPI(*args, **kwargs)
+
+    @mock.patch('requests.Session.request')
+    def test_get_record_cached(self, request_method):
+        request_method.return_value = mock.Mock(
+            json=lambda: dict(guid='MOCK_GUID'),
+            status_code=200,
+        )
+        api = self.make_one('MOCK_API_KEY', endpoint='http://localhost')
+        plan = api.get_plan('MOCK_GUID')
+        self.assertIs(api.get_plan('MOCK_GUID'), plan)
+        self.assertEqual(request_method.call_count, 1)
+
+        api.invalidate('plans', 'MOCK_GUID')
+        self.assertIsNot(api.get_plan('MOCK_GUID'), plan)
+        self.assertEqual(request_method.call_count, 2)
+
+    @mock.patch('requests.Session.request')
+    def test_cancel_refreshes_cache(self, request_method):
+        request_method.return_value = mock.Mock(
+            json=lambda: dict(guid='MOCK_GUID', canceled=False),
+            status_code=200,
+        )
+        api = self.make_one('MOCK_API_KEY', endpoint='http://localhost')
+        subscription = api.get_subscription('MOCK_GUID')
+        self.assertEqual(subscription.canceled, False)
+
+        request_method.return_value = mock.Mock(
+            json=lambda: dict(guid='MOCK_GUID', canceled=True),
+            status_code=200,
+        )
+        canceled = subscription.cancel()
+        self.assertIsInstance(canceled, Subscription)
+        self.assertIs(api.get_subscription('MOCK_GUID'), canceled)
+        self.assertEqual(api.get_subscription('MOCK_GUID').canceled, True)
+        self.assertEqual(request_method.call_count, 2)
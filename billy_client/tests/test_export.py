@@ -0,0 +1,129 @@
+from __future__ import unicode_literals
+import csv
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import urlparse
+
+import mock
+
+from billy_client import BillyAPI
+from billy_client import export_page
+
+
+class TestExport(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.invoices = [
+            dict(
+                guid='IV{}'.format(i),
+                status='settled',
+                amount=100 * i,
+                title='Invoice \u2116{}'.format(i),
+                items=[dict(name='item', amount=100 * i)],
+            )
+            for i in range(5)
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def make_api(self):
+        return BillyAPI('MOCK_API_KEY', endpoint='http://localhost')
+
+    def _mock_server(self, request_method):
+        def request(method, url, **kwargs):
+            query = urlparse.parse_qs(urlparse.urlparse(url).query)
+            offset = int(query.get('offset', ['0'])[0])
+            limit = int(query.get('limit', ['2'])[0])
+            json_data = dict(
+                items=self.invoices[offset:offset + limit],
+                offset=offset,
+                limit=limit,
+            )
+            return mock.Mock(json=lambda: json_data, status_code=200)
+        request_method.side_effect = request
+
+    @mock.patch('requests.Session.request')
+    def test_ndjson(self, request_method):
+        self._mock_server(request_method)
+        path = os.path.join(self.temp_dir, 'invoices.ndjson')
+        reported = []
+        stats = export_page(
+            self.make_api().list_invoices(page_size=2),
+            path,
+            buffer_size=1,
+            progress=reported.append,
+        )
+        with io.open(path, encoding='utf-8') as file_obj:
+            records = [json.loads(line) for line in file_obj]
+        self.assertEqual(records, self.invoices)
+        self.assertEqual(stats.rows, 5)
+        self.assertEqual(stats.bytes, os.path.getsize(path))
+        self.assertEqual(stats.next_offset, 6)
+        self.assertEqual(
+            [(s.rows, s.next_offset) for s in reported],
+            [(2, 2), (4, 4), (5, 6)],
+        )
+        self.assertGreaterEqual(stats.rows_per_second, 0)
+
+    @mock.patch('requests.Session.request')
+    def test_csv_gzip(self, request_method):
+        self._mock_server(request_method)
+        path = os.path.join(self.temp_dir, 'invoices.csv.gz')
+        export_page(
+            self.make_api().list_invoices(page_size=2),
+            path,
+            format='csv',
+            fields=['guid', 'title', 'items'],
+        )
+        with gzip.open(path) as file_obj:
+            rows = list(csv.reader(file_obj))
+        self.assertEqual(rows[0], [b'guid', b'title', b'items'])
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[2][1].decode('utf-8'), 'Invoice \u21161')
+        self.assertEqual(
+            json.loads(rows[2][2]),
+            [dict(name='item', amount=100)],
+        )
+
+    @mock.patch('requests.Session.request')
+    def test_resume(self, request_method):
+        self._mock_server(request_method)
+        path = os.path.join(self.temp_dir, 'invoices.csv.gz')
+        page = self.make_api().list_invoices(page_size=2)
+        reported = []
+
+        def progress(stats):
+            reported.append(stats)
+            if len(reported) == 1:
+                raise KeyboardInterrupt
+        with self.assertRaises(KeyboardInterrupt):
+            export_page(page, path, format='csv', progress=progress)
+        stats = export_page(
+            page,
+            path,
+            format='csv',
+            offset=reported[0].next_offset,
+        )
+        self.assertEqual(stats.rows, 3)
+        with gzip.open(path) as file_obj:
+            rows = list(csv.reader(file_obj))
+        self.assertEqual(rows[0][0], b'guid')
+        self.assertEqual(
+            [row[0] for row in rows[1:]],
+            [b'IV0', b'IV1', b'IV2', b'IV3', b'IV4'],
+        )
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            export_page(
+                self.make_api().list_invoices(),
+                os.path.join(self.temp_dir, 'invoices'),
+                format='xml',
+            )
@@ -0,0 +1,144 @@
+from __future__ import unicode_literals
+import unittest
+
+import mock
+import requests
+
+from billy_client import BillyAPI
+from billy_client import MetricsRegistry
+from billy_client.metrics import Histogram
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_percentile(self):
+        histogram = Histogram([1, 2, 4])
+        self.assertEqual(histogram.percentile(50), None)
+        for value in [0.5, 1.5, 1.5, 3, 8]:
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [1, 2, 1, 1])
+        self.assertEqual(histogram.count, 5)
+        self.assertEqual(histogram.sum, 14.5)
+        self.assertEqual(histogram.percentile(20), 1)
+        self.assertEqual(histogram.percentile(40), 1.5)
+        self.assertEqual(histogram.percentile(80), 4)
+        self.assertEqual(histogram.percentile(90), 6)
+        self.assertEqual(histogram.percentile(100), 8)
+
+
+class TestMetricsRegistry(unittest.TestCase):
+
+    def make_one(self, *args, **kwargs):
+        return MetricsRegistry(*args, **kwargs)
+
+    def test_observe(self):
+        registry = self.make_one(buckets=[0.1, 1])
+        registry.observe('invoice', 200, 0.05, bytes_out=10, bytes_in=100)
+        registry.observe('invoice', 409, 0.5, bytes_out=10, bytes_in=20)
+        registry.observe('invoice', None, 2)
+        snapshot = registry.snapshot()
+        metrics = snapshot['invoice']
+        self.assertEqual(metrics.requests, 3)
+        self.assertEqual(dict(metrics.status_codes), {200: 1, 409: 1})
+        self.assertEqual(metrics.errors, 1)
+        self.assertEqual(metrics.bytes_out, 20)
+        self.assertEqual(metrics.bytes_in, 120)
+        self.assertEqual(metrics.latency.counts, [1, 1, 1])
+        self.assertEqual(registry.percentile('invoice', 100), 2)
+        self.assertEqual(registry.percentile('refund', 100), None)
+
+        # snapshot is not changed by later requests
+        registry.observe('invoice', 200, 0.05)
+        self.assertEqual(metrics.requests, 3)
+        registry.reset()
+        self.assertEqual(registry.snapshot(), {})
+
+    def test_to_prometheus(self):
+        registry = self.make_one(buckets=[0.1, 1])
+        registry.observe('list_invoices', 200, 0.05, bytes_in=100)
+        registry.observe('cancel', 200, 0.5, bytes_out=0, bytes_in=20)
+        registry.observe('cancel', None, 2)
+        text = registry.to_prometheus()
+        lines = text.splitlines()
+        self.assertIn(
+            '# TYPE billy_client_request_duration_seconds histogram',
+            lines,
+        )
+        for line in [
+            'billy_client_requests_total{operation="cancel",code="200"} 1',
+            'billy_client_requests_total{operation="list_invoices",code="200"} 1',
+            'billy_client_request_errors_total{operation="cancel"} 1',
+            'billy_client_response_bytes_total{operation="list_invoices"} 100',
+            'billy_client_request_duration_seconds_bucket'
+            '{operation="cancel",le="0.1"} 0',
+            'billy_client_request_duration_seconds_bucket'
+            '{operation="cancel",le="1.0"} 1',
+            'billy_client_request_duration_seconds_bucket'
+            '{operation="cancel",le="+Inf"} 2',
+            'billy_client_request_duration_seconds_sum'
+            '{operation="cancel"} 2.5',
+            'billy_client_request_duration_seconds_count'
+            '{operation="cancel"} 2',
+        ]:
+            self.assertIn(line, lines)
+        self.assertTrue(text.endswith('\n'))
+
+
+class TestAPIMetrics(unittest.TestCase):
+
+    def make_one(self, *args, **kwargs):
+        return BillyAPI('MOCK_API_KEY', endpoint='http://localhost', **kwargs)
+
+    @mock.patch('requests.Session.request')
+    def test_record_requests(self, request_method):
+        registry = MetricsRegistry()
+        api = self.make_one(metrics=registry)
+        result = [
+            dict(offset=0, limit=2, items=[dict(guid='MOCK_GUID')]),
+            dict(offset=2, limit=2, items=[]),
+        ]
+
+        def request(method, url, **kwargs):
+            if 'MOCK_GUID' in url:
+                return mock.Mock(
+                    json=lambda: {},
+                    status_code=404,
+                    content='not found',
+                    request=mock.Mock(body=None),
+                )
+            return mock.Mock(
+                json=lambda: result.pop(0),
+                status_code=200,
+                content='0123456789',
+                request=mock.Mock(body=None),
+            )
+        request_method.side_effect = request
+        self.assertEqual(len(list(api.list_invoices())), 1)
+        with self.assertRaises(Exception):
+            api.get_invoice('MOCK_GUID')
+
+        request_method.side_effect = requests.ConnectionError
+        with self.assertRaises(requests.ConnectionError):
+            api.get_invoice('OTHER_GUID')
+
+        snapshot = registry.snapshot()
+        self.assertEqual(snapshot['list_invoices'].requests, 2)
+        self.assertEqual(snapshot['list_invoices'].bytes_in, 20)
+        self.assertEqual(dict(snapshot['get_invoice'].status_codes), {404: 1})
+        self.assertEqual(snapshot['get_invoice'].errors, 1)
+        self.assertEqual(snapshot['get_invoice'].bytes_in, 9)
+
+    @mock.patch('requests.Session.request')
+    def test_bytes_out(self, request_method):
+        registry = MetricsRegistry()
+        api = self.make_one(metrics=registry)
+        request_method.return_value = mock.Mock(
+            json=lambda: dict(guid='MOCK_GUID'),
+            status_code=200,
+            content='{}',
+            request=mock.Mock(body='amount=1000'),
+        )
+        api.get_invoice('MOCK_GUID').refund(amount=1000)
+        snapshot = registry.snapshot()
+        self.assertEqual(snapshot['refund'].bytes_out, 11)
+        self.assertEqual(snapshot['refund'].bytes_in, 2)
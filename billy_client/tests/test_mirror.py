@@ -0,0 +1,180 @@
+from __future__ import unicode_literals
+import os
+import shutil
+import tempfile
+import unittest
+import urlparse
+
+import mock
+
+from billy_client import BillyAPI
+from billy_client import Mirror
+from billy_client.api import Invoice
+
+
+class TestMirror(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, 'mirror.db')
+        # newest records first, like the server does
+        self.invoices = [
+            dict(guid='IV{}'.format(i), status='staged')
+            for i in reversed(range(5))
+        ]
+        self.customers = [
+            dict(guid='CU{}'.format(i)) for i in reversed(range(5))
+        ]
+        self.failing_offset = None
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def make_one(self, *args, **kwargs):
+        return Mirror(self.db_path, *args, **kwargs)
+
+    def make_api(self):
+        return BillyAPI('MOCK_API_KEY', endpoint='http://localhost')
+
+    def _mock_server(self, request_method):
+        def request(method, url, **kwargs):
+            o = urlparse.urlparse(url)
+            query = urlparse.parse_qs(o.query)
+            parts = o.path.split('/')
+            records = getattr(self, parts[2])
+            if len(parts) > 3:
+                for record in records:
+                    if record['guid'] == parts[3]:
+                        return mock.Mock(json=lambda: record, status_code=200)
+            offset = int(query.get('offset', ['0'])[0])
+            limit = int(query.get('limit', ['2'])[0])
+            if offset == self.failing_offset:
+                raise RuntimeError('Boom')
+            json_data = dict(
+                items=records[offset:offset + limit],
+                offset=offset,
+                limit=limit,
+            )
+            return mock.Mock(json=lambda: json_data, status_code=200)
+        request_method.side_effect = request
+
+    def _fetched_offsets(self, request_method, path_name='invoices'):
+        offsets = []
+        for args, _ in request_method.call_args_list:
+            o = urlparse.urlparse(args[1])
+            if o.path == '/v1/' + path_name:
+                query = urlparse.parse_qs(o.query)
+                offsets.append(int(query.get('offset', ['0'])[0]))
+        return offsets
+
+    @mock.patch('requests.Session.request')
+    def test_sync(self, request_method):
+        self._mock_server(request_method)
+        mirror = self.make_one()
+        changes = mirror.sync(self.make_api(), ['invoices'], page_size=2)
+        self.assertEqual(changes, dict(invoices=5))
+        self.assertEqual(mirror.count('invoices'), 5)
+        self.assertEqual(mirror.checkpoint('invoices'), (0, True))
+        self.assertEqual(mirror.checkpoint('plans'), None)
+        self.assertEqual(
+            mirror.get('invoices', 'IV3'),
+            dict(guid='IV3', status='staged'),
+        )
+        invoices = list(mirror.resources('invoices'))
+        self.assertEqual(
+            [invoice.guid for invoice in invoices],
+            ['IV0', 'IV1', 'IV2', 'IV3', 'IV4'],
+        )
+        self.assertIsInstance(invoices[0], Invoice)
+
+    @mock.patch('requests.Session.request')
+    def test_resume(self, request_method):
+        self._mock_server(request_method)
+        self.failing_offset = 4
+        mirror = self.make_one()
+        with self.assertRaises(RuntimeError):
+            mirror.sync(self.make_api(), ['invoices'], page_size=2)
+        self.assertEqual(mirror.count('invoices'), 4)
+        self.assertEqual(mirror.checkpoint('invoices'), (4, False))
+
+        self.failing_offset = None
+        request_method.reset_mock()
+        mirror = self.make_one()
+        changes = mirror.sync(self.make_api(), ['invoices'], page_size=2)
+        self.assertEqual(changes, dict(invoices=1))
+        self.assertEqual(self._fetched_offsets(request_method), [4, 6])
+        self.assertEqual(mirror.checkpoint('invoices'), (0, True))
+
+    @mock.patch('requests.Session.request')
+    def test_catch_up(self, request_method):
+        self._mock_server(request_method)
+        self.invoices[0]['status'] = 'settled'
+        self.invoices[1]['status'] = 'settled'
+        mirror = self.make_one()
+        mirror.sync(self.make_api(), ['invoices'], page_size=2)
+
+        self.invoices.insert(0, dict(guid='IV5', status='staged'))
+        self.invoices[5]['status'] = 'settled'
+        request_method.reset_mock()
+        changes = mirror.sync(self.make_api(), ['invoices'], page_size=2)
+        self.assertEqual(changes, dict(invoices=2))
+        self.assertEqual(self._fetched_offsets(request_method), [0, 2])
+        self.assertEqual(mirror.count('invoices'), 6)
+        self.assertEqual(mirror.get('invoices', 'IV0')['status'], 'settled')
+        # only records not in a final status are fetched again
+        paths = set(
+            urlparse.urlparse(args[1]).path
+            for args, _ in request_method.call_args_list
+        )
+        self.assertIn('/v1/invoices/IV0', paths)
+        self.assertNotIn('/v1/invoices/IV4', paths)
+
+    @mock.patch('requests.Session.request')
+    def test_full_sync(self, request_method):
+        self._mock_server(request_method)
+        mirror = self.make_one()
+        mirror.sync(self.make_api(), ['invoices'], page_size=2)
+        request_method.reset_mock()
+        changes = mirror.sync(
+            self.make_api(), ['invoices'], page_size=2, full=True,
+        )
+        self.assertEqual(changes, dict(invoices=0))
+        self.assertEqual(self._fetched_offsets(request_method), [0, 2, 4, 6])
+
+    @mock.patch('requests.Session.request')
+    def test_catch_up_rescan(self, request_method):
+        self._mock_server(request_method)
+        self.invoices = [
+            dict(guid='IV{}'.format(i), status='staged')
+            for i in reversed(range(10))
+        ]
+        mirror = self.make_one()
+        mirror.sync(self.make_api(), ['invoices'], page_size=5)
+
+        self.invoices[9]['status'] = 'settled'
+        request_method.reset_mock()
+        changes = mirror.sync(self.make_api(), ['invoices'], page_size=5)
+        self.assertEqual(changes, dict(invoices=1))
+        self.assertEqual(mirror.get('invoices', 'IV0')['status'], 'settled')
+        # scanning rest of the collection again takes fewer requests than
+        # fetching each of the 5 older records which are not final
+        self.assertEqual(self._fetched_offsets(request_method), [0, 5, 10])
+        self.assertEqual(request_method.call_count, 3)
+
+    @mock.patch('requests.Session.request')
+    def test_catch_up_without_statuses(self, request_method):
+        self._mock_server(request_method)
+        mirror = self.make_one()
+        mirror.sync(self.make_api(), ['customers'], page_size=2)
+
+        self.customers.insert(0, dict(guid='CU5'))
+        request_method.reset_mock()
+        changes = mirror.sync(self.make_api(), ['customers'], page_size=2)
+        self.assertEqual(changes, dict(customers=1))
+        self.assertEqual(mirror.count('customers'), 6)
+        # customers have no status to change, they are not refreshed
+        self.assertEqual(
+            self._fetched_offsets(request_method, 'customers'),
+            [0, 2],
+        )
+        self.assertEqual(request_method.call_count, 2)
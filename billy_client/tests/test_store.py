@@ -0,0 +1,214 @@
+from __future__ import unicode_literals
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from billy_client import BillyAPI
+from billy_client import RecordStore
+from billy_client.api import Invoice
+from billy_client.api import Transaction
+
+
+class TestRecordStore(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, 'records.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def make_one(self, *args, **kwargs):
+        return RecordStore(self.db_path, *args, **kwargs)
+
+    def test_put_get(self):
+        store = self.make_one()
+        settled = dict(guid='MOCK_GUID1', status='settled', amount=100)
+        staged = dict(guid='MOCK_GUID2', status='staged', amount=100)
+        self.assertTrue(store.put('invoices', settled))
+        self.assertFalse(store.put('invoices', staged))
+        self.assertFalse(store.put('customers', dict(guid='MOCK_GUID3')))
+        self.assertEqual(store.get('invoices', 'MOCK_GUID1'), settled)
+        self.assertEqual(store.get('invoices', 'MOCK_GUID2'), None)
+        self.assertEqual(store.get('transactions', 'MOCK_GUID1'), None)
+        self.assertEqual(store.get('customers', 'MOCK_GUID3'), None)
+
+    def test_persistent(self):
+        store = self.make_one()
+        store.put('transactions', dict(guid='MOCK_GUID', status='done'))
+        store.close()
+        store = self.make_one()
+        self.assertEqual(
+            store.get('transactions', 'MOCK_GUID'),
+            dict(guid='MOCK_GUID', status='done'),
+        )
+
+    def test_put_non_final_removes_stale(self):
+        store = self.make_one(final_statuses=dict(invoices=['settled']))
+        store.put('invoices', dict(guid='MOCK_GUID', status='settled'))
+        store.put('invoices', dict(guid='MOCK_GUID', status='refunding'))
+        self.assertEqual(store.get('invoices', 'MOCK_GUID'), None)
+
+    def test_put_many(self):
+        store = self.make_one()
+        store.put('invoices', dict(guid='MOCK_GUID1', status='settled'))
+        stored = store.put_many('invoices', [
+            dict(guid='MOCK_GUID1', status='refunding'),
+            dict(guid='MOCK_GUID2', status='settled'),
+            dict(guid='MOCK_GUID3', status='staged'),
+        ])
+        self.assertEqual(stored, 1)
+        self.assertEqual(
+            [record['guid'] for record in store.iter_records('invoices')],
+            ['MOCK_GUID2'],
+        )
+        self.assertEqual(
+            store.put_many('plans', [dict(guid='MOCK_GUID4', status='settled')]),
+            0,
+        )
+        self.assertFalse(store.accepts('plans'))
+
+    def test_iter_records(self):
+        store = self.make_one()
+        for i in range(7):
+            store.put('invoices', dict(guid='MOCK_GUID{}'.format(i), status='settled'))
+        store.put('transactions', dict(guid='MOCK_GUID', status='done'))
+        records = store.iter_records('invoices', batch_size=3)
+        self.assertEqual(
+            [record['guid'] for record in records],
+            ['MOCK_GUID{}'.format(i) for i in range(7)],
+        )
+
+
+class TestAPIWithRecordStore(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.store = RecordStore(os.path.join(self.temp_dir, 'records.db'))
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.temp_dir)
+
+    def make_one(self, *args, **kwargs):
+        kwargs.setdefault('record_store', self.store)
+        return BillyAPI(*args, **kwargs)
+
+    @mock.patch('requests.Session.request')
+    def test_get_final_record_from_store(self, request_method):
+        request_method.return_value = mock.Mock(
+            json=lambda: dict(guid='MOCK_GUID', status='done'),
+            status_code=200,
+        )
+        api = self.make_one('MOCK_API_KEY', endpoint='http://localhost')
+        api.get_transaction('MOCK_GUID')
+        api = self.make_one('MOCK_API_KEY', endpoint='http://localhost')
+        transaction = api.get_transaction('MOCK_GUID')
+        self.assertIsInstance(transaction, Transaction)
+        self.assertEqual(transaction.status, 'done')
+        self.assertEqual(request_method.call_count, 1)
+
+    @mock.patch('requests.Session.request')
+    def test_get_mutable_record_from_server(self, request_method):
+        request_method.return_value = mock.Mock(
+            json=lambda: dict(guid='MOCK_GUID', status='staged'),
+            status_code=200,
+        )
+        api = self.make_one('MOCK_API_KEY', endpoint='http://localhost')
+        api.get_invoice('MOCK_GUID')
+        api.get_invoice('MOCK_GUID')
+        self.assertEqual(request_method.call_count, 2)
+
+    @mock.patch('requests.Session.request')
+    def test_list_stores_final_records(self, request_method):
+        result = [
+            dict(offset=0, limit=2, items=[
+                dict(guid='MOCK_GUID1', status='settled'),
+                dict(guid='MOCK_GUID2', status='staged'),
+            ]),
+            dict(offset=2, limit=2, items=[]),
+        ]
+        request_method.return_value = mock.Mock(
+            json=lambda: result.pop(0),
+            status_code=200,
+        )
+        api = self.make_one('MOCK_API_KEY', endpoint='http://localhost')
+        self.assertEqual(len(list(api.list_invoices())), 2)
+        self.assertEqual(
+            [record['guid'] for record in self.store.iter_records('invoices')],
+            ['MOCK_GUID1'],
+        )
+        invoice = api.get_invoice('MOCK_GUID1')
+        self.assertIsInstance(invoice, Invoice)
+        self.assertEqual(request_method.call_count, 2)
+
+    @mock.patch('requests.Session.request')
+    def test_list_stores_each_page_in_one_batch(self, request_method):
+        result = [
+            dict(offset=0, limit=2, items=[
+                dict(guid='MOCK_GUID1', status='done'),
+                dict(guid='MOCK_GUID2', status='done'),
+            ]),
+            dict(offset=2, limit=2, items=[
+                dict(guid='MOCK_GUID3', status='pending'),
+            ]),
+            dict(offset=4, limit=2, items=[]),
+        ]
+        request_method.return_value = mock.Mock(
+            json=lambda: result.pop(0),
+            status_code=200,
+        )
+        api = self.make_one('MOCK_API_KEY', endpoint='http://localhost')
+        with mock.patch.object(
+            self.store, 'put_many', wraps=self.store.put_many,
+        ) as put_many:
+            self.assertEqual(len(list(api.list_transactions())), 3)
+        self.assertEqual(put_many.call_count, 2)
+        self.assertEqual(
+            [record['guid'] for record in self.store.iter_records('transactions')],
+            ['MOCK_GUID1', 'MOCK_GUID2'],
+        )
+
+    @mock.patch('requests.Session.request')
+    def test_get_record_not_kept_in_store(self, request_method):
+        request_method.return_value = mock.Mock(
+            json=lambda: dict(guid='MOCK_GUID'),
+            status_code=200,
+        )
+        api = self.make_one('MOCK_API_KEY', endpoint='http://localhost')
+        with mock.patch.object(self.store, 'get') as get:
+            api.get_plan('MOCK_GUID')
+        self.assertFalse(get.called)
+
+    @mock.patch('requests.Session.request')
+    def test_stream_stores_final_records(self, request_method):
+        import json
+        import urlparse
+
+        def request(method, url, **kwargs):
+            query = urlparse.parse_qs(urlparse.urlparse(url).query)
+            offset = int(query.get('offset', ['0'])[0])
+            items = [
+                dict(guid='MOCK_GUID{}'.format(i), status='settled')
+                for i in range(offset, min(offset + 2, 3))
+            ]
+            content = json.dumps(dict(items=items, offset=offset, limit=2))
+            return mock.Mock(
+                iter_content=lambda size: iter([content]),
+                encoding='utf-8',
+                status_code=200,
+            )
+        request_method.side_effect = request
+        api = self.make_one(
+            'MOCK_API_KEY',
+            endpoint='http://localhost',
+            stream_pages=True,
+        )
+        self.assertEqual(len(list(api.list_invoices())), 3)
+        self.assertEqual(
+            [record['guid'] for record in self.store.iter_records('invoices')],
+            ['MOCK_GUID0', 'MOCK_GUID1', 'MOCK_GUID2'],
+        )
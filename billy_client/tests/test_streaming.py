@@ -0,0 +1,64 @@
+from __future__ import unicode_literals
+import json
+import unittest
+
+
+class TestIterPageItems(unittest.TestCase):
+
+    def iter_items(self, text, chunk_size=1, **kwargs):
+        from billy_client.streaming import iter_page_items
+        data = text.encode('utf8')
+        chunks = [
+            data[i:i + chunk_size]
+            for i in range(0, len(data), chunk_size)
+        ]
+        meta = {}
+        items = list(iter_page_items(iter(chunks), meta, **kwargs))
+        return items, meta
+
+    def test_page(self):
+        page = dict(
+            offset=1234,
+            limit=10,
+            items=[
+                dict(guid='MOCK_GUID1', amount=1000, title='\u4e2d\u6587'),
+                dict(guid='MOCK_GUID2', nested=dict(a=[1, 2, {'b': None}])),
+                dict(guid='MOCK_GUID3', escaped='"quoted" \\\\ ]}', ok=True),
+            ],
+        )
+        text = json.dumps(page, indent=2, ensure_ascii=False)
+        for chunk_size in [1, 2, 3, 7, 1024]:
+            items, meta = self.iter_items(text, chunk_size=chunk_size)
+            self.assertEqual(items, page['items'])
+            self.assertEqual(meta, dict(offset=1234, limit=10))
+
+    def test_fields_after_items(self):
+        text = '{"items": [{"guid": "1"}], "limit": 20, "offset": 40}'
+        items, meta = self.iter_items(text)
+        self.assertEqual(items, [dict(guid='1')])
+        self.assertEqual(meta, dict(offset=40, limit=20))
+
+    def test_empty(self):
+        items, meta = self.iter_items('{"offset": 0, "limit": 10, "items": []}')
+        self.assertEqual(items, [])
+        self.assertEqual(meta, dict(offset=0, limit=10))
+        items, meta = self.iter_items('{}')
+        self.assertEqual(items, [])
+        self.assertEqual(meta, {})
+
+    def test_yield_before_end(self):
+        from billy_client.streaming import iter_page_items
+
+        def chunks():
+            yield b'{"items": [{"guid": "1"}, '
+            raise AssertionError('Read too much')
+        items = iter_page_items(chunks(), {})
+        self.assertEqual(next(items), dict(guid='1'))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            self.iter_items('{"items": [{"guid": "1"} {"guid": "2"}]}')
+        with self.assertRaises(ValueError):
+            self.iter_items('{"items": [{"guid": "1"}')
+        with self.assertRaises(ValueError):
+            self.iter_items('[]')